@@ -22,14 +22,15 @@ import json
 import re
 
 from database.manager import DatabaseManager
-from utils.cache import CacheManager
+from database.schema_tools import SchemaTools
+from utils.exceptions import QueryValidationError
 from utils.logger import logger
 from llm.client import LLMClient
 from llm.templateprompt import SQL_PREFIX, SQL_SUFFIX, FORMAT_INSTRUCTIONS
 
 # 初始化依赖组件
-data_cache = CacheManager()
 db_manager = DatabaseManager()
+schema_tools = SchemaTools(db_manager)
 
 class DBQueryAgent:
     """数据库查询代理，将自然语言转换为SQL查询"""
@@ -59,11 +60,7 @@ class DBQueryAgent:
     @tool
     def get_all_tables(self, input: str = "") -> dict:
         """获取数据库中的所有表格及其描述。"""
-        if data_cache.exists("all_tables"):
-            all_tables = data_cache.get("all_tables")
-        else:
-            all_tables = db_manager.get_all_tables()
-            data_cache.set("all_tables", all_tables)
+        all_tables = schema_tools.get_all_tables()
         logger.info("Retrieved all available tables: %s", all_tables)
         return all_tables
 
@@ -72,24 +69,23 @@ class DBQueryAgent:
         """获取指定表格的结构和示例数据。"""
         logger.info("Fetching structure for tables: %s", table_names)
         tables = [table.strip() for table in table_names.split(",")]
-        results = {}
-        for table in tables:
-            if data_cache.exists(table):
-                table_info = data_cache.get(table)
-            else:
-                table_info = db_manager.get_table_info(table)
-                data_cache.set(table, table_info)
+        results = schema_tools.get_tables_info(tables)
+        for table in results:
             logger.info("Structure for table %s retrieved", table)
-            results[table] = table_info
         return results
 
     @tool
     def query_database(self, query: str) -> str | Sequence[dict[str, Any]] | Result:
         """执行SQL查询并返回结果。"""
         logger.info("Executing query: %s", query)
-        query_result = db_manager.sql_execute(query)
-        logger.info("Query result retrieved")
-        return query_result
+        try:
+            sql_result = schema_tools.execute_query(query)
+        except QueryValidationError as e:
+            # 执行计划被拒绝时把原因交给模型改写 SQL
+            logger.warning("Query rejected by plan check: %s", str(e))
+            return str(e)
+        logger.info("Query result retrieved in %.3fs (cache_hit=%s)", sql_result.execution_time, sql_result.cache_hit)
+        return sql_result.result
 
     @tool
     def query_checker(self, query: str) -> str:
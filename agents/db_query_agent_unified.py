@@ -27,15 +27,17 @@ from langgraph.graph import Graph, StateGraph
 
 # 项目内部依赖
 from database.manager import DatabaseManager
-from utils.cache import CacheManager
+from database.schema_tools import SchemaTools
+from schemas.models import SQLResult
+from utils.exceptions import QueryValidationError
 from utils.logger import logger
 from utils.qapair import QAPairManager
 from llm.client import LLMClient
 from llm.templateprompt import SQL_PREFIX, SQL_SUFFIX, FORMAT_INSTRUCTIONS
 
 # 初始化基础组件
-data_cache = CacheManager()
 db_manager = DatabaseManager()
+schema_tools = SchemaTools(db_manager)
 
 
 class WorkflowState(TypedDict):
@@ -58,11 +60,7 @@ class DBQueryTools:
     @tool
     def get_all_tables(input: str = "") -> Dict[str, Any]:
         """从数据库中检索所有表及其描述"""
-        if data_cache.exists("all_tables"):
-            all_tables = data_cache.get("all_tables")
-        else:
-            all_tables = db_manager.get_all_tables()
-            data_cache.set("all_tables", all_tables)
+        all_tables = schema_tools.get_all_tables()
         logger.info("检索到所有可用表: %s", all_tables)
         return all_tables
 
@@ -72,25 +70,19 @@ class DBQueryTools:
         """检索指定MySQL表的结构和示例数据"""
         logger.info("获取表结构: %s", table_names)
         tables = [table.strip() for table in table_names.split(",")]
-        results = {}
-        for table in tables:
-            if data_cache.exists(table):
-                table_info = data_cache.get(table)
-            else:
-                table_info = db_manager.get_table_info(table)
-                data_cache.set(table, table_info)
-            logger.info("成功获取表 %s 的结构", table)
-            results[table] = table_info
+        results = schema_tools.get_tables_info(tables)
+        logger.info("成功获取表 %s 的结构", ", ".join(results))
         return results
 
     @staticmethod
     @tool
     def query_database(query: str) -> Union[str, Sequence[Dict[str, Any]], Result]:
         """在数据库上执行SQL查询"""
-        logger.info("执行查询: %s", query)
-        query_result = db_manager.sql_execute(query)
-        logger.info("查询结果已获取")
-        return query_result
+        try:
+            return DBQueryTools.run_query(query).result
+        except QueryValidationError as e:
+            # 执行计划被拒绝时把原因交给模型改写 SQL
+            return str(e)
 
     @staticmethod
     @tool
@@ -101,6 +93,14 @@ class DBQueryTools:
         is_valid, message = SQLValidator().validate(query)
         return f"Valid: {is_valid}, Message: {message}"
 
+    @staticmethod
+    def run_query(query: str) -> SQLResult:
+        """执行查询，执行前做 EXPLAIN 预检，执行计划不符合策略时抛出 QueryValidationError"""
+        logger.info("执行查询: %s", query)
+        sql_result = schema_tools.execute_query(query)
+        logger.info("查询结果已获取，耗时 %.3fs，命中缓存：%s", sql_result.execution_time, sql_result.cache_hit)
+        return sql_result
+
 
 class QuestionSimilaritySearcher:
     """问题相似度搜索器"""
@@ -342,7 +342,13 @@ class WorkflowEngine:
             return {"error": "无有效的SQL语句"}
             
         try:
-            sql_results = self.tools.query_database(sql)
+            try:
+                sql_results = self.tools.run_query(sql).result
+            except QueryValidationError as e:
+                # 执行计划被拒绝时让模型改写一次
+                logger.warning("执行计划检查未通过: %s", str(e))
+                sql = self.rewrite_sql(sql_info, str(e))
+                sql_results = self.tools.run_query(sql).result
             user_question = sql_info.get("original_input", "")
             result = {
                 "original_input": user_question,
@@ -359,6 +365,24 @@ class WorkflowEngine:
                 "sql": sql
             }
     
+    def rewrite_sql(self, sql_info: Dict[str, Any], reason: str) -> str:
+        """根据执行计划检查的结果改写SQL"""
+        table_info = self.tools.get_table_info(",".join(sql_info.get("tables", [])))
+        prompt = (
+            f"下面的 SQL 在执行前的执行计划检查中被拒绝。\n"
+            f"SQL：{sql_info.get('sql', '')}\n"
+            f"原因：{reason}\n"
+            f"用户问题：{sql_info.get('original_input', '')}\n"
+            f"相关的业务表信息如下（注意 DDL 中的 KEY 即可用的索引列）：\n{table_info}\n\n"
+            f"请改写 SQL，使其使用索引列过滤，结果与原问题保持一致。"
+            f"返回JSON：{{'sql': 'SELECT ...'}}"
+        )
+        sql = self.parse_llm_response(self.llm.invoke(prompt)).get("sql", "")
+        if not sql:
+            raise QueryValidationError(reason)
+        logger.info("改写后的SQL: %s", sql)
+        return sql
+
     def summarize_result(self, execution_result: Dict[str, Any]) -> str:
         """总结SQL执行结果"""
         logger.info("开始总结结果")
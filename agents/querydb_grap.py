@@ -5,7 +5,8 @@ from database.manager import DatabaseManager
 from langchain.schema import AIMessage
 from typing import Dict, Any,TypedDict
 from langchain.schema import Document
-from utils.cache import CacheManager
+from database.schema_tools import SchemaTools
+from utils.exceptions import QueryValidationError
 from utils.qapair import QAPairManager
 from llm.client import LLMClient
 from langchain.tools import tool
@@ -15,7 +16,7 @@ import json
 
 # 初始化数据缓存和 LLM
 databasemanager = DatabaseManager()
-data_cache = CacheManager()
+schema_tools = SchemaTools(databasemanager)
 
 # 加载 OpenAI 的嵌入模型
 embeddings = OpenAIEmbeddings()
@@ -30,11 +31,7 @@ llm = LLMClient("deepseek").get_model()
 @tool
 def get_all_tables(input="") -> Dict[str, Any]:
     """从数据库中检索所有表及其描述。"""
-    if data_cache.exists("all_tables"):
-        all_tables = data_cache.get("all_tables")
-    else:
-        all_tables = databasemanager.get_all_tables()
-        data_cache.set("all_tables", all_tables)
+    all_tables = schema_tools.get_all_tables()
     logger.info("Retrieved all available tables: %s", all_tables)
     return all_tables
 
@@ -43,15 +40,9 @@ def get_all_tables(input="") -> Dict[str, Any]:
 def get_table_info(table_names: str) -> Dict[str, Any]:
     """检索指定 MySQL 表的架构和示例数据。"""
     tables = [table.strip() for table in table_names.split(",")]
-    results = {}
-    for table in tables:
-        if data_cache.exists(table):
-            table_info = data_cache.get(table)
-        else:
-            table_info = databasemanager.get_table_info(table)
-            data_cache.set(table, table_info)
+    results = schema_tools.get_tables_info(tables)
+    for table, table_info in results.items():
         logger.info("Structure for table %s retrieved: %s", table, table_info)
-        results[table] = table_info
     return results
 
 
@@ -59,9 +50,15 @@ def get_table_info(table_names: str) -> Dict[str, Any]:
 def query_database(query: str) -> Any:
     """Execute an SQL query on the database."""
     logger.info("Executing query: %s", query)
-    query_result = databasemanager.sql_execute(query)
-    print("Query result: %s", query_result)
-    return query_result
+    try:
+        sql_result = schema_tools.execute_query(query)
+    except QueryValidationError as e:
+        # 执行计划被拒绝时把原因交给模型改写 SQL
+        logger.warning("Query rejected by plan check: %s", str(e))
+        return str(e)
+    logger.info("Query executed in %.3fs (cache_hit=%s)", sql_result.execution_time, sql_result.cache_hit)
+    print("Query result: %s", sql_result.result)
+    return sql_result.result
 
 
 def parse_llm_response(response: Any) -> Dict[str, Any]:
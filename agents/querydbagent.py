@@ -13,24 +13,21 @@ from database.manager import DatabaseManager
 from langchain.tools import tool
 from sqlalchemy import Result
 
-from utils.cache import CacheManager
+from database.schema_tools import SchemaTools
+from utils.exceptions import QueryValidationError
 from llm.client import LLMClient
 from llm.templateprompt import SQL_PREFIX, SQL_SUFFIX, FORMAT_INSTRUCTIONS
 from pprint import pprint as pp
 
 # Initialize Data Cache and LLM
-data_cache = CacheManager()
 llm = LLMClient("tongyi").get_model()
 dbmanager = DatabaseManager()
+schema_tools = SchemaTools(dbmanager)
 
 @tool
 def get_all_tables(input: str = "") -> dict:
     """Retrieve all tables and their descriptions from the database."""
-    if data_cache.exists("all_tables"):
-        all_tables = data_cache.get("all_tables")
-    else:
-        all_tables = dbmanager.get_all_tables()
-        data_cache.set("all_tables", all_tables)
+    all_tables = schema_tools.get_all_tables()
     print("Retrieved all available tables:", all_tables)
     return all_tables
 
@@ -40,15 +37,9 @@ def get_table_info(table_names: str) -> dict:
     """Retrieve the schema and sample data for specified MySQL tables."""
     print("Fetching structure for tables:", table_names)
     tables = [table.strip() for table in table_names.split(",")]
-    results = {}
-    for table in tables:
-        if data_cache.exists(table):
-            table_info = data_cache.get(table)
-        else:
-            table_info = dbmanager.get_table_info(table)
-            data_cache.set(table, table_info)
+    results = schema_tools.get_tables_info(tables)
+    for table, table_info in results.items():
         print(f"Structure for table {table} retrieved:", table_info)
-        results[table] = table_info
     return results
 
 
@@ -56,9 +47,14 @@ def get_table_info(table_names: str) -> dict:
 def query_database(query: str) -> str | Sequence[dict[str, Any]] | Result:
     """Execute an SQL query on the database."""
     print("Executing query:", query)
-    query_result = dbmanager.sql_execute(query)
-    print("Query result:", query_result)
-    return query_result
+    try:
+        sql_result = schema_tools.execute_query(query)
+    except QueryValidationError as e:
+        # 执行计划被拒绝时把原因交给模型改写 SQL
+        print("Query rejected:", e)
+        return str(e)
+    print(f"Query result ({sql_result.execution_time:.3f}s, cache_hit={sql_result.cache_hit}):", sql_result.result)
+    return sql_result.result
 
 
 @tool
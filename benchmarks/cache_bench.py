@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+CacheManager 读写延迟基准
+
+模拟 ads_phs 库约 70 张表全部缓存后的 data/cache.db，
+对比每次读取都反序列化整个文件（旧实现）与内存快照读取的 get 延迟，
+pickle / sqlite 两种后端的 set 延迟，4 张表的逐个读写与批量读写对比，
+以及压缩对完整表结构缓存的文件大小和加载时间的影响。
+
+用法:
+  python -m benchmarks.cache_bench
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import CacheManager
+
+TABLE_COUNT = 70
+DDL_SIZE = 12 * 1024
+
+
+def build_tables(count: int = TABLE_COUNT):
+    """构造与线上相近大小的表结构缓存内容"""
+    tables = {}
+    for i in range(count):
+        name = f"ads_phs_table_{i:02d}"
+        ddl = f"CREATE TABLE `{name}` (\n" + "  `col` varchar(255) COMMENT '字段',\n" * (DDL_SIZE // 40) + ")"
+        tables[name] = f"表名：{name}\n表结构：{ddl}\n示例数据：[]"
+    return tables
+
+
+def legacy_get(cache_file: Path, key: str):
+    """旧实现：每次读取都反序列化整个文件"""
+    with open(cache_file, "rb") as f:
+        cache = pickle.load(f)
+    entry = cache.get(key)
+    if entry and datetime.now() < entry["expiry"]:
+        return entry["value"]
+    return None
+
+
+def timeit(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def lookup_one_by_one(cache: CacheManager, tables, infos):
+    """旧写法：逐表 exists/get，未命中逐表 set"""
+    results = {}
+    for table in tables:
+        if cache.exists(table):
+            results[table] = cache.get(table)
+        else:
+            results[table] = infos[table]
+            cache.set(table, results[table])
+    return results
+
+
+def lookup_batch(cache: CacheManager, tables, infos):
+    """新写法：一次 get_many，未命中一次 set_many"""
+    cached = cache.get_many(tables)
+    fetched = {table: infos[table] for table in tables if table not in cached}
+    cache.set_many(fetched)
+    return {**cached, **fetched}
+
+
+def bench_four_tables(tmp: str, tables, rounds: int = 20):
+    """4 张表查询：冷缓存（全部未命中）与热缓存（文件被其他进程更新后首次读取）"""
+    names = list(tables)[:4]
+    print(f"\n4 表查询 ({', '.join(names)})")
+    for backend in ("pickle", "sqlite"):
+        for label, fn in [("逐个", lookup_one_by_one), ("批量", lookup_batch)]:
+            cache_file = Path(tmp) / f"four_{backend}_{label}.db"
+            cache = CacheManager(cache_file=cache_file, backend=backend)
+            for name, info in list(tables.items())[4:]:
+                cache.set(name, info)
+
+            def cold():
+                for name in names:
+                    cache.delete(name)
+                start = time.perf_counter()
+                fn(cache, names, tables)
+                return time.perf_counter() - start
+
+            def warm():
+                cache.invalidate()
+                start = time.perf_counter()
+                fn(cache, names, tables)
+                return time.perf_counter() - start
+
+            cold_us = sum(cold() for _ in range(rounds)) / rounds * 1e6
+            warm_us = sum(warm() for _ in range(rounds)) / rounds * 1e6
+            print(f"{backend:<7}{label}  冷缓存 {cold_us:10.1f} us   热缓存 {warm_us:10.1f} us")
+
+
+def real_tables(count: int = TABLE_COUNT):
+    """
+    优先使用本地 data/cache.db 中真实的表结构和示例数据（循环补足 count 张表），
+    不存在时退回合成数据
+    """
+    legacy = Path("data/cache.db")
+    if legacy.exists():
+        with open(legacy, "rb") as f:
+            infos = [entry["value"] for key, entry in pickle.load(f).items()
+                     if isinstance(entry["value"], str) and entry["value"].startswith("表名：")]
+        if infos:
+            tables = {}
+            for i in range(count):
+                name = f"ads_phs_table_{i:02d}"
+                # 替换首行表名，保证每张表的值是不同的对象，避免 pickle 复用相同字符串
+                tables[name] = f"表名：{name}\n" + infos[i % len(infos)].split("\n", 1)[1]
+            return tables
+    return build_tables(count)
+
+
+def bench_compression(tmp: str, rounds: int = 20):
+    """完整 schema 缓存下，压缩前后的文件大小、整文件加载时间和单表首次读取时间"""
+    tables = real_tables()
+    print(f"\n压缩对比（{len(tables)} 张表，原始文本 {sum(len(v.encode()) for v in tables.values()) / 1024:.1f} KB）")
+    for backend in ("pickle", "sqlite"):
+        for threshold in (None, 4096):
+            cache_file = Path(tmp) / f"compress_{backend}_{threshold}.db"
+            cache = CacheManager(cache_file=cache_file, backend=backend, compress_threshold=threshold)
+            cache.set_many(tables)
+            cache.set("all_tables", [(name, "注释") for name in tables])
+            if backend == "sqlite":
+                cache.backend._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = cache_file.stat().st_size
+            key = next(iter(tables))
+
+            def load_all():
+                cache.invalidate()
+                start = time.perf_counter()
+                if backend == "pickle":
+                    cache.get("all_tables")
+                else:
+                    cache.get_many(tables)
+                return time.perf_counter() - start
+
+            def first_get():
+                cache.invalidate()
+                cache.get("all_tables")
+                start = time.perf_counter()
+                cache.get(key)
+                return time.perf_counter() - start
+
+            load_us = sum(load_all() for _ in range(rounds)) / rounds * 1e6
+            first_us = sum(first_get() for _ in range(rounds)) / rounds * 1e6
+            label = "压缩" if threshold else "不压缩"
+            print(f"{backend:<7}{label:<4} 文件 {size / 1024:8.1f} KB   全量加载 {load_us:9.1f} us   "
+                  f"单表首次读取 {first_us:8.1f} us")
+
+
+def main(rounds: int = 200):
+    tables = build_tables()
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = Path(tmp) / "cache.db"
+        expiry = datetime.now() + timedelta(days=30)
+        data = {name: {"value": info, "expiry": expiry} for name, info in tables.items()}
+        data["all_tables"] = {"value": [(name, "注释") for name in tables], "expiry": expiry}
+        with open(cache_file, "wb") as f:
+            pickle.dump(data, f)
+
+        cache = CacheManager(cache_file=cache_file, backend="pickle")
+        key = next(iter(tables))
+        print(f"缓存文件大小: {cache_file.stat().st_size / 1024:.1f} KB, 表数量: {len(tables)}")
+        for label, fn in [
+            ("旧实现 get(all_tables)", lambda: legacy_get(cache_file, "all_tables")),
+            ("旧实现 exists+get(table)", lambda: (legacy_get(cache_file, key), legacy_get(cache_file, key))),
+            ("快照 get(all_tables)", lambda: cache.get("all_tables")),
+            ("快照 exists+get(table)", lambda: (cache.exists(key), cache.get(key))),
+        ]:
+            print(f"{label:<28} {timeit(fn, rounds):10.1f} us/op")
+
+        sqlite_cache = CacheManager(cache_file=Path(tmp) / "cache.sqlite3", backend="sqlite")
+        for name, info in tables.items():
+            sqlite_cache.set(name, info)
+        sqlite_cache.set("all_tables", data["all_tables"]["value"])
+        value = tables[key]
+        for label, fn in [
+            ("pickle set(table)", lambda: cache.set(key, value)),
+            ("sqlite set(table)", lambda: sqlite_cache.set(key, value)),
+            ("sqlite get(all_tables)", lambda: sqlite_cache.get("all_tables")),
+            ("sqlite exists+get(table)", lambda: (sqlite_cache.exists(key), sqlite_cache.get(key))),
+        ]:
+            print(f"{label:<28} {timeit(fn, rounds // 4):10.1f} us/op")
+
+        bench_four_tables(tmp, tables)
+        bench_compression(tmp)
+
+
+if __name__ == "__main__":
+    main()
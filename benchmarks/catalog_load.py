@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+DatabaseManager 压测
+
+在本地启动 database.fake_catalog，模拟多个用户同时提问：每个问题依次获取表列表、
+相关表的结构和示例数据、EXPLAIN 预检并执行 SQL（热门问题的 SQL 相同）。
+输出每个问题的耗时分位数、吞吐、实际发出的请求数，以及进程内限流器的排队情况。
+
+用法:
+  python -m benchmarks.catalog_load [--users 16] [--questions 10] [--latency 0.02] [--max-concurrency 8]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.fake_catalog import FakeCatalog, FakeCatalogServer
+from database.limiter import get_limiter
+from database.manager import DatabaseConfig, DatabaseManager
+
+# (相关表, SQL)；前两个是热门问题
+QUESTIONS = [
+    (["ads_phs_drug", "ads_phs_target"],
+     "SELECT d.drug_name_en, d.global_highest_dev_status FROM ads_phs_drug d "
+     "WHERE d.global_highest_dev_status = 'Approved' LIMIT 20"),
+    (["ads_phs_ct"], "SELECT phase, count(*) AS trials FROM ads_phs_ct GROUP BY phase"),
+    (["ads_phs_org"], "SELECT org_name, country FROM ads_phs_org WHERE country = '{country}' LIMIT 20"),
+    (["ads_phs_dmp_drug", "ads_phs_drug"],
+     "SELECT m.drug_name_en, m.highest_dev_status FROM ads_phs_dmp_drug m WHERE m.drug_id = '{drug_id}'"),
+    (["ads_phs_patent_extension"],
+     "SELECT extension_type, count(*) AS n FROM ads_phs_patent_extension "
+     "WHERE authority_country = '{country}' GROUP BY extension_type"),
+]
+HOT_RATIO = 0.5
+
+
+def ask(dbm: DatabaseManager, rng: random.Random, drug_ids, use_cache: bool) -> None:
+    """一个问题对数据目录的全部访问"""
+    tables, sql = QUESTIONS[rng.randrange(2)] if rng.random() < HOT_RATIO else rng.choice(QUESTIONS)
+    sql = sql.format(country=rng.choice(["US", "CN", "JP", "DE"]), drug_id=rng.choice(drug_ids))
+    dbm.get_all_tables()
+    dbm.get_tables_info(tables)
+    dbm.explain(sql)
+    dbm.execute_query(sql, use_cache=use_cache)
+
+
+def run(base_url: str, users: int, questions: int, use_cache: bool, seed: int = 0):
+    dbm = DatabaseManager(DatabaseConfig(base_url=base_url))
+    drug_ids = [row["drug_id"] for row in dbm.sql_execute("select drug_id from ads_phs_drug")]
+    latencies, lock = [], threading.Lock()
+    before = dbm.metrics
+
+    def user(index: int) -> None:
+        rng = random.Random(seed + index)
+        for _ in range(questions):
+            start = time.perf_counter()
+            ask(dbm, rng, drug_ids, use_cache)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = dbm.metrics
+    return elapsed, sorted(latencies), {name: after[name] - before[name] for name in after}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DatabaseManager 压测（离线 data.catalog）")
+    parser.add_argument("--users", type=int, default=16, help="并发用户数")
+    parser.add_argument("--questions", type=int, default=10, help="每个用户的问题数")
+    parser.add_argument("--rows", type=int, default=500, help="合成表的基准行数")
+    parser.add_argument("--latency", type=float, default=0.02, help="接口每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--max-concurrency", type=int, default=8, help="进程内同时在途的请求数上限")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeCatalogServer(FakeCatalog(rows=args.rows), latency=args.latency, jitter=args.jitter) as server:
+        # 使用临时缓存，避免读写本地缓存
+        os.environ["CATALOG_DATA_DIR"] = tmp
+        limiter = get_limiter(args.max_concurrency)
+        print(f"{args.users} 个用户 × {args.questions} 个问题，接口延迟 {args.latency * 1000:.0f}ms，"
+              f"并发上限 {limiter.limit}")
+        for label, use_cache in [("不使用结果缓存", False), ("使用结果缓存", True)]:
+            elapsed, latencies, metrics = run(server.base_url, args.users, args.questions, use_cache)
+            total = len(latencies)
+            p95 = latencies[min(total - 1, int(total * 0.95))]
+            print(f"\n{label}")
+            print(f"  总耗时 {elapsed:6.2f} s   吞吐 {total / elapsed:6.1f} 问题/s")
+            print(f"  每个问题 p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+            print(f"  请求数 {metrics['requests']}   实际执行 SQL {metrics['sql_executions']}   "
+                  f"合并 {metrics['coalesced']}")
+        stats = limiter.stats()
+        print(f"\n限流器：获得名额 {stats['acquired']} 次，排队 {stats['waited']} 次，最长队列 {stats['max_queued']}，"
+              f"排队 p50 {stats['wait']['p50_ms']} ms / p99 {stats['wait']['p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+DatabaseManager 基准
+
+在本地启动一个模拟 data.catalog 接口的 HTTP 服务：
+- 顺序执行 50 次 sql_execute，对比每次请求新建连接（旧实现：模块级 requests.post）与连接池会话的耗时和连接数
+- 每个 SQL 请求模拟 20ms 服务端耗时，对比逐表 get_table_info 与批量 get_tables_info 获取 4 张表的耗时
+- 同样的延迟下，对比逐表获取与 describe_tables（information_schema）生成全部 70 张表描述的耗时
+
+用法:
+  python -m benchmarks.database_bench
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.manager import DatabaseConfig, DatabaseManager
+
+ROWS = [{"drug_id": f"d{i}", "drug_name": f"药物{i}"} for i in range(5)]
+TABLES = [f"ads_phs_table_{i:02d}" for i in range(70)]
+INFORMATION_SCHEMA = {
+    "TABLES": [{"table_name": t, "table_comment": f"表{t}", "engine": "InnoDB"} for t in TABLES],
+    "COLUMNS": [{"table_name": t, "column_name": c, "column_type": "varchar(64)", "is_nullable": "YES",
+                 "column_comment": f"字段{c}"} for t in TABLES for c in ("drug_id", "drug_name")],
+    "STATISTICS": [{"table_name": t, "index_name": "PRIMARY", "non_unique": 0, "column_name": "drug_id"}
+                   for t in TABLES],
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """最小化的 catalog 接口实现：登录和 SQL 查询"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = set()
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        StubHandler.connections.add(self.client_address)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.endswith("/auth/login"):
+            self._reply({"body": {"token": "stub-token"}})
+            return
+        time.sleep(StubHandler.latency)
+        sql = json.loads(body)["sql"]
+        view = next((view for view in INFORMATION_SCHEMA if f"information_schema.{view}" in sql), None)
+        if view:
+            self._reply({"body": {"rows": INFORMATION_SCHEMA[view]}})
+        elif sql.startswith("show create table"):
+            self._reply({"body": {"rows": [{"Create Table": f"CREATE TABLE {sql.split()[-1]} (...)"}]}})
+        else:
+            self._reply({"body": {"rows": ROWS}})
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_sql_execute(dbm: DatabaseManager, sql: str):
+    """旧实现：模块级 requests.post，每次请求新建连接"""
+    payload = {"sql": sql, "db_name": dbm.config.phs_ads_db, "source_id": dbm.config.source_id, "export": False}
+    result = requests.post(url=f"{dbm.config.base_url}/query/jdbc", json=payload,
+                           headers=dbm._get_auth_headers()).json()
+    return result["body"].get("rows", []) if result else []
+
+
+def bench_sql_execute(base_url: str, calls: int = 50):
+    dbm = DatabaseManager(DatabaseConfig(base_url=base_url))
+    dbm.sql_execute("select 1")  # 预热：登录并建立连接
+    print(f"顺序执行 {calls} 次 sql_execute")
+    for label, fn in [("每次新建连接", lambda: legacy_sql_execute(dbm, "select * from ads_phs_drug limit 5")),
+                      ("连接池会话", lambda: dbm.sql_execute("select * from ads_phs_drug limit 5"))]:
+        StubHandler.connections.clear()
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10} 总耗时 {elapsed * 1000:8.1f} ms   平均 {elapsed / calls * 1000:6.2f} ms/次   "
+              f"连接数 {len(StubHandler.connections)}")
+
+
+def bench_tables_info(base_url: str, tables=("ads_phs_drug", "ads_phs_target", "ads_phs_disease", "ads_phs_company"),
+                      latency: float = 0.02):
+    dbm = DatabaseManager(DatabaseConfig(base_url=base_url))
+    dbm.sql_execute("select 1")
+    StubHandler.latency = latency
+    print(f"\n获取 {len(tables)} 张表的结构和示例数据（每个请求 {latency * 1000:.0f}ms）")
+    start = time.perf_counter()
+    sequential = {table: dbm.get_table_info(table) for table in tables}
+    elapsed_seq = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = dbm.get_tables_info(list(tables))
+    elapsed_batch = time.perf_counter() - start
+    StubHandler.latency = 0.0
+    assert batch == sequential
+    print(f"{'逐表顺序':<10} {elapsed_seq * 1000:8.1f} ms")
+    print(f"{'批量并发':<10} {elapsed_batch * 1000:8.1f} ms")
+
+
+def bench_describe_tables(base_url: str, latency: float = 0.02):
+    dbm = DatabaseManager(DatabaseConfig(base_url=base_url))
+    dbm.sql_execute("select 1")
+    StubHandler.latency = latency
+    print(f"\n生成全部 {len(TABLES)} 张表的描述（每个请求 {latency * 1000:.0f}ms）")
+    for label, fn in [("逐表顺序", lambda: [dbm.get_table_info(table) for table in TABLES]),
+                      ("information_schema", lambda: dbm.describe_tables()),
+                      ("仅表结构", lambda: dbm.describe_tables(limit=0))]:
+        before = dbm.metrics["requests"]
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<18} {elapsed * 1000:8.1f} ms   请求数 {dbm.metrics['requests'] - before}")
+    StubHandler.latency = 0.0
+
+
+def main():
+    server = start_stub()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 使用临时缓存，避免读写本地真实缓存
+        os.environ["CATALOG_DATA_DIR"] = tmp
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/api/catalog"
+        bench_sql_execute(base_url)
+        bench_tables_info(base_url)
+        bench_describe_tables(base_url)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+示例数据压缩基准
+
+对每张 ads_phs 表，比较原始示例行（Python repr，旧的 format_table_info 输出）与
+compact_samples 压缩后的表描述所占的 token 数。
+
+示例数据来源：
+- 默认：本地表结构目录（python -m database.catalog refresh 生成，包含库中的全部表）
+- --live：从 data.catalog 刷新一个临时目录（需要 data.catalog 账号）
+- --fake：从 database.fake_catalog 的合成数据刷新一个临时目录，不需要网络
+
+三种来源都经由 SchemaCatalog 读取，覆盖目录中全部 ads_phs 表，而不只是缓存过的表。
+token 数使用 tiktoken 的 cl100k_base 编码；未安装 tiktoken 时按 UTF-8 字节数 / 4 估算。
+
+用法:
+  python -m benchmarks.prompt_bench [--live | --fake] [--limit 2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.catalog import CATALOG_FILE, SchemaCatalog
+from database.manager import DatabaseConfig, DatabaseManager, format_table_info
+
+SAMPLE_MARK = "\n示例数据："
+
+
+def token_counter() -> Tuple[Callable[[str], int], str]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text)), "cl100k_base"
+    except Exception:  # 未安装或无法下载编码文件
+        return lambda text: (len(text.encode("utf-8")) + 3) // 4, "UTF-8 字节数 / 4 估算"
+
+
+def load_catalog(catalog: SchemaCatalog) -> Dict[str, Tuple[str, List[Dict]]]:
+    """目录中全部 ads_phs 表的 DDL 和示例数据"""
+    return {name: entry for name, entry in catalog.get_ddl_and_samples().items() if name.startswith("ads_phs")}
+
+
+def load_refreshed(config: DatabaseConfig, limit: int) -> Dict[str, Tuple[str, List[Dict]]]:
+    """从接口全量刷新一个临时目录后读取，不改动本地的目录和缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CATALOG_DATA_DIR"] = tmp
+        catalog = SchemaCatalog(Path(tmp) / "schema_catalog.sqlite3")
+        try:
+            catalog.refresh(DatabaseManager(config), limit=limit, full=True)
+            return load_catalog(catalog)
+        finally:
+            catalog.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="示例数据压缩前后的提示词 token 数")
+    source_group = parser.add_mutually_exclusive_group()
+    source_group.add_argument("--live", action="store_true", help="从 data.catalog 获取全部表")
+    source_group.add_argument("--fake", action="store_true", help="使用 database.fake_catalog 的合成数据")
+    parser.add_argument("--limit", type=int, default=2, help="每张表的示例行数（--live/--fake）")
+    args = parser.parse_args(argv)
+
+    if args.live:
+        tables, source = load_refreshed(DatabaseConfig(), args.limit), "data.catalog"
+    elif args.fake:
+        from database.fake_catalog import FakeCatalog, FakeCatalogServer
+
+        with FakeCatalogServer(FakeCatalog()) as server:
+            tables, source = load_refreshed(DatabaseConfig(base_url=server.base_url), args.limit), server.base_url
+    elif CATALOG_FILE.exists():
+        catalog = SchemaCatalog(CATALOG_FILE)
+        tables, source = load_catalog(catalog), str(CATALOG_FILE)
+        catalog.close()
+    else:
+        tables = {}
+    if not tables:
+        print("没有可用的示例数据，请先运行 python -m database.catalog refresh，或使用 --live / --fake")
+        return
+    count, method = token_counter()
+    print(f"来源：{source}，{len(tables)} 张表，token 计数：{method}")
+    print(f"{'表名':<36}{'原始':>8}{'压缩后':>8}{'减少':>8}   示例数据 原始 -> 压缩后")
+    totals = [0, 0, 0, 0]
+    for name, (ddl, rows) in sorted(tables.items()):
+        before = f"表名：{name}\n表结构：{ddl}{SAMPLE_MARK}{rows}"
+        after = format_table_info(name, ddl, rows)
+        sample_before = count(before.split(SAMPLE_MARK, 1)[1])
+        sample_after = count(after.split(SAMPLE_MARK, 1)[1])
+        before, after = count(before), count(after)
+        for i, n in enumerate((before, after, sample_before, sample_after)):
+            totals[i] += n
+        print(f"{name:<36}{before:>8}{after:>8}{1 - after / before:>8.1%}   {sample_before:>6} -> {sample_after}")
+    before, after, sample_before, sample_after = totals
+    print(f"{'合计':<36}{before:>8}{after:>8}{1 - after / before:>8.1%}   {sample_before:>6} -> {sample_after}"
+          f"（示例数据减少 {1 - sample_after / sample_before:.1%}）")
+
+
+if __name__ == "__main__":
+    main()
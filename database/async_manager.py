@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+DatabaseManager 的 asyncio 版本
+
+基于 httpx.AsyncClient 的连接池，单个事件循环内即可并发发起表结构查询和 SQL 执行，
+不需要为每个请求占用一个线程。token 与同一接口地址和用户的同步版本共用（见 get_token_provider）。
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional
+
+import httpx
+
+from database.columnar import ColumnBuilder, ColumnarResult
+from database.explain import PlanPolicy, build_plan
+from database.fingerprint import is_read_only_sql
+from database.limiter import PRIORITY_HIGH
+from database.manager import (RETRY_STATUS, CatalogClientBase, DatabaseConfig, format_table_info,
+                              parse_table_list, sql_flights)
+from database.paging import keyset_page_sql, offset_page_sql
+from database.schema import build_snapshot, render_ddl, snapshot_queries
+from schemas.models import QueryPlan, SQLResult, TableSchema
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseManager(CatalogClientBase):
+    """
+    异步数据库工具类，接口与 DatabaseManager 一致，方法均为协程
+
+    用法：
+        async with AsyncDatabaseManager() as dbm:
+            infos = await asyncio.gather(*(dbm.get_table_info(t) for t in tables))
+    """
+
+    def __init__(self, config: Optional[DatabaseConfig] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__(config)
+        self._client = self._create_client(transport)
+        self._token_lock: Optional[asyncio.Lock] = None
+        if self.config.token_refresh:
+            self.token_provider.start(self._blocking_login, timedelta(hours=self.config.token_ttl_hours))
+
+    def _create_client(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+        """创建带连接池的异步客户端，所有请求复用长连接"""
+        return httpx.AsyncClient(
+            base_url=self.config.base_url,
+            headers=self._headers,
+            verify=self.config.verify_ssl,
+            timeout=httpx.Timeout(self.config.request_timeout, connect=self.config.connect_timeout),
+            limits=httpx.Limits(max_connections=self.config.pool_maxsize,
+                                max_keepalive_connections=self.config.pool_maxsize),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncDatabaseManager":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        await self._client.aclose()
+
+    async def _valid_token(self) -> str:
+        """获取内存中的有效token，通常已由后台提前刷新；没有时登录"""
+        token = self.token_provider.peek()
+        if not token:
+            token = await self._refresh_token()
+        return token
+
+    async def _refresh_token(self, rejected: Optional[str] = None) -> str:
+        """
+        登录获取新的访问令牌
+
+        与同步版本和后台刷新线程共用 token_provider 的登录锁，进程内同一时间只有一个登录；
+        读写 auth 缓存在线程池中执行，不阻塞事件循环。
+        :param rejected: 被服务端拒绝的 token；内存中已是其他 token 时说明别的协程刷新过了
+        """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+
+        def login() -> str:
+            # 持有登录锁的线程把登录请求交回事件循环，复用连接池和重试
+            return asyncio.run_coroutine_threadsafe(self._login(), loop).result()
+
+        # 并发的协程只占用一个线程等待登录锁
+        async with self._token_lock:
+            if rejected is not None:
+                await asyncio.to_thread(self.token_provider.invalidate, rejected)
+            return await asyncio.to_thread(self.token_provider.get, login)
+
+    async def _login(self) -> str:
+        """登录获取新的访问令牌"""
+        try:
+            response = await self._send('POST', '/auth/login', idempotent=True, priority=PRIORITY_HIGH,
+                                        content=self._login_payload())
+            response.raise_for_status()
+            token = response.json()['body']['token']
+            logger.info("Token refreshed successfully")
+            return token
+        except httpx.HTTPError as e:
+            logger.error(f"Token refresh failed: {str(e)}")
+            raise
+
+    def _blocking_login(self) -> str:
+        """供后台刷新线程使用的同步登录，不依赖事件循环"""
+        with httpx.Client(base_url=self.config.base_url, headers=self._headers, verify=self.config.verify_ssl,
+                          timeout=httpx.Timeout(self.config.request_timeout, connect=self.config.connect_timeout)) as client, \
+                self.limiter.slot(PRIORITY_HIGH, self.config.queue_timeout):
+            response = client.post('/auth/login', content=self._login_payload())
+            response.raise_for_status()
+            return response.json()['body']['token']
+
+    async def _send(self, method: str, path: str, idempotent: bool, priority: Optional[int] = None,
+                    **kwargs) -> httpx.Response:
+        """
+        发送请求，幂等请求在网络错误、超时和 429/5xx 时按退避策略重试
+
+        与同步版本共用进程内的限流器，每次尝试前先获取名额。
+        :return: 最后一次的响应（未检查状态码）
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter.aslot(priority, self.config.queue_timeout):
+                    self._count('requests')
+                    response = await self._client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= self.config.max_retries:
+                    self._count('errors')
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Request {method} {path} failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUS or not idempotent or attempt >= self.config.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning(f"Request {method} {path} returned {response.status_code}, "
+                               f"retry {attempt + 1} in {delay:.2f}s")
+            self._count('retries')
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _request(self, method: str, path: str, idempotent: bool = True, priority: Optional[int] = None,
+                       **kwargs) -> Any:
+        """
+        发送带认证的请求，token 失效（401）时重新登录并重放一次
+        :return: 解析后的 JSON 响应
+        """
+        token = await self._valid_token()
+        response = await self._send(method, path, idempotent, priority,
+                                    headers={'X-Authorization': f'Bearer {token}'}, **kwargs)
+        if response.status_code == 401:
+            logger.info("Token rejected, logging in again")
+            self._count('reauth')
+            token = await self._refresh_token(rejected=token)
+            response = await self._send(method, path, idempotent, priority,
+                                        headers={'X-Authorization': f'Bearer {token}'}, **kwargs)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            self._count('errors')
+            raise
+        return response.json()
+
+    async def get_all_tables(self) -> List:
+        """
+        获取所有表
+        :return: [(表名, 注释)]
+        """
+        params = {
+            'dbName': self.config.phs_ads_db,
+            'sourceId': self.config.source_id
+        }
+        response = await self._request('GET', '/query/jdbc/table/list', params=params)
+        return parse_table_list(response)
+
+    async def sql_execute(self, sql: str) -> List[Dict]:
+        """
+        执行sql语句，与同步版本共用在途查询表，相同的只读语句并发执行时只发出一次请求
+        :return: 结果行
+        """
+        key = self._result_key(sql)
+        if key is None:
+            return await self._sql_request(sql)
+        leader = []
+
+        async def run():
+            leader.append(True)
+            self._count('sql_executions')
+            return await self._sql_request(sql)
+
+        rows = await sql_flights.ado(key, run)
+        return self._copy_rows(rows) if leader else self._coalesced(rows)
+
+    async def _sql_request(self, sql: str) -> List[Dict]:
+        result = await self._request('POST', '/query/jdbc', idempotent=is_read_only_sql(sql),
+                                     json=self._sql_payload(sql))
+        return result['body'].get('rows', []) if result else []
+
+    async def iter_pages(self, sql: str, page_size: int = 1000,
+                         key: Optional[str] = None) -> AsyncIterator[List[Dict]]:
+        """
+        分页执行查询，逐页返回结果，见 DatabaseManager.iter_pages
+        """
+        after, offset = None, 0
+        while True:
+            if key is None:
+                rows = await self.sql_execute(offset_page_sql(sql, page_size, offset))
+            else:
+                rows = await self.sql_execute(keyset_page_sql(sql, key, page_size, after))
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            offset += len(rows)
+            after = rows[-1][key] if key is not None else None
+
+    async def iter_rows(self, sql: str, page_size: int = 1000, key: Optional[str] = None) -> AsyncIterator[Dict]:
+        """分页执行查询并逐行返回结果"""
+        async for rows in self.iter_pages(sql, page_size, key):
+            for row in rows:
+                yield row
+
+    async def execute_columnar(self, sql: str, page_size: Optional[int] = None, key: Optional[str] = None,
+                               dtypes: Optional[Dict[str, str]] = None) -> ColumnarResult:
+        """
+        执行查询并返回列式结果，见 DatabaseManager.execute_columnar
+        """
+        if page_size is None:
+            return ColumnarResult.from_rows(await self.sql_execute(sql), dtypes)
+        builder = ColumnBuilder(dtypes)
+        async for rows in self.iter_pages(sql, page_size, key):
+            builder.extend(rows)
+        return builder.build()
+
+    async def explain(self, sql: str) -> QueryPlan:
+        """
+        EXPLAIN 查询语句，见 DatabaseManager.explain
+        """
+        start = time.perf_counter()
+        rows = await self.sql_execute("EXPLAIN " + sql.strip().rstrip(";"))
+        return build_plan(sql, rows, time.perf_counter() - start)
+
+    async def check_plan(self, sql: str, policy: PlanPolicy) -> Optional[QueryPlan]:
+        """
+        EXPLAIN 预检，见 DatabaseManager.check_plan
+        """
+        try:
+            plan = await self.explain(sql)
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed, skipping plan check: {e}")
+            return None
+        logger.info(f"Plan: indexes {plan.indexes_used}, estimated rows {plan.estimated_rows}, "
+                    f"full scans {plan.full_scans}")
+        return policy.check(plan)
+
+    async def execute_query(self, sql: str, use_cache: bool = True,
+                            plan_policy: Optional[PlanPolicy] = None) -> SQLResult:
+        """
+        执行查询并缓存结果，见 DatabaseManager.execute_query
+
+        读写结果缓存（SQLite）在线程池中进行，不阻塞事件循环。
+        """
+        start = time.perf_counter()
+        key = self._result_key(sql)
+        if key is not None and use_cache:
+            rows = await asyncio.to_thread(self.result_cache.get, key)
+            if rows is not None:
+                return SQLResult(sql=sql, result=self._copy_rows(rows), execution_time=time.perf_counter() - start,
+                                 cache_hit=True)
+        if plan_policy is not None:
+            await self.check_plan(sql, plan_policy)
+        rows = await self.sql_execute(sql)
+        if key is not None:
+            await asyncio.to_thread(self.result_cache.set, key, self._copy_rows(rows), ttl=self.config.result_cache_ttl)
+        return SQLResult(sql=sql, result=rows, execution_time=time.perf_counter() - start)
+
+    async def get_table_ddl(self, table_name: str) -> str:
+        query_table = await self.sql_execute(f"show create table {table_name}")
+        return query_table[0]['Create Table']
+
+    async def get_sample_table(self, table_name: str, limit: int = 2) -> List[Dict]:
+        return await self.sql_execute(f"select * from {table_name} limit {limit}")
+
+    async def get_table_info(self, table_name: str, limit: int = 2) -> str:
+        """
+        根据表名获取表的结构及示例数据，两个查询并发执行
+        :return: 与 DatabaseManager.get_table_info 相同格式的描述
+        """
+        table_ddl, table_data = await asyncio.gather(self.get_table_ddl(table_name),
+                                                     self.get_sample_table(table_name, limit))
+        return format_table_info(table_name, table_ddl, table_data)
+
+    async def get_tables_info(self, table_names: List[str], limit: int = 2,
+                              max_concurrency: Optional[int] = None) -> Dict[str, str]:
+        """
+        批量获取多张表的结构及示例数据，同时进行的请求数不超过 max_concurrency（默认 config.fetch_concurrency）
+        :return: {表名: 与 get_table_info 相同格式的描述}，按传入顺序
+        """
+        tables = list(dict.fromkeys(table_names))
+        results = await self._gather_bounded(
+            [self.get_table_ddl(table) for table in tables] + [self.get_sample_table(table, limit) for table in tables],
+            max_concurrency)
+        ddls, samples = results[:len(tables)], results[len(tables):]
+        return {table: format_table_info(table, ddl, data) for table, ddl, data in zip(tables, ddls, samples)}
+
+    async def _gather_bounded(self, coros: List[Awaitable], max_concurrency: Optional[int] = None) -> List:
+        """并发执行，同时进行的请求数不超过 max_concurrency（默认 config.fetch_concurrency）"""
+        semaphore = asyncio.Semaphore(max_concurrency or self.config.fetch_concurrency)
+
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(bounded(coro) for coro in coros))
+
+    async def get_schema_snapshot(self, table_names: Optional[List[str]] = None) -> Dict[str, TableSchema]:
+        """
+        通过 information_schema 获取表、字段和索引信息，三条查询并发执行
+        :return: {表名: TableSchema}
+        """
+        queries = snapshot_queries(self.config.phs_ads_db, table_names)
+        return build_snapshot(*await asyncio.gather(*(self.sql_execute(sql) for sql in queries)))
+
+    async def describe_tables(self, table_names: Optional[List[str]] = None, limit: int = 2) -> Dict[str, str]:
+        """
+        批量生成表描述，见 DatabaseManager.describe_tables
+        """
+        snapshot = await self.get_schema_snapshot(table_names)
+        tables = [table for table in (table_names or snapshot) if table in snapshot]
+        samples = await self.get_samples(tables, limit) if limit else {}
+        return {table: format_table_info(table, render_ddl(snapshot[table]), samples.get(table, []))
+                for table in tables}
+
+    async def get_samples(self, table_names: List[str], limit: int = 2) -> Dict[str, List[Dict]]:
+        """
+        并发获取多张表的示例数据
+        :return: {表名: 示例数据}，按传入顺序
+        """
+        tables = list(dict.fromkeys(table_names))
+        samples = await self._gather_bounded([self.get_sample_table(table, limit) for table in tables])
+        return dict(zip(tables, samples))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+本地表结构目录
+
+把每张表的 DDL、字段/索引信息和示例数据保存在本地 SQLite 文件中，agent 查询表结构时
+直接读取，不需要访问 data.catalog 接口。刷新时先查询 information_schema.TABLES，
+只有新增、创建时间或更新时间变化的表才重新获取结构和示例数据。
+
+用法:
+  python -m database.catalog refresh            # 增量刷新
+  python -m database.catalog refresh --full     # 全部重新获取
+  python -m database.catalog list
+  python -m database.catalog show ads_phs_drug
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from database.manager import DatabaseManager, format_table_info
+from database.schema import build_snapshot, render_ddl, snapshot_queries
+from schemas.models import TableSchema
+from utils.cache import catalog_data_dir
+
+logger = logging.getLogger(__name__)
+
+def catalog_file(base_url: Optional[str] = None) -> Path:
+    """数据目录接口对应的目录文件，与缓存一样按接口地址区分（见 catalog_data_dir）"""
+    return catalog_data_dir(base_url) / "schema_catalog.sqlite3"
+
+
+# CATALOG_BASE_URL 对应的目录文件
+CATALOG_FILE = catalog_file()
+
+
+class SchemaCatalog:
+    """
+    本地表结构目录，每张表一行
+
+    :param db_file: 目录文件，默认为 CATALOG_BASE_URL 对应的 catalog_file()
+    """
+
+    def __init__(self, db_file: Optional[Union[str, Path]] = None, timeout: float = 30.0):
+        self.db_file = Path(db_file or catalog_file())
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_file), timeout=timeout,
+                                     check_same_thread=False, isolation_level=None)
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tables (
+                    name         TEXT PRIMARY KEY,
+                    description  TEXT,
+                    create_time  TEXT,
+                    update_time  TEXT,
+                    ddl          TEXT NOT NULL,
+                    schema_json  TEXT NOT NULL,
+                    samples_json TEXT NOT NULL,
+                    refreshed_at REAL NOT NULL
+                );
+            """)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def versions(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """已保存的表及其 (create_time, update_time)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, create_time, update_time FROM tables").fetchall()
+        return {name: (create_time, update_time) for name, create_time, update_time in rows}
+
+    def refresh(self, dbm: DatabaseManager, limit: int = 2, full: bool = False) -> Dict[str, List[str]]:
+        """
+        增量刷新目录
+
+        information_schema.TABLES 中创建时间或更新时间与目录不一致的表视为已变更
+        （ALTER TABLE 会改变创建时间，写入数据会改变更新时间），只重新获取这些表。
+        :param limit: 每张表保存的示例数据行数
+        :param full: 忽略已保存的版本，全部重新获取
+        :return: {"added": [...], "changed": [...], "removed": [...], "unchanged": [...]}
+        """
+        start = time.perf_counter()
+        current = build_snapshot(dbm.sql_execute(snapshot_queries(dbm.config.phs_ads_db)[0]), [], [])
+        stored = {} if full else self.versions()
+        report = {
+            "added": [name for name in current if name not in stored],
+            "changed": [name for name, table in current.items()
+                        if name in stored and stored[name] != (table.create_time, table.update_time)],
+            "removed": [name for name in self.versions() if name not in current],
+            "unchanged": [name for name, table in current.items()
+                          if stored.get(name) == (table.create_time, table.update_time)],
+        }
+        stale = report["added"] + report["changed"]
+        if stale:
+            # 全部需要获取时直接查询整个库，避免过长的 IN 列表
+            snapshot = dbm.get_schema_snapshot(None if len(stale) == len(current) else stale)
+            samples = dbm.get_samples(stale, limit) if limit else {}
+            descriptions = dict(dbm.get_all_tables())
+        else:
+            snapshot, samples, descriptions = {}, {}, {}
+        now = time.time()
+        rows = [(name, descriptions.get(name) or table.comment, table.create_time, table.update_time,
+                 render_ddl(table), table.model_dump_json(),
+                 json.dumps(samples.get(name, []), ensure_ascii=False, default=str), now)
+                for name, table in snapshot.items() if name in stale]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.executemany("DELETE FROM tables WHERE name = ?", [(name,) for name in report["removed"]])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info("Schema catalog refreshed in %.2fs: %s", time.perf_counter() - start,
+                    {key: len(names) for key, names in report.items()})
+        return report
+
+    def get_all_tables(self) -> List[Tuple[str, str]]:
+        """所有表及其描述，与 DatabaseManager.get_all_tables 格式相同；目录为空时返回空列表"""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute("SELECT name, description FROM tables ORDER BY name")]
+
+    def get_table_schema(self, table_name: str) -> Optional[TableSchema]:
+        with self._lock:
+            row = self._conn.execute("SELECT schema_json FROM tables WHERE name = ?", (table_name,)).fetchone()
+        return TableSchema.model_validate_json(row[0]) if row else None
+
+    def get_tables_info(self, table_names: List[str],
+                        fallback: Optional[Callable[[List[str]], Dict[str, str]]] = None) -> Dict[str, str]:
+        """
+        读取多张表的描述，与 DatabaseManager.get_table_info 格式相同
+        :param fallback: 目录中没有的表交给 fallback 获取，不传则结果中不包含这些表
+        :return: {表名: 描述}，按传入顺序
+        """
+        tables = list(dict.fromkeys(table_names))
+        if not tables:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, ddl, samples_json FROM tables WHERE name IN ({})".format(", ".join("?" * len(tables))),
+                tables).fetchall()
+        found = {name: format_table_info(name, ddl, json.loads(samples)) for name, ddl, samples in rows}
+        missing = [table for table in tables if table not in found]
+        if missing and fallback is not None:
+            found.update(fallback(missing))
+        return {table: found[table] for table in tables if table in found}
+
+    def get_table_info(self, table_name: str) -> Optional[str]:
+        return self.get_tables_info([table_name]).get(table_name)
+
+    def get_ddl_and_samples(self) -> Dict[str, Tuple[str, List[Dict]]]:
+        """目录中所有表的 DDL 和示例数据"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, ddl, samples_json FROM tables ORDER BY name").fetchall()
+        return {name: (ddl, json.loads(samples)) for name, ddl, samples in rows}
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="本地表结构目录")
+    parser.add_argument("--db-file", default=str(CATALOG_FILE), help=f"目录文件 (默认: {CATALOG_FILE})")
+    subparsers = parser.add_subparsers(dest="command", help="命令")
+
+    refresh_parser = subparsers.add_parser("refresh", help="预热或增量刷新目录")
+    refresh_parser.add_argument("--full", action="store_true", help="忽略已保存的版本，全部重新获取")
+    refresh_parser.add_argument("--limit", type=int, default=2, help="每张表保存的示例数据行数 (默认: 2)")
+
+    subparsers.add_parser("list", help="列出目录中的表")
+
+    show_parser = subparsers.add_parser("show", help="查看表的描述")
+    show_parser.add_argument("table", help="表名")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口函数"""
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return
+
+    catalog = SchemaCatalog(args.db_file)
+    if args.command == "refresh":
+        report = catalog.refresh(DatabaseManager(), limit=args.limit, full=args.full)
+        for key in ("added", "changed", "removed"):
+            print(f"{key}: {len(report[key])} {', '.join(report[key])}")
+        print(f"unchanged: {len(report['unchanged'])}")
+    elif args.command == "list":
+        for name, description in catalog.get_all_tables():
+            print(f"{name}\t{description or ''}")
+    elif args.command == "show":
+        info = catalog.get_table_info(args.table)
+        print(info if info is not None else f"表 {args.table} 不在目录中")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+列式查询结果
+
+接口返回的每一行都是一个 dict，列名在每行重复一遍，而且所有值都是字符串。
+按列保存后每列只有一个类型化数组（按列的 SQL 类型或值的内容转换为整数、浮点、布尔），
+转换为 DataFrame 或 Arrow 表时直接复用这些数组；可以逐页追加，不需要先拿到全部行。
+"""
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from schemas.models import TableSchema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖，只有 to_arrow/to_parquet 需要
+    pa = pq = None
+
+
+# 与 numpy 类型对应的 SQL 类型（tinyint(1) 视为布尔）
+_SQL_KINDS = [
+    (re.compile(r"^(bool|boolean|tinyint\(1\))"), "bool"),
+    (re.compile(r"^(tinyint|smallint|mediumint|int|integer|bigint)\b"), "int"),
+    (re.compile(r"^(float|double|real|decimal|numeric)\b"), "float"),
+]
+# 接口把所有值都以字符串返回；整数不含前导 0，避免把编码类字符串（如 "007"）转换成数字
+_INT_TEXT = re.compile(r"-?(0|[1-9]\d*)$")
+_FLOAT_TEXT = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?$")
+_BOOL_TEXT = {"true": True, "false": False}
+
+
+def sql_kind(sql_type: Optional[str]) -> Optional[str]:
+    """
+    SQL 列类型（如 bigint(20)、decimal(10,2)、tinyint(1)）或 int/float/bool 对应的数组类型，
+    其他类型（字符串、日期、JSON 等）返回 "object"，原样保存
+    """
+    sql_type = (sql_type or "").strip().lower()
+    for pattern, kind in _SQL_KINDS:
+        if pattern.match(sql_type):
+            return kind
+    return "object"
+
+
+def schema_dtypes(*schemas: TableSchema) -> Dict[str, str]:
+    """表结构中各列的 SQL 类型，可作为 dtypes 传给 ColumnarResult / execute_columnar"""
+    return {column.name: column.type for schema in schemas for column in schema.columns}
+
+
+def _infer_kind(present: List[Any]) -> Optional[str]:
+    """按列中的非空值推断类型，数字和 true/false 字符串与原生类型同样处理"""
+    if not present:
+        return None
+    if all(isinstance(value, bool) or (isinstance(value, str) and value.lower() in _BOOL_TEXT) for value in present):
+        return "bool"
+    if all((isinstance(value, int) and not isinstance(value, bool))
+           or (isinstance(value, str) and _INT_TEXT.match(value)) for value in present):
+        return "int"
+    if all((isinstance(value, (int, float)) and not isinstance(value, bool))
+           or (isinstance(value, str) and _FLOAT_TEXT.match(value)) for value in present):
+        return "float"
+    return None
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in _BOOL_TEXT:
+            return _BOOL_TEXT[text]
+        value = float(text)
+    if value not in (0, 1):
+        raise ValueError(f"not a boolean: {value!r}")
+    return bool(value)
+
+
+def _to_array(values: List[Any], kind: Optional[str] = None) -> np.ndarray:
+    """
+    转换为类型化数组：整数、浮点（None 转为 NaN）、布尔，其余保存为 object
+    :param kind: 列的类型（见 sql_kind），不传时按值推断；值无法转换时保存为 object
+    """
+    present = [value for value in values if value is not None]
+    if kind is None:
+        kind = _infer_kind(present)
+    complete = len(present) == len(values)
+    try:
+        if kind == "bool" and present:
+            if complete:
+                return np.array([_to_bool(value) for value in values], dtype=np.bool_)
+            # 含空值的布尔列保存为 object，保留 None
+            values = [None if value is None else _to_bool(value) for value in values]
+        elif kind == "int" and present and complete:
+            try:
+                return np.array([int(value) for value in values], dtype=np.int64)
+            except OverflowError:
+                pass
+        elif kind in ("int", "float") and present:
+            return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class ColumnBuilder:
+    """
+    逐页追加行，按列累积值；后出现的列在之前的行中补 None
+
+    :param dtypes: 列名到 SQL 类型的映射（见 schema_dtypes），未列出的列按值推断类型
+    """
+
+    def __init__(self, dtypes: Optional[Dict[str, str]] = None):
+        self._values: Dict[str, List[Any]] = {}
+        self._count = 0
+        self._kinds = {name: sql_kind(sql_type) for name, sql_type in (dtypes or {}).items()}
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        values = self._values
+        for row in rows:
+            for name in row:
+                if name not in values:
+                    values[name] = [None] * self._count
+            for name, column in values.items():
+                column.append(row.get(name))
+            self._count += 1
+
+    def build(self) -> "ColumnarResult":
+        return ColumnarResult({name: _to_array(column, self._kinds.get(name))
+                               for name, column in self._values.items()})
+
+
+class ColumnarResult:
+    """
+    列式结果：列名和每列一个 numpy 数组
+
+    用法：
+        result = ColumnarResult.from_rows(rows)
+        df = result.to_pandas()
+        result.to_parquet("result.parquet")
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns: List[str] = list(columns)
+        self.arrays = columns
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], dtypes: Optional[Dict[str, str]] = None) -> "ColumnarResult":
+        return cls.from_pages([rows], dtypes)
+
+    @classmethod
+    def from_pages(cls, pages: Iterable[Iterable[Dict[str, Any]]],
+                   dtypes: Optional[Dict[str, str]] = None) -> "ColumnarResult":
+        """逐页转换为列，每页转换后即可释放；dtypes 见 ColumnBuilder"""
+        builder = ColumnBuilder(dtypes)
+        for page in pages:
+            builder.extend(page)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    def column(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """转换回行格式，浮点列中的 NaN 还原为 None（JSON 结果中不会出现 NaN）"""
+        columns = []
+        for name in self.columns:
+            array = self.arrays[name]
+            values = array.tolist()
+            if array.dtype == np.float64:
+                values = [None if value != value else value for value in values]
+            columns.append(values)
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+    def to_pandas(self) -> pd.DataFrame:
+        """转换为 DataFrame，直接使用列数组"""
+        return pd.DataFrame(self.arrays, columns=self.columns, copy=False)
+
+    def to_arrow(self) -> "pa.Table":
+        """转换为 Arrow 表；不含空值的数值列不复制，NaN 转为 null"""
+        if pa is None:
+            raise ImportError("to_arrow requires pyarrow: pip install pyarrow")
+        return pa.table({name: pa.array(self.arrays[name], from_pandas=True) for name in self.columns})
+
+    def to_parquet(self, path: Union[str, Path], compression: str = "zstd") -> None:
+        """导出为 Parquet 文件"""
+        if pq is None:
+            raise ImportError("to_parquet requires pyarrow: pip install pyarrow")
+        pq.write_table(self.to_arrow(), str(path), compression=compression)
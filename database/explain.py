@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+EXPLAIN 预检
+
+执行模型生成的 SQL 之前先 EXPLAIN，解析出使用的索引、预估行数和全表扫描，
+由 PlanPolicy 拒绝会扫描大宽表的查询，避免长时间占用 TiDB 后超时。
+同时支持 TiDB（id/estRows/access object）和 MySQL（table/type/key/rows）两种输出格式。
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from schemas.models import QueryPlan
+from utils.exceptions import QueryValidationError
+
+# 需要走索引的大宽表
+LARGE_TABLES = frozenset({"ads_phs_dmp_drug"})
+# 任意表全表扫描的预估行数上限
+MAX_FULL_SCAN_ROWS = 1_000_000
+
+_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+`?(?:\w+`?\.`?)?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.IGNORECASE)
+_RESERVED = {"where", "on", "using", "join", "left", "right", "inner", "outer", "cross", "group", "order",
+             "limit", "having", "union", "natural", "straight_join", "for", "lock", "window"}
+_ACCESS_TABLE = re.compile(r"table:`?(\w+)`?")
+_ACCESS_INDEX = re.compile(r"index:`?(\w+)`?")
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """FROM/JOIN 中的别名到表名的映射（表名也映射到自身）"""
+    aliases = {}
+    for table, alias in _ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _RESERVED:
+            aliases[alias] = table
+    return aliases
+
+
+def _rows(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_tidb(rows: List[Dict], aliases: Dict[str, str]) -> Tuple[List[str], Optional[float], Dict[str, float]]:
+    indexes, full_scans = [], {}
+    for row in rows:
+        operator = str(row.get("id", ""))
+        access = str(row.get("access object", ""))
+        est_rows = _rows(row.get("estRows", row.get("count")))
+        table = _ACCESS_TABLE.search(access)
+        table = aliases.get(table.group(1), table.group(1)) if table else None
+        index = _ACCESS_INDEX.search(access)
+        if index and index.group(1) not in indexes:
+            indexes.append(index.group(1))
+        if table and ("TableFullScan" in operator or "IndexFullScan" in operator):
+            full_scans[table] = max(full_scans.get(table, 0), est_rows or 0)
+    estimated = _rows(rows[0].get("estRows", rows[0].get("count"))) if rows else None
+    return indexes, estimated, full_scans
+
+
+def parse_mysql(rows: List[Dict], aliases: Dict[str, str]) -> Tuple[List[str], Optional[float], Dict[str, float]]:
+    indexes, full_scans, estimated = [], {}, None
+    for row in rows:
+        table = aliases.get(row.get("table") or "", row.get("table"))
+        est_rows = _rows(row.get("rows"))
+        if est_rows is not None:
+            estimated = max(estimated or 0, est_rows)
+        if row.get("key") and row["key"] not in indexes:
+            indexes.append(row["key"])
+        if table and row.get("type") in ("ALL", "index"):
+            full_scans[table] = max(full_scans.get(table, 0), est_rows or 0)
+    return indexes, estimated, full_scans
+
+
+def build_plan(sql: str, rows: List[Dict], execution_time: float) -> QueryPlan:
+    """把 EXPLAIN 的结果行解析为 QueryPlan"""
+    aliases = table_aliases(sql)
+    is_tidb = bool(rows) and ("estRows" in rows[0] or "access object" in rows[0])
+    indexes, estimated, full_scans = (parse_tidb if is_tidb else parse_mysql)(rows, aliases)
+    return QueryPlan(
+        explain_result={"format": "tidb" if is_tidb else "mysql", "rows": rows},
+        execution_time=execution_time,
+        indexes_used=indexes,
+        estimated_rows=estimated,
+        full_scans=full_scans,
+    )
+
+
+class PlanPolicy:
+    """
+    执行计划检查策略：大宽表不允许全表扫描，其他表全表扫描的预估行数不能超过上限
+    """
+
+    def __init__(self, large_tables: Iterable[str] = LARGE_TABLES,
+                 max_full_scan_rows: Optional[float] = MAX_FULL_SCAN_ROWS):
+        self.large_tables = set(large_tables)
+        self.max_full_scan_rows = max_full_scan_rows
+
+    def violations(self, plan: QueryPlan) -> List[str]:
+        """不符合策略的原因，空列表表示通过"""
+        reasons = []
+        for table, rows in plan.full_scans.items():
+            if table in self.large_tables:
+                reasons.append(f"对大宽表 {table} 进行了全表扫描")
+            elif self.max_full_scan_rows is not None and rows > self.max_full_scan_rows:
+                reasons.append(f"对表 {table} 进行了全表扫描，预估 {rows:.0f} 行")
+        return reasons
+
+    def check(self, plan: QueryPlan) -> QueryPlan:
+        """
+        检查执行计划，不通过时抛出 QueryValidationError，错误信息可以直接作为改写 SQL 的提示
+        """
+        reasons = self.violations(plan)
+        if reasons:
+            error = QueryValidationError(
+                "查询被拒绝：" + "；".join(reasons) + "。请在 WHERE 中使用带索引的列过滤，或缩小查询范围后重试。")
+            error.add_context("full_scans", plan.full_scans)
+            error.add_context("indexes_used", plan.indexes_used)
+            raise error
+        return plan
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+离线的 data.catalog 接口
+
+在本地 HTTP 服务中实现 DatabaseManager 用到的四个接口，数据来自内存 SQLite 中按固定种子生成的
+ads_phs 风格的表，不需要访问网络即可对 DatabaseManager 和完整的 agent 流程做基准和压测：
+- POST /auth/login：返回带 exp 的 JWT 格式 token，过期或未知的 token 返回 401
+- POST /query/jdbc：执行 SQL；另外模拟 SHOW CREATE TABLE、SHOW TABLES、EXPLAIN（TiDB 格式）
+  和 information_schema.TABLES/COLUMNS/STATISTICS
+- GET  /query/jdbc/table/list：表名及描述
+- POST /query/history/list：本服务执行过的 SQL，按时间倒序分页
+
+与真实接口一致，结果行中的值都转为字符串，值为 NULL 的列不出现在行中。
+表名与真实的 ads_phs 表相同，但缓存和表结构目录按接口地址保存在 data/catalogs/<接口地址> 下
+（见 utils.cache.catalog_data_dir）：DatabaseManager 按 config.base_url 选择查询结果缓存，
+agent 按 CATALOG_BASE_URL 选择表结构缓存和目录，合成的数据不会被访问真实接口的进程读到。
+
+用法:
+  python -m database.fake_catalog --port 8765 --latency 0.02
+  CATALOG_BASE_URL=http://127.0.0.1:8765/api/catalog python -m agents.main
+
+  with FakeCatalogServer(FakeCatalog(rows=500), latency=0.02) as server:
+      dbm = DatabaseManager(DatabaseConfig(base_url=server.base_url))
+"""
+import argparse
+import base64
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from database.explain import table_aliases
+from database.schema import render_ddl
+from schemas.models import ColumnInfo, IndexInfo, TableSchema
+from utils.cache import catalog_data_dir
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "phs_ads"
+API_PREFIX = "/api/catalog"
+
+PHASES = ["Discovery", "Preclinical", "Phase 1", "Phase 2", "Phase 3", "BLA/NDA", "Approved", "Withdrawn"]
+COUNTRIES = ["US", "CN", "JP", "DE", "GB", "FR", "KR", "AT", "NO", "CH"]
+GENES = ["EGFR", "HER2", "KRAS", "PD-1", "PD-L1", "CTLA-4", "BRAF", "ALK", "VEGFR2", "CD19", "CD20", "BCMA",
+         "TNF", "IL-6", "IL-17A", "JAK1", "BTK", "CDK4", "PARP1", "GLP-1R", "PCSK9", "SGLT2", "TROP2", "CLDN18.2"]
+DISEASES = [("Non-small cell lung cancer", "非小细胞肺癌"), ("Breast cancer", "乳腺癌"), ("Melanoma", "黑色素瘤"),
+            ("Multiple myeloma", "多发性骨髓瘤"), ("Rheumatoid arthritis", "类风湿关节炎"), ("Psoriasis", "银屑病"),
+            ("Type 2 diabetes", "2型糖尿病"), ("Obesity", "肥胖症"), ("Hypercholesterolemia", "高胆固醇血症"),
+            ("Gastric cancer", "胃癌"), ("Colorectal cancer", "结直肠癌"), ("Alzheimer disease", "阿尔茨海默病"),
+            ("Schizophrenia", "精神分裂症"), ("Chronic kidney disease", "慢性肾病"), ("Lymphoma", "淋巴瘤")]
+SYLLABLES = ["ali", "bre", "ce", "do", "ela", "fi", "ga", "li", "mo", "na", "pe", "ro", "sa", "tu", "vi", "ze"]
+SUFFIXES = ["tinib", "mab", "zumab", "ciclib", "parib", "gliflozin", "glutide", "lisib", "degib", "sertib"]
+ORG_WORDS = ["Nova", "Gene", "Bio", "Thera", "Astra", "Helix", "Zenith", "Apex", "Lumen", "Orion", "Hengrui", "Baili"]
+ORG_SUFFIXES = ["Pharma", "Therapeutics", "Biotech", "Biosciences", "Medicines"]
+
+# 表名 -> (表描述, 行数倍数, [(列名, 类型, 注释, 生成方式)], [(索引名, 列, 是否唯一)])
+# 每张表第一列为主键；生成方式见 FakeCatalog._value，ref/refs 引用的表需要排在前面
+SYNTHETIC_TABLES: Dict[str, Tuple[str, float, List[Tuple[str, str, str, str]], List[Tuple[str, List[str], bool]]]] = {
+    "ads_phs_disease": ("疾病基础信息表", 0.5, [
+        ("disease_id", "varchar(64)", "疾病id", "id"),
+        ("disease_name_en", "varchar(255)", "疾病英文名", "disease_en"),
+        ("disease_name_cn", "varchar(255)", "疾病中文名", "disease_cn"),
+        ("therapeutic_area", "varchar(64)", "治疗领域", "choice:Oncology|Immunology|Metabolism|Neurology|Nephrology"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_disease_name_en", ["disease_name_en"], False)]),
+    "ads_phs_target": ("靶点基础信息表", 0.5, [
+        ("target_id", "varchar(64)", "靶点id", "id"),
+        ("target_name", "varchar(255)", "靶点名称", "gene"),
+        ("target_type", "varchar(64)", "靶点类型", "choice:Protein|Gene|Complex|Pathway"),
+        ("disease_id", "json", "相关疾病id", "refs:ads_phs_disease"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_target_name", ["target_name"], False)]),
+    "ads_phs_org": ("机构基础信息表", 0.5, [
+        ("org_id", "varchar(64)", "机构id", "id"),
+        ("org_name", "varchar(255)", "机构名称", "org"),
+        ("country", "varchar(64)", "所属国家", "country"),
+        ("org_type", "varchar(64)", "机构类型", "choice:Company|University|Hospital|Government"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_org_name", ["org_name"], False)]),
+    "ads_phs_drug": ("药物基础信息表", 1, [
+        ("drug_id", "varchar(64)", "药物id", "id"),
+        ("drug_name_en", "varchar(255)", "药物英文名", "drug"),
+        ("drug_name", "json", "药物名称", "drug_names"),
+        ("drug_type", "varchar(64)", "药物类型", "choice:Small molecule|Monoclonal antibody|ADC|Vaccine|Cell therapy"),
+        ("target_id", "json", "靶点id", "refs:ads_phs_target"),
+        ("disease_id", "json", "适应症id", "refs:ads_phs_disease"),
+        ("originator_org_id", "json", "原研机构id", "refs:ads_phs_org"),
+        ("global_highest_dev_status", "varchar(64)", "全球最高研发状态", "phase"),
+        ("first_approved_date", "varchar(32)", "首次获批日期", "date"),
+        ("is_first_in_class", "varchar(8)", "是否first in class", "bool"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_drug_name_en", ["drug_name_en"], False)]),
+    "ads_phs_dmp_drug": ("药物宽表（大表，查询需走索引）", 4, [
+        ("uuid", "varchar(64)", "主键", "id"),
+        ("drug_id", "varchar(64)", "药物id", "ref:ads_phs_drug"),
+        ("drug_name_en", "varchar(255)", "药物英文名", "drug"),
+        ("target_id", "json", "靶点id", "refs:ads_phs_target"),
+        ("disease_id", "json", "适应症id", "refs:ads_phs_disease"),
+        ("org_id", "json", "研发机构id", "refs:ads_phs_org"),
+        ("research_country", "json", "研发国家", "countries"),
+        ("highest_dev_status", "varchar(64)", "最高研发状态", "phase"),
+        ("if_nme", "varchar(8)", "是否新分子实体", "bool"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_drug_id", ["drug_id"], False)]),
+    "ads_phs_ct": ("临床试验信息表", 2, [
+        ("clinical_trial_id", "varchar(64)", "临床试验id", "id"),
+        ("register_number", "varchar(64)", "注册号", "register"),
+        ("brief_title", "text", "简要标题", "title"),
+        ("phase", "varchar(64)", "试验阶段", "choice:Phase 1|Phase 1/2|Phase 2|Phase 3|Phase 4"),
+        ("recruitment_status", "varchar(64)", "招募状态", "choice:Recruiting|Completed|Terminated|Not yet recruiting"),
+        ("drug_id", "json", "药物id", "refs:ads_phs_drug"),
+        ("disease_id", "json", "适应症id", "refs:ads_phs_disease"),
+        ("sponsor_org_id", "varchar(64)", "申办方机构id", "ref:ads_phs_org"),
+        ("start_date", "varchar(32)", "开始日期", "date"),
+        ("enrollment", "int(11)", "入组人数", "int:10:3000"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_register_number", ["register_number"], True)]),
+    "ads_phs_patent_extension": ("专利延期业务表", 1, [
+        ("extension_id", "varchar(64)", "专利延期id", "id"),
+        ("patent_id", "varchar(64)", "专利id", "id"),
+        ("authority_country", "varchar(64)", "受理国家", "country"),
+        ("drug_id", "json", "药物id", "refs:ads_phs_drug"),
+        ("extension_type", "varchar(32)", "数据来源", "choice:SPC|PTE|PED"),
+        ("maximum_expiry_date", "varchar(32)", "最晚到期日", "date"),
+        ("pdf_url", "json", "爬取的pdf的s3地址", "urls"),
+        ("authorization_des", "json", "药物批准号和获批日期", "authorizations"),
+        ("data_status", "varchar(64)", "数据状态", "status"),
+        ("created_ts", "bigint(20)", "创建时间", "ts"),
+        ("updated_ts", "bigint(20)", "更新时间", "ts"),
+    ], [("idx_patent_id", ["patent_id"], False)]),
+}
+
+# MySQL 类型 -> SQLite 类型亲和性
+_AFFINITY = [(re.compile(r"int", re.I), "INTEGER"), (re.compile(r"decimal|double|float", re.I), "REAL")]
+
+_SHOW_CREATE = re.compile(r"^\s*show\s+create\s+table\s+`?(?:\w+`?\.`?)?(\w+)`?\s*;?\s*$", re.I)
+_SHOW_TABLES = re.compile(r"^\s*show\s+tables\s*;?\s*$", re.I)
+_EXPLAIN = re.compile(r"^\s*explain\s+(?!query\s+plan)(.*)$", re.I | re.S)
+_PLAN_DETAIL = re.compile(r"^(SCAN|SEARCH) (?:\w+\.)?(\w+)(?: USING (?:COVERING |INTEGER PRIMARY KEY)?(?:INDEX (\w+))?)?")
+
+
+def _json_contains(target: Optional[str], candidate: Optional[str], path: Optional[str] = None) -> Optional[int]:
+    """MySQL JSON_CONTAINS 的简化实现：数组包含候选值（或候选数组的全部元素），标量相等"""
+    if target is None or candidate is None:
+        return None
+    target, candidate = json.loads(target), json.loads(candidate)
+    if path not in (None, "$"):
+        raise sqlite3.OperationalError("JSON_CONTAINS path is not supported")
+    if isinstance(target, list):
+        wanted = candidate if isinstance(candidate, list) else [candidate]
+        return int(all(item in target for item in wanted))
+    return int(target == candidate)
+
+
+def _regexp(pattern: str, value: Any) -> int:
+    return int(value is not None and re.search(pattern, str(value)) is not None)
+
+
+def jwt_token(subject: str, expires_at: datetime) -> str:
+    """生成不签名的 JWT 格式 token，payload 中带 sub、iat、exp"""
+    def encode(data: Dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+    payload = {"sub": subject, "iat": int(time.time()), "exp": int(expires_at.timestamp())}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(payload)}.fake"
+
+
+class FakeCatalog:
+    """
+    内存 SQLite 中的合成数据及接口逻辑，与 HTTP 无关
+
+    :param rows: 基准行数，每张表的行数为 rows 乘以该表的倍数
+    :param seed: 随机种子，相同参数生成的数据完全相同
+    :param token_ttl: 登录返回的 token 有效期
+    """
+
+    def __init__(self, rows: int = 200, seed: int = 0, token_ttl: timedelta = timedelta(hours=12)):
+        self.token_ttl = token_ttl
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, datetime] = {}
+        self._history: List[Dict] = []
+        self._ids: Dict[str, List[str]] = {}
+        self.schemas: Dict[str, TableSchema] = {}
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(f"ATTACH ':memory:' AS {DB_NAME}")
+        self._conn.execute("ATTACH ':memory:' AS information_schema")
+        self._conn.create_function("JSON_CONTAINS", -1, _json_contains, deterministic=True)
+        self._conn.create_function("JSON_LENGTH", 1, lambda value: None if value is None else len(json.loads(value)),
+                                   deterministic=True)
+        self._conn.create_function("CONCAT", -1, lambda *args: None if None in args else "".join(map(str, args)),
+                                   deterministic=True)
+        self._conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+        for name, (comment, scale, columns, indexes) in SYNTHETIC_TABLES.items():
+            self._create_table(name, comment, columns, indexes, max(1, int(rows * scale)))
+        self._create_information_schema()
+
+    # ---- 合成数据 ----
+
+    def _value(self, kind: str, index: int) -> Any:
+        rng = self._rng
+        kind, _, arg = kind.partition(":")
+        if kind == "id":
+            return f"{rng.getrandbits(128):032x}"
+        if kind == "ref":
+            return rng.choice(self._ids[arg])
+        if kind == "refs":
+            return json.dumps(rng.sample(self._ids[arg], min(len(self._ids[arg]), rng.randint(1, 3))))
+        if kind == "choice":
+            return rng.choice(arg.split("|"))
+        if kind == "int":
+            low, high = map(int, arg.split(":"))
+            return rng.randint(low, high)
+        if kind == "status":
+            return "ACTIVE" if rng.random() < 0.9 else "DELETE"
+        if kind == "bool":
+            return rng.choice(["true", "false"])
+        if kind == "ts":
+            return int(datetime(2020, 1, 1).timestamp() * 1000) + rng.randint(0, 5 * 365 * 86400) * 1000
+        if kind == "date":
+            return None if rng.random() < 0.3 else (datetime(2000, 1, 1) + timedelta(days=rng.randint(0, 9000))).strftime("%Y%m%d")
+        if kind == "phase":
+            return rng.choice(PHASES)
+        if kind == "country":
+            return rng.choice(COUNTRIES)
+        if kind == "countries":
+            return json.dumps(rng.sample(COUNTRIES, rng.randint(1, 3)))
+        if kind == "gene":
+            gene = GENES[index % len(GENES)]
+            return gene if index < len(GENES) else f"{gene}-{index // len(GENES)}"
+        if kind in ("disease_en", "disease_cn"):
+            name = DISEASES[index % len(DISEASES)][kind == "disease_cn"]
+            return name if index < len(DISEASES) else f"{name} {index // len(DISEASES)}"
+        if kind == "org":
+            return f"{rng.choice(ORG_WORDS)}{rng.choice(ORG_WORDS).lower()} {rng.choice(ORG_SUFFIXES)}"
+        if kind == "drug":
+            return "".join(rng.sample(SYLLABLES, 2)).capitalize() + rng.choice(SUFFIXES)
+        if kind == "drug_names":
+            name = "".join(rng.sample(SYLLABLES, 2)).capitalize() + rng.choice(SUFFIXES)
+            return json.dumps([{"lang": "EN", "name": name, "status": "ACTIVE"},
+                               {"lang": "EN", "name": f"{name[:2].upper()}-{rng.randint(100, 9999)}",
+                                "status": "ACTIVE"}])
+        if kind == "register":
+            return f"NCT{index:08d}"
+        if kind == "title":
+            return (f"A {rng.choice(['Randomized', 'Open-label', 'Double-blind', 'Single-arm'])} "
+                    f"{rng.choice(['Phase 1', 'Phase 2', 'Phase 3'])} Study of "
+                    f"{''.join(rng.sample(SYLLABLES, 2)).capitalize()}{rng.choice(SUFFIXES)} in Patients With "
+                    f"{rng.choice(DISEASES)[0]}")
+        if kind == "urls":
+            return json.dumps([f"s3://phs-patent/extension/{rng.getrandbits(64):016x}.pdf"
+                               for _ in range(rng.randint(1, 3))])
+        if kind == "authorizations":
+            return json.dumps([{"authorization_date": f"{rng.randint(2000, 2024)}0{rng.randint(1, 9)}15",
+                                "authorization_number": f"EU/1/{rng.randint(0, 24):02d}/{rng.randint(100, 1999)}"}
+                               for _ in range(rng.randint(1, 2))])
+        raise ValueError(f"Unknown value kind: {kind}")
+
+    def _create_table(self, name: str, comment: str, columns: List[Tuple[str, str, str, str]],
+                      indexes: List[Tuple[str, List[str], bool]], count: int) -> None:
+        primary = columns[0][0]
+        created = datetime(2023, 1, 1) + timedelta(days=len(self.schemas))
+        self.schemas[name] = TableSchema(
+            name=name, comment=comment, engine="InnoDB", table_rows=count,
+            create_time=created.strftime("%Y-%m-%d %H:%M:%S"), update_time=None,
+            columns=[ColumnInfo(name=column, type=column_type, nullable=column != primary, comment=column_comment,
+                                key="PRI" if column == primary else "")
+                     for column, column_type, column_comment, _ in columns],
+            indexes=[IndexInfo(name="PRIMARY", columns=[primary], unique=True)]
+                    + [IndexInfo(name=index, columns=index_columns, unique=unique)
+                       for index, index_columns, unique in indexes])
+
+        definitions = []
+        for column, column_type, _, _ in columns:
+            affinity = next((value for pattern, value in _AFFINITY if pattern.search(column_type)), "TEXT")
+            definitions.append(f"`{column}` {affinity}" + (" PRIMARY KEY" if column == primary else ""))
+        self._conn.execute(f"CREATE TABLE {DB_NAME}.`{name}` ({', '.join(definitions)})")
+        for index, index_columns, unique in indexes:
+            self._conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {DB_NAME}.`{name}__{index}` "
+                               f"ON `{name}` ({', '.join(f'`{c}`' for c in index_columns)})")
+        rows = [[self._value(kind, i) for _, _, _, kind in columns] for i in range(count)]
+        self._conn.executemany(f"INSERT INTO {DB_NAME}.`{name}` VALUES ({', '.join('?' * len(columns))})", rows)
+        self._ids[name] = [row[0] for row in rows]
+
+    def _create_information_schema(self) -> None:
+        conn = self._conn
+        conn.execute("CREATE TABLE information_schema.TABLES (TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, TABLE_COMMENT, "
+                     "ENGINE, TABLE_ROWS, CREATE_TIME, UPDATE_TIME)")
+        conn.execute("CREATE TABLE information_schema.COLUMNS (TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION, "
+                     "COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, COLUMN_KEY, EXTRA, COLUMN_COMMENT)")
+        conn.execute("CREATE TABLE information_schema.STATISTICS (TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, NON_UNIQUE, "
+                     "SEQ_IN_INDEX, COLUMN_NAME)")
+        for table in self.schemas.values():
+            conn.execute("INSERT INTO information_schema.TABLES VALUES (?, ?, 'BASE TABLE', ?, ?, ?, ?, ?)",
+                         (DB_NAME, table.name, table.comment, table.engine, table.table_rows,
+                          table.create_time, table.update_time))
+            conn.executemany("INSERT INTO information_schema.COLUMNS VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (DB_NAME, table.name, column.name, position, column.type, "YES" if column.nullable else "NO",
+                 column.default, column.key, column.extra, column.comment)
+                for position, column in enumerate(table.columns, 1)])
+            conn.executemany("INSERT INTO information_schema.STATISTICS VALUES (?, ?, ?, ?, ?, ?)", [
+                (DB_NAME, table.name, index.name, 0 if index.unique else 1, position, column)
+                for index in table.indexes for position, column in enumerate(index.columns, 1)])
+
+    # ---- 接口 ----
+
+    def login(self, username: Optional[str]) -> str:
+        token = jwt_token(username or "anonymous", datetime.now() + self.token_ttl)
+        with self._lock:
+            self._tokens[token] = datetime.now() + self.token_ttl
+        return token
+
+    def revoke_tokens(self) -> None:
+        """使已签发的 token 全部失效，模拟服务端重启或 token 被吊销"""
+        with self._lock:
+            self._tokens.clear()
+
+    def authorized(self, header: Optional[str]) -> bool:
+        """X-Authorization 中的 token 是否由本服务签发且未过期"""
+        token = (header or "").removeprefix("Bearer ").strip()
+        with self._lock:
+            expires_at = self._tokens.get(token)
+        return expires_at is not None and expires_at > datetime.now()
+
+    def table_list(self) -> Dict:
+        return {"metadata_list": {name: {"business_description": table.comment}
+                                  for name, table in self.schemas.items()}}
+
+    def history(self, page_num: int, page_size: int) -> Dict:
+        with self._lock:
+            items = self._history[::-1]
+        start = (max(page_num, 1) - 1) * page_size
+        return {"list": items[start:start + page_size], "total": len(items)}
+
+    def execute(self, sql: str) -> List[Dict]:
+        """执行 SQL，返回与真实接口格式相同的结果行；语句有误时抛出 sqlite3.Error"""
+        start = time.perf_counter()
+        try:
+            rows = self._execute(sql)
+        except sqlite3.Error:
+            self._record(sql, "FAILED", start)
+            raise
+        self._record(sql, "SUCCEEDED", start)
+        return [{key: str(value) for key, value in row.items() if value is not None} for row in rows]
+
+    def _record(self, sql: str, status: str, start: float) -> None:
+        with self._lock:
+            self._history.append({"id": len(self._history) + 1, "query_statement": sql, "status": status,
+                                  "db_name": DB_NAME, "engine": "jdbc",
+                                  "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                                  "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+
+    def _execute(self, sql: str) -> List[Dict]:
+        match = _SHOW_CREATE.match(sql)
+        if match:
+            table = self.schemas.get(match.group(1))
+            if table is None:
+                raise sqlite3.OperationalError(f"Table '{DB_NAME}.{match.group(1)}' doesn't exist")
+            return [{"Table": table.name, "Create Table": render_ddl(table)}]
+        if _SHOW_TABLES.match(sql):
+            return [{f"Tables_in_{DB_NAME}": name} for name in self.schemas]
+        match = _EXPLAIN.match(sql)
+        if match:
+            return self._explain(match.group(1))
+        with self._lock:
+            cursor = self._conn.execute(sql)
+            return [dict(row) for row in cursor.fetchall()] if cursor.description else []
+
+    def _explain(self, sql: str) -> List[Dict]:
+        """把 SQLite 的 EXPLAIN QUERY PLAN 转换成 TiDB 格式的执行计划"""
+        with self._lock:
+            details = [row["detail"] for row in self._conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+        aliases = table_aliases(sql)
+        plan = []
+        for detail in details:
+            match = _PLAN_DETAIL.match(detail)
+            if not match or match.group(2) == "CONSTANT":
+                continue
+            action, table, index = match.groups()
+            name = aliases.get(table, table)
+            total = self.schemas[name].table_rows if name in self.schemas else 0
+            if index:
+                index = index.removeprefix(f"{name}__")
+                if index.startswith("sqlite_autoindex_"):
+                    index = "PRIMARY"
+                columns = next((i.columns for i in self.schemas[name].indexes if i.name == index), []) \
+                    if name in self.schemas else []
+                access = f"table:{table}, index:{index}({', '.join(columns)})"
+            else:
+                access = f"table:{table}"
+            if action == "SEARCH":
+                operator, rows = ("IndexRangeScan" if index else "TableRangeScan"), max(1.0, total / 100)
+            else:
+                operator, rows = ("IndexFullScan" if index else "TableFullScan"), float(total)
+            plan.append({"id": f"└─{operator}_{len(plan) + 2}", "estRows": f"{rows:.2f}", "task": "cop[tikv]",
+                         "access object": access, "operator info": detail})
+        estimated = min((float(row["estRows"]) for row in plan), default=1.0)
+        return [{"id": "Projection_1", "estRows": f"{estimated:.2f}", "task": "root",
+                 "access object": "", "operator info": ""}] + plan
+
+
+class FakeCatalogServer:
+    """
+    在后台线程中运行的 FakeCatalog HTTP 服务
+
+    :param latency: 每个请求在返回前等待的秒数
+    :param jitter: 在 latency 上叠加的随机抖动比例（0.2 表示 ±20%）
+    :param port: 监听端口，0 表示随机分配
+    """
+
+    def __init__(self, catalog: Optional[FakeCatalog] = None, latency: float = 0.0, jitter: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.catalog = catalog or FakeCatalog()
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> "FakeCatalogServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-catalog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeCatalogServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _delay(self) -> None:
+        delay = self.latency * (1 + random.uniform(-self.jitter, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: Dict) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> Dict:
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                return json.loads(data) if data else {}
+
+            def _route(self, method: str) -> None:
+                with server._requests_lock:
+                    server.requests += 1
+                try:
+                    self._dispatch(method)
+                except Exception as e:
+                    logger.exception(f"Fake catalog failed on {method} {self.path}")
+                    self._reply(500, {"message": str(e)})
+
+            def _dispatch(self, method: str) -> None:
+                url = urlparse(self.path)
+                path = url.path.removeprefix(API_PREFIX)
+                body = self._body() if method == "POST" else {}
+                server._delay()
+                catalog = server.catalog
+                if (method, path) == ("POST", "/auth/login"):
+                    self._reply(200, {"body": {"token": catalog.login(body.get("username"))}})
+                elif (method, path) not in (("POST", "/query/jdbc"), ("GET", "/query/jdbc/table/list"),
+                                            ("POST", "/query/history/list")):
+                    self._reply(404, {"message": f"Not found: {method} {path}"})
+                elif not catalog.authorized(self.headers.get("X-Authorization")):
+                    self._reply(401, {"message": "Unauthorized"})
+                elif path == "/query/jdbc":
+                    try:
+                        self._reply(200, {"body": {"rows": catalog.execute(body["sql"])}})
+                    except sqlite3.Error as e:
+                        self._reply(400, {"message": str(e)})
+                elif path == "/query/jdbc/table/list":
+                    query = parse_qs(url.query)
+                    if query.get("dbName", [DB_NAME])[0] != DB_NAME:
+                        self._reply(200, {"body": {"metadata_list": {}}})
+                    else:
+                        self._reply(200, {"body": catalog.table_list()})
+                else:
+                    self._reply(200, {"body": catalog.history(body.get("page_num", 1), body.get("page_size", 20))})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="离线的 data.catalog 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rows", type=int, default=200, help="每张表的基准行数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机抖动比例")
+    parser.add_argument("--token-ttl", type=float, default=12, help="token 有效期（小时）")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = create_parser().parse_args(argv)
+    catalog = FakeCatalog(rows=args.rows, seed=args.seed, token_ttl=timedelta(hours=args.token_ttl))
+    server = FakeCatalogServer(catalog, latency=args.latency, jitter=args.jitter, host=args.host, port=args.port)
+    print(f"Fake data.catalog listening on {server.base_url}")
+    print(f"  CATALOG_BASE_URL={server.base_url}")
+    print(f"  local caches for this address: {catalog_data_dir(server.base_url)}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
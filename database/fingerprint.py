@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+SQL 指纹：只在空白、大小写和注释上不同的语句得到相同的指纹
+
+字符串字面量和反引号标识符原样保留，'Aspirin' 与 'aspirin' 仍是不同的查询。
+is_read_only_sql 判断语句是否只读（可以安全重试、合并和缓存）。
+"""
+import hashlib
+import re
+
+# 依次匹配：字符串/反引号标识符、注释、空白、其他字符
+_TOKEN = re.compile(r"""
+    (?P<quoted>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`)
+  | (?P<comment>/\*.*?\*/|(?:--(?=\s|$)|\#)[^\n]*)
+  | (?P<space>\s+)
+  | (?P<other>[^'"`\s/#,()=<>-]+|.)
+""", re.VERBOSE | re.DOTALL)
+# 两侧的空白不影响语义的符号
+_PUNCT = set(",()=<>")
+# 只读语句的开头关键字
+_READ_ONLY_START = {"select", "show", "desc", "describe", "explain", "with"}
+# WITH 和 EXPLAIN 之后的主语句
+_STATEMENTS = {"select", "values", "table", "insert", "update", "delete", "replace"}
+# 加锁读：SELECT ... FOR UPDATE / FOR SHARE / LOCK IN SHARE MODE
+_LOCKING = re.compile(r"\bfor (update|share)\b|\block in share mode\b")
+
+
+def normalize_sql(sql: str) -> str:
+    """去掉注释和末尾分号，合并空白（去掉符号两侧的空白），字面量以外的部分转小写"""
+    parts = []
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind == "quoted":
+            parts.append(match.group())
+        elif kind in ("comment", "space"):
+            if parts and parts[-1] != " " and parts[-1] not in _PUNCT:
+                parts.append(" ")
+        else:
+            token = match.group().lower()
+            if token in _PUNCT and parts and parts[-1] == " ":
+                parts.pop()
+            parts.append(token)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def sql_fingerprint(sql: str) -> str:
+    """规范化后语句的 sha1"""
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """
+    是否为只读语句：以 SELECT/SHOW/DESC/EXPLAIN/WITH 开头，WITH 之后的主语句不是 INSERT/UPDATE/DELETE，
+    不是 EXPLAIN ANALYZE 写语句（会真正执行），且不带 FOR UPDATE 等加锁子句；字面量和注释中的关键字不计
+    """
+    depth, words = 0, []
+    for match in _TOKEN.finditer(sql):
+        if match.lastgroup != "other":
+            continue
+        token = match.group().lower()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token.isidentifier():
+            words.append((depth, token))
+    if not words or words[0][1] not in _READ_ONLY_START:
+        return False
+    if _LOCKING.search(" ".join(word for _, word in words)):
+        return False
+    first_depth, first = words[0]
+    if first == "with" or (first in ("explain", "desc", "describe") and any(w == "analyze" for _, w in words[1:3])):
+        # 主语句是 CTE 定义（括号内）之后、与开头同一层的第一个语句关键字
+        main = next((word for d, word in words[1:] if d == first_depth and word in _STATEMENTS), None)
+        return main in ("select", "values", "table") or (first != "with" and main is None)
+    return True
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+进程内的数据目录请求并发限制
+
+同一进程中所有 DatabaseManager / AsyncDatabaseManager 实例共用一个限流器：同时在途的请求数
+不超过上限，超出的请求进入等待队列，按优先级从高到低、同优先级先到先得的顺序获得名额。
+线程和 asyncio 协程在同一个队列中排队，协程等待时不会阻塞事件循环。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from utils.cache_stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+# 默认的进程内并发上限，可以通过环境变量 CATALOG_MAX_CONCURRENCY 调整
+DEFAULT_MAX_CONCURRENCY = 8
+
+PRIORITY_HIGH = 10  # 登录等会阻塞其他请求的调用
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10  # 历史导出等批量任务
+
+# 排队等待时间直方图的桶上界（毫秒）
+WAIT_BUCKETS_MS: Tuple[float, ...] = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_priority: ContextVar[int] = ContextVar("catalog_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def priority(value: int):
+    """
+    在 with 块内发起的请求使用指定优先级（对当前线程/协程生效，线程池中的任务不继承）
+
+    用法：
+        with priority(PRIORITY_LOW):
+            dbm.get_user_history()
+    """
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class ConcurrencyLimiter:
+    """
+    限制同时在途的调用数，超出的调用按优先级和到达顺序排队
+    """
+
+    def __init__(self, limit: int = DEFAULT_MAX_CONCURRENCY):
+        if limit < 1:
+            raise ValueError(f"limit must be positive: {limit}")
+        self._lock = threading.Lock()
+        self._limit = limit
+        self._active = 0
+        # (-优先级, 到达序号, 等待者)，堆顶是优先级最高且最早到达的调用
+        self._waiters: List[Tuple[int, int, Future]] = []
+        self._sequence = itertools.count()
+        self._counts = Counter()
+        self._max_queued = 0
+        self._wait = Histogram(WAIT_BUCKETS_MS)
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def set_limit(self, limit: int) -> None:
+        """调整并发上限，调大时立即放行排队中的调用"""
+        if limit < 1:
+            raise ValueError(f"limit must be positive: {limit}")
+        with self._lock:
+            self._limit = limit
+            self._grant()
+
+    def _enqueue(self, priority: int) -> Optional[Future]:
+        """有空闲名额且无人排队时直接占用，返回 None；否则返回排队的等待者"""
+        with self._lock:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return None
+            future = Future()
+            heapq.heappush(self._waiters, (-priority, next(self._sequence), future))
+            self._counts["queued"] += 1
+            self._max_queued = max(self._max_queued, len(self._waiters))
+            return future
+
+    def _grant(self) -> None:
+        """把空闲名额交给队首的等待者，调用方需持有锁"""
+        while self._waiters and self._active < self._limit:
+            _, _, future = heapq.heappop(self._waiters)
+            # 等待者可能已被取消（协程超时/被取消时 asyncio 会直接取消该 Future）
+            if future.set_running_or_notify_cancel():
+                self._active += 1
+                future.set_result(None)
+
+    def _abandon(self, future: Future) -> bool:
+        """
+        放弃排队
+        :return: True 表示已从队列中移除；False 表示名额已经交给了该等待者，需要由调用方释放
+        """
+        with self._lock:
+            if future.done() and not future.cancelled():
+                return False
+            future.cancel()
+            self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+            heapq.heapify(self._waiters)
+            return True
+
+    def _acquired(self, start: float) -> float:
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._counts["acquired"] += 1
+            self._wait.observe(waited * 1000)
+        if waited >= 1:
+            logger.info(f"Waited {waited:.2f}s for a catalog request slot")
+        return waited
+
+    def _timed_out(self, timeout: float) -> TimeoutError:
+        with self._lock:
+            self._counts["timeouts"] += 1
+        return TimeoutError(f"No catalog request slot available within {timeout}s")
+
+    def acquire(self, priority: Optional[int] = None, timeout: Optional[float] = None) -> float:
+        """
+        占用一个名额，必要时阻塞等待
+        :param priority: 优先级，越大越先获得名额；不传则使用 priority() 设置的当前优先级
+        :param timeout: 最长等待秒数，超时抛出 TimeoutError
+        :return: 排队等待的秒数
+        """
+        start = time.perf_counter()
+        future = self._enqueue(current_priority() if priority is None else priority)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except TimeoutError:
+                if self._abandon(future):
+                    raise self._timed_out(timeout)
+            except BaseException:
+                if not self._abandon(future):
+                    self.release()
+                raise
+        return self._acquired(start)
+
+    async def aacquire(self, priority: Optional[int] = None, timeout: Optional[float] = None) -> float:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        start = time.perf_counter()
+        future = self._enqueue(current_priority() if priority is None else priority)
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except TimeoutError:
+                if self._abandon(future):
+                    raise self._timed_out(timeout)
+            except BaseException:
+                if not self._abandon(future):
+                    self.release()
+                raise
+        return self._acquired(start)
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._grant()
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None, timeout: Optional[float] = None):
+        """在 with 块内占用一个名额"""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[int] = None, timeout: Optional[float] = None):
+        """slot 的异步版本"""
+        await self.aacquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        """
+        当前状态与累计计数：
+        in_flight/queued 为当前在途和排队的调用数，acquired/waited/timeouts 为累计获得名额、
+        曾经排队、排队超时的调用数，wait 为排队等待时间的直方图（毫秒）
+        """
+        with self._lock:
+            return {
+                "limit": self._limit,
+                "in_flight": self._active,
+                "queued": len(self._waiters),
+                "max_queued": self._max_queued,
+                "acquired": self._counts["acquired"],
+                "waited": self._counts["queued"],
+                "timeouts": self._counts["timeouts"],
+                "wait": self._wait.snapshot(),
+            }
+
+
+_limiter: Optional[ConcurrencyLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter(limit: Optional[int] = None) -> ConcurrencyLimiter:
+    """
+    进程内共享的限流器，首次调用时创建
+    :param limit: 同时调整并发上限；不传则保持不变（初始值取 CATALOG_MAX_CONCURRENCY，默认 8）
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ConcurrencyLimiter(limit or int(os.getenv("CATALOG_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)))
+        elif limit is not None and limit != _limiter.limit:
+            logger.info(f"Catalog request limit changed from {_limiter.limit} to {limit}")
+            _limiter.set_limit(limit)
+        return _limiter
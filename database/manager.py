@@ -2,13 +2,30 @@
 # @Time : 2025/2/18 下午12:02
 # @Author : renjiajia
 import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from typing import Dict, List
-from utils.cache import CacheManager
-from requests.exceptions import RequestException
-import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional
+from utils.cache import DEFAULT_CATALOG_URL, get_cache
+from utils.singleflight import SingleFlight
+from database.columnar import ColumnarResult
+from database.explain import PlanPolicy, build_plan
+from database.fingerprint import is_read_only_sql, sql_fingerprint
+from database.limiter import PRIORITY_HIGH, PRIORITY_LOW, get_limiter
+from database.paging import keyset_page_sql, offset_page_sql
+from database.samples import compact_samples
+from database.schema import build_snapshot, render_ddl, snapshot_queries
+from database.token_provider import get_token_provider
+from schemas.models import QueryPlan, SQLResult, TableSchema
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RequestException, Timeout
+from openpyxl import Workbook
 import logging
 import requests
 import json
@@ -16,29 +33,75 @@ import json
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-cache = CacheManager()
+# 进程内在途的只读 SQL，键与查询结果缓存相同
+sql_flights = SingleFlight()
+
+# 可以安全重试的网关/限流状态码
+RETRY_STATUS = {429, 502, 503, 504}
 
 
 class DatabaseConfig(BaseModel):
     """数据库配置模型"""
-    base_url: str = "http://data.catalog.patsnap.com/api/catalog"
+    base_url: str = os.getenv("CATALOG_BASE_URL", DEFAULT_CATALOG_URL)  # 可指向 database.fake_catalog
     phs_ads_db: str = "phs_ads"
     source_id: str = "1721714700074094594"
-    request_timeout: int = 30
-    max_retries: int = 3
+    connect_timeout: float = 5
+    request_timeout: int = 30  # 读超时（秒），对每个请求生效
+    max_retries: int = 3  # 幂等请求遇到网络错误或 429/5xx 时的最大重试次数
+    retry_backoff: float = 0.5  # 退避基数（秒），第 n 次重试最多等待 retry_backoff * 2^n
+    retry_backoff_max: float = 8
+    token_ttl_hours: int = 12  # token 不是 JWT（读不到 exp）时使用的有效期
+    token_refresh: bool = True  # 是否在后台提前刷新 token
+    verify_ssl: bool = False
+    pool_connections: int = 4  # 缓存连接池的主机数
+    pool_maxsize: int = 16  # 每个主机保持的长连接数，应不小于并发请求的线程数
+    result_cache_ttl: Optional[timedelta] = None  # 查询结果缓存的有效期，不设置则使用 query_results 命名空间的默认值
+    fetch_concurrency: int = 8  # 批量获取表结构时同时进行的请求数
+    max_concurrency: Optional[int] = None  # 进程内所有实例同时在途的请求数上限，不设置则保持当前值（默认 8）
+    queue_timeout: Optional[float] = None  # 等待请求名额的最长秒数，超时抛出 TimeoutError，不设置则一直等待
+
+
+def parse_table_list(response: Dict) -> List:
+    """从表列表接口的响应中提取 (表名, 注释)"""
+    metadata = response['body']['metadata_list']
+    return [(table_name, value['business_description']) for table_name, value in metadata.items()]
+
 
+def format_table_info(table_name: str, table_ddl: str, table_data: Any) -> str:
+    """将表结构和示例数据组装成提供给模型的描述，示例行经 compact_samples 压缩"""
+    if isinstance(table_data, list):
+        samples = compact_samples(table_data)
+        table_data = "\n" + samples if samples else "无"
+    return f"表名：{table_name}\n表结构：{table_ddl}\n示例数据：{table_data}"
 
-class DatabaseManager:
+
+class CatalogClientBase:
     """
-    数据库工具类
+    同步/异步数据库工具类共用的部分：配置、请求头、计数和退避策略
     """
 
-    def __init__(self):
-        self.config = DatabaseConfig()
-        self._session = requests.Session()
-        self._session.verify = False  # 根据实际情况调整SSL验证
+    def __init__(self, config: Optional[DatabaseConfig] = None):
+        self.config = config or DatabaseConfig()
+        self._metrics = Counter()
+        self._metrics_lock = threading.Lock()
+        self.limiter = get_limiter(self.config.max_concurrency)
+        # 按接口地址区分存储目录，指向 fake_catalog 等其他接口时不会读写真实接口的缓存
+        self.result_cache = get_cache("query_results", base_url=self.config.base_url)
+        # 同一接口地址和用户的实例共用 token
+        self.token_provider = get_token_provider(self.config.base_url, os.getenv('DB_USERNAME'))
         self._init_headers()
 
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._metrics_lock:
+            self._metrics[name] += n
+
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """请求计数：requests、retries、reauth、errors，以及 sql_executions（实际发出的只读查询）和 coalesced（合并到在途查询的调用）"""
+        with self._metrics_lock:
+            return {name: self._metrics[name]
+                    for name in ('requests', 'retries', 'reauth', 'errors', 'sql_executions', 'coalesced')}
+
     def _init_headers(self) -> None:
         """初始化公共请求头"""
         self._headers = {
@@ -49,114 +112,327 @@ class DatabaseManager:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
 
-    def _get_auth_headers(self) -> Dict:
+    def _login_payload(self) -> str:
+        return json.dumps({
+            'username': os.getenv('DB_USERNAME'),
+            'password': os.getenv('DB_PASSWORD')
+        })
+
+    def _sql_payload(self, sql: str) -> Dict:
+        return {
+            'sql': sql,
+            'db_name': self.config.phs_ads_db,
+            'source_id': self.config.source_id,
+            'export': False
+        }
+
+    def _result_key(self, sql: str) -> Optional[str]:
+        """查询结果的缓存键（同时用于合并在途查询），只有只读语句可以缓存；不同接口地址的结果互不复用"""
+        if not is_read_only_sql(sql):
+            return None
+        base_url = self.config.base_url.rstrip("/")
+        return f"sql:{base_url}:{self.config.phs_ads_db}:{self.config.source_id}:{sql_fingerprint(sql)}"
+
+    @staticmethod
+    def _copy_rows(rows: List[Dict]) -> List[Dict]:
+        """结果行的副本；缓存和在途查询的结果由多个调用方共用，调用方只能拿到副本"""
+        return [dict(row) for row in rows]
+
+    def _coalesced(self, rows: List[Dict]) -> List[Dict]:
+        """合并到在途查询的调用拿到结果的副本（leader 也只拿副本），避免调用方修改彼此的结果"""
+        self._count('coalesced')
+        return self._copy_rows(rows)
+
+    def _backoff(self, attempt: int, response: Any = None) -> float:
+        """带随机抖动的指数退避时间，服务端返回 Retry-After 时优先使用"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.config.retry_backoff_max)
+        return random.uniform(0, min(self.config.retry_backoff_max, self.config.retry_backoff * 2 ** attempt))
+
+
+class DatabaseManager(CatalogClientBase):
+    """
+    数据库工具类
+    """
+
+    def __init__(self, config: Optional[DatabaseConfig] = None):
+        super().__init__(config)
+        self._session = self._create_session()
+        if self.config.token_refresh:
+            self.token_provider.start(self._login, timedelta(hours=self.config.token_ttl_hours))
+
+    def _create_session(self) -> requests.Session:
+        """创建带连接池的会话，所有请求复用 TCP/TLS 长连接"""
+        session = requests.Session()
+        session.verify = self.config.verify_ssl
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    def _get_auth_headers(self, token: Optional[str] = None) -> Dict:
         """获取带认证的请求头"""
-        return {**self._headers, 'X-Authorization': f'Bearer {self._valid_token}'}
+        return {**self._headers, 'X-Authorization': f'Bearer {token or self._valid_token}'}
 
     @property
     def _valid_token(self) -> str:
-        """获取有效token，自动处理刷新逻辑"""
-        token = cache.get('token')
-        if not token:
-            token = self._refresh_token()
-        return token
-
-    def _refresh_token(self) -> str:
-        """获取新的访问令牌并更新缓存"""
-        url = f"{self.config.base_url}/auth/login"
-        payload = json.dumps({
-            'username': os.getenv('DB_USERNAME'),
-            'password': os.getenv('DB_PASSWORD')
-        })
+        """获取内存中的有效token，通常已由后台提前刷新；没有时登录"""
+        return self.token_provider.get(self._login)
+
+    def _refresh_token(self, rejected: Optional[str] = None) -> str:
+        """
+        服务端拒绝 token 后重新登录
+
+        并发收到 401 的线程只有一个会登录，其余直接使用新 token。
+        :param rejected: 被服务端拒绝的 token
+        """
+        if rejected is not None:
+            self.token_provider.invalidate(rejected)
+        return self.token_provider.get(self._login)
 
+    def _login(self) -> str:
+        """登录获取新的访问令牌"""
+        url = f"{self.config.base_url}/auth/login"
         try:
-            response = self._session.post(
-                url,
-                data=payload,
-                headers=self._headers,
-                timeout=self.config.request_timeout
-            )
+            response = self._send('POST', url, idempotent=True, priority=PRIORITY_HIGH,
+                                  data=self._login_payload(), headers=self._headers)
             response.raise_for_status()
             token = response.json()['body']['token']
-            cache.set('token', token)
             logger.info("Token refreshed successfully")
             return token
         except RequestException as e:
             logger.error(f"Token refresh failed: {str(e)}")
             raise
 
+    def _send(self, method: str, url: str, idempotent: bool, priority: Optional[int] = None,
+              **kwargs) -> requests.Response:
+        """
+        发送请求，幂等请求在网络错误、超时和 429/5xx 时按退避策略重试
+
+        每次尝试前先从进程内的限流器获取名额，退避等待期间不占用名额。
+        :param priority: 排队优先级，不传则使用 limiter.priority() 设置的当前优先级
+        :return: 最后一次的响应（未检查状态码）
+        """
+        kwargs.setdefault('timeout', (self.config.connect_timeout, self.config.request_timeout))
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.slot(priority, self.config.queue_timeout):
+                    self._count('requests')
+                    response = self._session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                if not idempotent or attempt >= self.config.max_retries:
+                    self._count('errors')
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Request {method} {url} failed ({e}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUS or not idempotent or attempt >= self.config.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning(f"Request {method} {url} returned {response.status_code}, "
+                               f"retry {attempt + 1} in {delay:.2f}s")
+            self._count('retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def _request(self, method: str, path: str, idempotent: bool = True, priority: Optional[int] = None,
+                 **kwargs) -> Any:
+        """
+        通过连接池会话发送带认证的请求
+
+        token 失效（401）时重新登录并重放一次；服务端拒绝认证时请求并未执行，非幂等请求也可以安全重放。
+        :param path: 相对于 base_url 的路径
+        :param idempotent: 是否可以在网络错误时重试
+        :param priority: 排队优先级，见 _send
+        :return: 解析后的 JSON 响应
+        """
+        url = f"{self.config.base_url}{path}"
+        token = self._valid_token
+        response = self._send(method, url, idempotent, priority, headers=self._get_auth_headers(token), **kwargs)
+        if response.status_code == 401:
+            logger.info("Token rejected, logging in again")
+            self._count('reauth')
+            token = self._refresh_token(rejected=token)
+            response = self._send(method, url, idempotent, priority, headers=self._get_auth_headers(token), **kwargs)
+        try:
+            response.raise_for_status()
+        except RequestException:
+            self._count('errors')
+            raise
+        return response.json()
+
     def get_all_tables(self) -> List:
         """
         获取所有表
         :return:
         """
-        table_describe_list = []
-        url = f"{self.config.base_url}/query/jdbc/table/list"
-        headers = self._get_auth_headers()
         params = {
             'dbName': self.config.phs_ads_db,
             'sourceId': self.config.source_id
         }
 
-        response = requests.get(
-            url=url,
-            params=params,
-            headers=headers,
-            verify=False,
-        ).json()
-        metadata = response['body']['metadata_list']
+        response = self._request('GET', '/query/jdbc/table/list', params=params)
         # 从metadata 提取表明及注释
-        for key, value in metadata.items():
-            table_name = key
-            table_describe = value['business_description']
-            table_describe_list.append((table_name, table_describe))
+        table_describe_list = parse_table_list(response)
         # df = pd.DataFrame(table_describe_list, columns=['表名', '注释'])
         # df.to_excel('table_describe2.xlsx', index=False)  # 保存为 Excel 文件
         return table_describe_list
 
-    def get_user_history(self):
-        headers = self._get_auth_headers()
-        url = f"{self.config.base_url}/query/history/list"
-        data = {
-            "page_num": 1,
-            "page_size": 10000,
-            "query": {
-                "engine": "jdbc",
-                "search": ""
+    def iter_history(self, page_size: int = 500, status: Optional[str] = 'SUCCEEDED') -> Iterator[Dict]:
+        """
+        逐页获取用户的查询历史，内存中只保留一页
+        :param status: 只返回该状态的记录，None 表示全部
+        """
+        page_num = 1
+        while True:
+            data = {
+                "page_num": page_num,
+                "page_size": page_size,
+                "query": {
+                    "engine": "jdbc",
+                    "search": ""
+                }
             }
-        }
+            items = self._request('POST', '/query/history/list', priority=PRIORITY_LOW, json=data)['body']['list']
+            for item in items:
+                if status is None or item['status'] == status:
+                    yield item
+            if len(items) < page_size:
+                return
+            page_num += 1
 
-        response = requests.post(
-            url=url,
-            json=data,
-            headers=headers,
-            verify=False,
-        ).json()
-        # response_list = response['body']['list']
-        query_list = []
-        for item in response['body']['list']:
-            # print(item['query_statement'])
-            if item['status'] == 'SUCCEEDED':
-                query_list.append(item['query_statement'])
-        # query_list 存入excel
-        df = pd.DataFrame(query_list, columns=['查询语句'])
-        df.to_excel('query_list.xlsx', index=False)  # 保存为 Excel 文件
+    def get_user_history(self, file_path: str = 'query_list.xlsx', page_size: int = 500) -> int:
+        """
+        把执行成功的历史查询语句逐页写入 Excel 文件
+        :return: 写入的语句条数
+        """
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['查询语句'])
+        count = 0
+        for item in self.iter_history(page_size):
+            sheet.append([item['query_statement']])
+            count += 1
+        workbook.save(file_path)
+        return count
+
+    def iter_pages(self, sql: str, page_size: int = 1000, key: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        分页执行查询，逐页返回结果
+
+        默认按 LIMIT/OFFSET 分页，原查询需要有确定的顺序（ORDER BY），否则分页之间可能重复或遗漏；
+        指定唯一的 key 列时按键集分页，每页只扫描 key 之后的记录，适合大结果集。
+        """
+        after, offset = None, 0
+        while True:
+            if key is None:
+                rows = self.sql_execute(offset_page_sql(sql, page_size, offset))
+            else:
+                rows = self.sql_execute(keyset_page_sql(sql, key, page_size, after))
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            offset += len(rows)
+            after = rows[-1][key] if key is not None else None
+
+    def iter_rows(self, sql: str, page_size: int = 1000, key: Optional[str] = None) -> Iterator[Dict]:
+        """分页执行查询并逐行返回结果，内存中只保留一页，分页方式见 iter_pages"""
+        for rows in self.iter_pages(sql, page_size, key):
+            yield from rows
+
+    def execute_columnar(self, sql: str, page_size: Optional[int] = None, key: Optional[str] = None,
+                         dtypes: Optional[Dict[str, str]] = None) -> ColumnarResult:
+        """
+        执行查询并返回列式结果
+
+        :param page_size: 指定时分页获取，每页转换为列后即释放，不会同时持有全部行
+        :param key: 按键集分页的唯一列，见 iter_pages
+        :param dtypes: 列名到 SQL 类型的映射，如 schema_dtypes(snapshot[table])；未列出的列按值推断类型
+        """
+        if page_size is None:
+            return ColumnarResult.from_rows(self.sql_execute(sql), dtypes)
+        return ColumnarResult.from_pages(self.iter_pages(sql, page_size, key), dtypes)
 
     def sql_execute(self, sql):
         """
         执行sql语句
+
+        同一进程内同时执行的相同只读语句（同一个库、规范化后相同）只发出一次请求，
+        后到的调用等待并共享结果或异常；写语句每次都会执行。
          :return:
          """
-        url = f"{self.config.base_url}/query/jdbc"
-        payload = {
-            'sql': sql,
-            'db_name': self.config.phs_ads_db,
-            'source_id': self.config.source_id,
-            'export': False
-        }
-        result = requests.post(url=url, json=payload, headers=self._get_auth_headers()).json()
+        key = self._result_key(sql)
+        if key is None:
+            return self._sql_request(sql)
+        leader = []
+
+        def run():
+            leader.append(True)
+            self._count('sql_executions')
+            return self._sql_request(sql)
+
+        rows = sql_flights.do(key, run)
+        return self._copy_rows(rows) if leader else self._coalesced(rows)
+
+    def _sql_request(self, sql: str) -> List[Dict]:
+        result = self._request('POST', '/query/jdbc', idempotent=is_read_only_sql(sql),
+                               json=self._sql_payload(sql))
         return result['body'].get('rows', []) if result else []
 
+    def explain(self, sql: str) -> QueryPlan:
+        """
+        EXPLAIN 查询语句，返回使用的索引、预估行数和全表扫描的表
+        """
+        start = time.perf_counter()
+        rows = self.sql_execute("EXPLAIN " + sql.strip().rstrip(";"))
+        return build_plan(sql, rows, time.perf_counter() - start)
+
+    def check_plan(self, sql: str, policy: PlanPolicy) -> Optional[QueryPlan]:
+        """
+        EXPLAIN 预检，执行计划不符合 policy 时抛出 QueryValidationError
+
+        EXPLAIN 本身失败（如语句不支持 EXPLAIN）时放行并返回 None，预检不会阻断查询。
+        """
+        try:
+            plan = self.explain(sql)
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed, skipping plan check: {e}")
+            return None
+        logger.info(f"Plan: indexes {plan.indexes_used}, estimated rows {plan.estimated_rows}, "
+                    f"full scans {plan.full_scans}")
+        return policy.check(plan)
+
+    def execute_query(self, sql: str, use_cache: bool = True, plan_policy: Optional[PlanPolicy] = None) -> SQLResult:
+        """
+        执行查询并缓存结果
+
+        只读语句的结果按 SQL 指纹缓存，只在空白、大小写和注释上不同的语句共用一份结果。
+        :param use_cache: 为 False 时跳过缓存读取，但仍会写入新结果
+        :param plan_policy: 指定时在执行前做 EXPLAIN 预检（见 check_plan），模型生成的 SQL 应当指定；命中缓存时不检查
+        :return: SQLResult，execution_time 为本次调用的耗时（秒），命中缓存时 cache_hit 为 True
+        """
+        start = time.perf_counter()
+        key = self._result_key(sql)
+        if key is not None and use_cache:
+            rows = self.result_cache.get(key)
+            if rows is not None:
+                return SQLResult(sql=sql, result=self._copy_rows(rows), execution_time=time.perf_counter() - start,
+                                 cache_hit=True)
+        if plan_policy is not None:
+            self.check_plan(sql, plan_policy)
+        rows = self.sql_execute(sql)
+        if key is not None:
+            # 缓存在进程内保留写入的对象，写入副本以免调用方修改返回的结果
+            self.result_cache.set(key, self._copy_rows(rows), ttl=self.config.result_cache_ttl)
+        return SQLResult(sql=sql, result=rows, execution_time=time.perf_counter() - start)
+
     def get_table_ddl(self, table_name):
         # table_ddls = []
         query_table = self.sql_execute(f"show create table {table_name}")
@@ -185,9 +461,65 @@ class DatabaseManager:
         table_data = self.get_sample_table(table_name, limit)
         # print(f"表名：{table_name}\n表结构：{table_ddl}\n示例数据：{table_data}")
         # 将表结构和示例数据存入组装成str然后返回
-        table_info = f"表名：{table_name}\n表结构：{table_ddl}\n示例数据：{table_data}"
+        table_info = format_table_info(table_name, table_ddl, table_data)
         return table_info
 
+    def get_tables_info(self, table_names: List[str], limit: int = 2,
+                        max_workers: Optional[int] = None) -> Dict[str, str]:
+        """
+        批量获取多张表的结构及示例数据
+
+        每张表的 DDL 和示例数据各是一个请求，全部请求并发执行，同时进行的请求数不超过
+        max_workers（默认 config.fetch_concurrency）。任一请求失败时抛出该异常。
+        :return: {表名: 与 get_table_info 相同格式的描述}，按传入顺序
+        """
+        tables = list(dict.fromkeys(table_names))
+        if not tables:
+            return {}
+        workers = min(max_workers or self.config.fetch_concurrency, 2 * len(tables))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="table-info") as executor:
+            ddls = {table: executor.submit(self.get_table_ddl, table) for table in tables}
+            samples = {table: executor.submit(self.get_sample_table, table, limit) for table in tables}
+            return {table: format_table_info(table, ddls[table].result(), samples[table].result())
+                    for table in tables}
+
+    def get_samples(self, table_names: List[str], limit: int = 2) -> Dict[str, List[Dict]]:
+        """
+        并发获取多张表的示例数据，同时进行的请求数不超过 config.fetch_concurrency
+        :return: {表名: 示例数据}，按传入顺序
+        """
+        tables = list(dict.fromkeys(table_names))
+        if not tables:
+            return {}
+        workers = min(self.config.fetch_concurrency, len(tables))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="table-info") as executor:
+            futures = {table: executor.submit(self.get_sample_table, table, limit) for table in tables}
+            return {table: future.result() for table, future in futures.items()}
+
+    def get_schema_snapshot(self, table_names: Optional[List[str]] = None) -> Dict[str, TableSchema]:
+        """
+        通过 information_schema 获取表、字段和索引信息，三条查询并发执行
+        :param table_names: 只获取这些表，不传则获取整个库
+        :return: {表名: TableSchema}
+        """
+        queries = snapshot_queries(self.config.phs_ads_db, table_names)
+        with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="schema") as executor:
+            return build_snapshot(*executor.map(self.sql_execute, queries))
+
+    def describe_tables(self, table_names: Optional[List[str]] = None, limit: int = 2) -> Dict[str, str]:
+        """
+        批量生成表描述：表结构由 information_schema 在本地组装，示例数据按表并发获取
+
+        与逐表 show create table 相比只多出每张表一个示例数据请求，limit=0 时不获取示例数据。
+        DDL 由 render_ddl 生成，省略了字符集、自增值等选项。
+        :return: {表名: 与 get_table_info 相同格式的描述}
+        """
+        snapshot = self.get_schema_snapshot(table_names)
+        tables = [table for table in (table_names or snapshot) if table in snapshot]
+        samples = self.get_samples(tables, limit) if limit else {}
+        return {table: format_table_info(table, render_ddl(snapshot[table]), samples.get(table, []))
+                for table in tables}
+
 
 if __name__ == '__main__':
     dbtools = DatabaseManager()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+分页查询语句
+
+原查询作为子查询包一层，不需要解析原语句；原语句自带的 LIMIT/ORDER BY 仍然生效。
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+from database.schema import IDENTIFIER
+
+
+def _strip(sql: str) -> str:
+    return sql.strip().rstrip(";").strip()
+
+
+def sql_literal(value: Any) -> str:
+    """把 Python 值转换成 SQL 字面量"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def offset_page_sql(sql: str, limit: int, offset: int) -> str:
+    """LIMIT/OFFSET 分页"""
+    return f"SELECT * FROM ({_strip(sql)}) AS _page LIMIT {int(limit)} OFFSET {int(offset)}"
+
+
+def keyset_page_sql(sql: str, key: str, limit: int, after: Optional[Any] = None) -> str:
+    """
+    按 key 列的键集分页：每页取 key 大于上一页最后一行的记录
+
+    key 列的值需要唯一，否则页边界上相同的值会被跳过。
+    """
+    if not IDENTIFIER.match(key):
+        raise ValueError(f"Invalid key column: {key}")
+    where = f" WHERE `{key}` > {sql_literal(after)}" if after is not None else ""
+    return f"SELECT * FROM ({_strip(sql)}) AS _page{where} ORDER BY `{key}` LIMIT {int(limit)}"
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+压缩提供给模型的示例数据
+
+接口返回的示例行里有很长的 JSON 数组、正文和审计字段，原样放进提示词会占用大量 token。
+这里把示例行渲染成紧凑的表格：列名只出现一次，去掉全部为空的列和审计字段，
+JSON 数组只保留第一个元素，过长的值截断，每张表的示例数据不超过固定字节数。
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+# 单个值保留的最大字符数，放不下时最短缩到 MIN_CHARS
+SAMPLE_MAX_CHARS = 64
+MIN_CHARS = 16
+# 每张表示例数据的最大字节数（UTF-8）
+SAMPLE_MAX_BYTES = 1024
+# 与查询无关的审计字段，不放进示例数据（表结构中仍然保留）
+AUDIT_COLUMNS = frozenset({"created_ts", "updated_ts", "created_by", "updated_by"})
+
+ELLIPSIS = "…"
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == "[]" or value == "{}"
+
+
+def compact_value(value: Any, max_chars: int = SAMPLE_MAX_CHARS) -> str:
+    """
+    把单个值转换成紧凑的文本：JSON 数组只保留第一个元素，超过 max_chars 的部分截断
+    """
+    if value is None:
+        return "NULL"
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if text[:1] == "[" and text[-1:] == "]":
+        try:
+            items = json.loads(text)
+        except ValueError:
+            items = None
+        if isinstance(items, list) and len(items) > 1:
+            text = json.dumps(items[:1], ensure_ascii=False)[:-1] + ", " + ELLIPSIS + "]"
+    text = " ".join(text.split()).replace("|", "/")
+    return text if len(text) <= max_chars else text[:max_chars] + ELLIPSIS
+
+
+def sample_columns(rows: List[Dict], omit: Iterable[str] = AUDIT_COLUMNS) -> List[str]:
+    """示例行中出现过的列（按首次出现的顺序），去掉审计字段和所有行都为空的列"""
+    omit = set(omit)
+    columns = {}
+    for row in rows:
+        for name, value in row.items():
+            if name not in omit and not _is_empty(value):
+                columns[name] = True
+    return list(columns)
+
+
+def _render(columns: List[str], rows: List[Dict], max_chars: int, max_bytes: int) -> Optional[str]:
+    """按列渲染表格，放不下第一行时返回 None"""
+    lines = [" | ".join(columns)]
+    size = len(lines[0].encode("utf-8"))
+    for row in rows:
+        line = " | ".join(compact_value(row.get(name), max_chars) for name in columns)
+        size += len(line.encode("utf-8")) + 1
+        if size > max_bytes:
+            break
+        lines.append(line)
+    return "\n".join(lines) if len(lines) > 1 else None
+
+
+def compact_samples(rows: List[Dict], max_chars: int = SAMPLE_MAX_CHARS, max_bytes: int = SAMPLE_MAX_BYTES,
+                    omit: Iterable[str] = AUDIT_COLUMNS) -> str:
+    """
+    把示例行渲染成紧凑的表格：第一行是列名，之后每行一条记录，列之间用 " | " 分隔
+
+    放不下的行直接丢弃；第一行也放不下时先逐步缩短每个值（不短于 MIN_CHARS），
+    仍放不下时去掉靠后的列并注明省略的列数（完整的列见表结构）。
+    :return: 表格文本，没有示例数据时返回空字符串
+    """
+    columns = sample_columns(rows, omit)
+    if not columns:
+        return ""
+    while True:
+        text = _render(columns, rows, max_chars, max_bytes)
+        if text is not None:
+            return text
+        if max_chars <= MIN_CHARS:
+            break
+        max_chars = max(max_chars // 2, MIN_CHARS)
+    for keep in range(len(columns) - 1, 0, -1):
+        note = f"\n（另有 {len(columns) - keep} 列未列出）"
+        text = _render(columns[:keep], rows, max_chars, max_bytes - len(note.encode("utf-8")))
+        if text is not None:
+            return text + note
+    text = _render(columns[:1], rows[:1], max_chars, float("inf"))
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore") + ELLIPSIS
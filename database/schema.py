@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+通过 information_schema 批量获取整个库的表结构
+
+TABLES、COLUMNS、STATISTICS 三条查询即可拿到所有表的注释、字段和索引，
+再在本地组装成与 show create table 等价的 DDL，不需要逐表请求。
+"""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from schemas.models import ColumnInfo, IndexInfo, TableSchema
+
+IDENTIFIER = re.compile(r'^\w+$')
+
+TABLES_SQL = """
+SELECT TABLE_NAME AS table_name, TABLE_COMMENT AS table_comment, ENGINE AS engine, TABLE_ROWS AS table_rows,
+       CREATE_TIME AS create_time, UPDATE_TIME AS update_time
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = '{db}' AND TABLE_TYPE = 'BASE TABLE'{filter}
+ORDER BY TABLE_NAME
+"""
+
+COLUMNS_SQL = """
+SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type,
+       IS_NULLABLE AS is_nullable, COLUMN_DEFAULT AS column_default, COLUMN_KEY AS column_key,
+       EXTRA AS extra, COLUMN_COMMENT AS column_comment
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = '{db}'{filter}
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+STATISTICS_SQL = """
+SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, NON_UNIQUE AS non_unique, COLUMN_NAME AS column_name
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = '{db}'{filter}
+ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+"""
+
+
+def snapshot_queries(db_name: str, tables: Optional[Iterable[str]] = None) -> Tuple[str, str, str]:
+    """
+    生成获取表、字段、索引信息的三条查询
+    :param tables: 只获取这些表，不传则获取整个库
+    """
+    names = [db_name] + list(tables or [])
+    invalid = [name for name in names if not IDENTIFIER.match(name)]
+    if invalid:
+        raise ValueError(f"Invalid table name: {', '.join(invalid)}")
+    where = ""
+    if tables:
+        where = " AND TABLE_NAME IN ({})".format(", ".join(f"'{name}'" for name in tables))
+    return tuple(sql.format(db=db_name, filter=where).strip() for sql in (TABLES_SQL, COLUMNS_SQL, STATISTICS_SQL))
+
+
+def _to_int(value) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+def _to_str(value) -> Optional[str]:
+    return str(value) if value not in (None, "") else None
+
+
+def build_snapshot(table_rows: List[Dict], column_rows: List[Dict],
+                   statistics_rows: List[Dict]) -> Dict[str, TableSchema]:
+    """
+    把三条查询的结果组装成每张表的结构
+    :return: {表名: TableSchema}，按表名排序
+    """
+    columns: Dict[str, List[ColumnInfo]] = defaultdict(list)
+    for row in column_rows:
+        columns[row['table_name']].append(ColumnInfo(
+            name=row['column_name'],
+            type=row['column_type'],
+            nullable=row['is_nullable'] == 'YES',
+            default=_to_str(row.get('column_default')),
+            key=row.get('column_key') or "",
+            extra=row.get('extra') or "",
+            comment=row.get('column_comment') or "",
+        ))
+
+    indexes: Dict[str, Dict[str, IndexInfo]] = defaultdict(dict)
+    for row in statistics_rows:
+        table_indexes = indexes[row['table_name']]
+        index = table_indexes.get(row['index_name'])
+        if index is None:
+            index = table_indexes[row['index_name']] = IndexInfo(
+                name=row['index_name'], columns=[], unique=str(row['non_unique']) == '0')
+        index.columns.append(row['column_name'])
+
+    return {row['table_name']: TableSchema(
+        name=row['table_name'],
+        comment=row.get('table_comment') or "",
+        engine=row.get('engine'),
+        table_rows=_to_int(row.get('table_rows')),
+        create_time=_to_str(row.get('create_time')),
+        update_time=_to_str(row.get('update_time')),
+        columns=columns.get(row['table_name'], []),
+        indexes=list(indexes.get(row['table_name'], {}).values()),
+    ) for row in table_rows}
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _render_column(column: ColumnInfo) -> str:
+    parts = [f"`{column.name}`", column.type]
+    if not column.nullable:
+        parts.append("NOT NULL")
+    if column.default is not None:
+        is_expression = column.default.upper().startswith("CURRENT_TIMESTAMP")
+        parts.append("DEFAULT " + (column.default if is_expression else _quote(column.default)))
+    elif column.nullable:
+        parts.append("DEFAULT NULL")
+    extra = column.extra.replace("DEFAULT_GENERATED", "").strip()
+    if extra:
+        parts.append(extra)
+    if column.comment:
+        parts.append("COMMENT " + _quote(column.comment))
+    return " ".join(parts)
+
+
+def _render_index(index: IndexInfo) -> str:
+    columns = ",".join(f"`{name}`" for name in index.columns)
+    if index.name == "PRIMARY":
+        return f"PRIMARY KEY ({columns})"
+    return f"{'UNIQUE KEY' if index.unique else 'KEY'} `{index.name}` ({columns})"
+
+
+def render_ddl(table: TableSchema) -> str:
+    """由表结构生成 CREATE TABLE 语句（不含字符集、自增值等与查询无关的选项）"""
+    lines = [_render_column(column) for column in table.columns]
+    lines += [_render_index(index) for index in sorted(table.indexes, key=lambda i: i.name != "PRIMARY")]
+    ddl = f"CREATE TABLE `{table.name}` (\n  " + ",\n  ".join(lines) + "\n)"
+    if table.engine:
+        ddl += f" ENGINE={table.engine}"
+    if table.comment:
+        ddl += " COMMENT=" + _quote(table.comment)
+    return ddl
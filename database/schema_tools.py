@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+agent 共用的表结构和查询工具
+
+表结构优先读本地表结构目录，目录中没有时走命名空间缓存，未命中的表一次性并发拉取；
+目录、缓存都按 DatabaseManager 的接口地址区分。
+"""
+from functools import partial
+from typing import Dict, List, Tuple
+
+from database.catalog import SchemaCatalog, catalog_file
+from database.explain import PlanPolicy
+from database.manager import DatabaseManager
+from schemas.models import SQLResult
+from utils.cache import get_cache
+
+
+class SchemaTools:
+    """按接口地址创建的表结构目录、缓存和执行计划策略"""
+
+    def __init__(self, db_manager: DatabaseManager):
+        base_url = db_manager.config.base_url
+        self.db_manager = db_manager
+        self.table_list_cache = get_cache("table_list", base_url=base_url)
+        self.table_info_cache = get_cache("table_info", base_url=base_url)
+        # 本地表结构目录，通过 python -m database.catalog refresh 预热
+        self.schema_catalog = SchemaCatalog(catalog_file(base_url))
+        # 执行模型生成的 SQL 前检查执行计划
+        self.plan_policy = PlanPolicy()
+
+    def get_all_tables(self) -> List[Tuple[str, str]]:
+        """所有表及其描述"""
+        return (self.schema_catalog.get_all_tables()
+                or self.table_list_cache.get_or_compute("all_tables", self.db_manager.get_all_tables))
+
+    def get_tables_info(self, tables: List[str]) -> Dict[str, str]:
+        """多张表的结构和示例数据，按传入顺序"""
+        return self.schema_catalog.get_tables_info(tables, fallback=partial(
+            self.table_info_cache.get_or_compute_many, fn=self.db_manager.get_tables_info,
+            refresh=self.db_manager.get_table_info))
+
+    def execute_query(self, query: str) -> SQLResult:
+        """执行前做 EXPLAIN 预检，执行计划不符合策略时抛出 QueryValidationError"""
+        return self.db_manager.execute_query(query, plan_policy=self.plan_policy)
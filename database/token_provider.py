@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+进程内的数据目录访问令牌
+
+token 保存在内存中，按 JWT payload 中的 exp 判断有效期（不是 JWT 时使用默认有效期），
+并在过期前由后台线程提前刷新，请求线程只读取内存，不需要等待登录，也不会拿到过期的 token。
+刷新后的 token 同时写入 auth 缓存，新启动的进程可以直接复用。
+每个数据目录接口地址和用户各有一个 TokenProvider（见 get_token_provider），互不共用 token。
+"""
+import base64
+import binascii
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+# 距离过期不足该时间的 token 视为已过期，避免请求途中过期
+EXPIRY_SKEW = timedelta(seconds=10)
+# 两次后台登录之间的最短间隔，token 有效期过短或已过期时也不会反复登录
+MIN_REFRESH_INTERVAL = timedelta(seconds=30)
+# 后台登录失败或拿到的 token 不比当前的新时按指数退避，最长间隔
+MAX_RETRY_INTERVAL = timedelta(minutes=10)
+
+
+def jwt_expiry(token: str) -> Optional[datetime]:
+    """读取 JWT payload 中的 exp（本地时间），不是 JWT 或没有 exp 时返回 None；不校验签名"""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+        return datetime.fromtimestamp(float(payload["exp"]))
+    except (ValueError, KeyError, TypeError, binascii.Error, OverflowError, OSError):
+        # exp 超出 datetime 的范围时 fromtimestamp 抛出 OverflowError/OSError
+        return None
+
+
+class TokenProvider:
+    """
+    内存中的 token 及其后台刷新
+
+    :param store: 返回持久化缓存的函数（CacheManager），首次读取时从中恢复 token，刷新后写回
+    :param refresh_margin: 在过期前多久刷新；token 有效期较短时最多提前有效期的 1/5
+    :param default_ttl: 不是 JWT 的 token 的有效期
+    :param key: token 在持久化缓存中的键
+    """
+
+    def __init__(self, store: Optional[Callable[[], object]] = None,
+                 refresh_margin: timedelta = timedelta(minutes=5), default_ttl: timedelta = timedelta(hours=12),
+                 key: str = "token"):
+        self.key = key
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._store = store
+        self._lock = threading.Lock()
+        self._login_lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at: Optional[datetime] = None
+        self._seeded = False
+        self._login: Optional[Callable[[], str]] = None
+        self._timer: Optional[threading.Timer] = None
+        self._retries = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    @property
+    def expires_at(self) -> Optional[datetime]:
+        return self._expires_at
+
+    def _seed(self) -> None:
+        """从持久化缓存中恢复 token，每个进程只读取一次"""
+        self._seeded = True
+        token = self._store().get(self.key) if self._store else None
+        if token:
+            self._expires_at = jwt_expiry(token) or datetime.now() + self.default_ttl
+            self._token = token
+
+    def peek(self) -> Optional[str]:
+        """当前有效的 token，不会发起登录"""
+        with self._lock:
+            if not self._seeded:
+                self._seed()
+            if self._token and self._expires_at - EXPIRY_SKEW > datetime.now():
+                return self._token
+            return None
+
+    def get(self, login: Callable[[], str]) -> str:
+        """当前有效的 token；没有时调用 login 登录，并发的调用只会登录一次"""
+        token = self.peek()
+        if token:
+            return token
+        with self._login_lock:
+            token = self.peek()
+            if token:
+                return token
+            token = login()
+            self.set(token)
+            return token
+
+    def set(self, token: str) -> None:
+        """保存新 token，写入持久化缓存并安排下一次后台刷新"""
+        now = datetime.now()
+        expires_at = jwt_expiry(token) or now + self.default_ttl
+        with self._lock:
+            self._token, self._expires_at, self._seeded = token, expires_at, True
+        if self._store and expires_at > now:
+            self._store().set(self.key, token, ttl=expires_at - now)
+        self._schedule(expires_at - min(self.refresh_margin, (expires_at - now) / 5) - now)
+
+    def invalidate(self, rejected: Optional[str]) -> None:
+        """
+        服务端拒绝了 rejected，从内存和持久化缓存中删除；内存中已经是其他 token 时说明别的线程刷新过了，不做处理
+        """
+        with self._lock:
+            if not self._seeded:
+                self._seed()
+            if rejected is not None and self._token != rejected:
+                return
+            self._token = self._expires_at = None
+        # 其他进程可能已经写入了新 token
+        if self._store and (rejected is None or self._store().get(self.key) == rejected):
+            self._store().delete(self.key)
+
+    def start(self, login: Callable[[], str], default_ttl: Optional[timedelta] = None) -> None:
+        """
+        注册后台刷新使用的登录函数（后注册的覆盖先注册的）并安排刷新；内存中没有有效 token 时立即在后台登录
+        """
+        if default_ttl is not None:
+            self.default_ttl = default_ttl
+        self._login = login
+        with self._lock:
+            if not self._seeded:
+                self._seed()
+            expires_at = self._expires_at
+        if expires_at is None:
+            self._schedule(timedelta(0), clamp=False)
+        elif self._timer is None:
+            self._schedule(expires_at - self.refresh_margin - datetime.now())
+
+    def stop(self) -> None:
+        """取消后台刷新"""
+        with self._lock:
+            timer, self._timer, self._login = self._timer, None, None
+        if timer:
+            timer.cancel()
+
+    def _schedule(self, delay: timedelta, clamp: bool = True) -> None:
+        """在 delay 后后台刷新；clamp 时至少等待 MIN_REFRESH_INTERVAL"""
+        if self._login is None:
+            return
+        if clamp:
+            delay = max(delay, MIN_REFRESH_INTERVAL)
+        timer = threading.Timer(max(delay.total_seconds(), 0), self._refresh)
+        timer.daemon = True
+        with self._lock:
+            previous, self._timer = self._timer, timer
+        if previous:
+            previous.cancel()
+        timer.start()
+
+    def _refresh(self) -> None:
+        """后台刷新；失败时退避重试，请求线程继续使用尚未过期的旧 token"""
+        login = self._login
+        if login is None:
+            return
+        try:
+            with self._login_lock:
+                token = login()
+                now = datetime.now()
+                expires_at = jwt_expiry(token) or now + self.default_ttl
+                current = self._expires_at
+                if expires_at - EXPIRY_SKEW <= now or (current is not None and expires_at <= current):
+                    raise ValueError(f"login returned a token expiring at {expires_at:%Y-%m-%d %H:%M:%S}")
+                self.set(token)
+        except Exception as e:
+            self.failures += 1
+            self._retries += 1
+            delay = min(MIN_REFRESH_INTERVAL * 2 ** (self._retries - 1), MAX_RETRY_INTERVAL)
+            remaining = (self._expires_at - datetime.now()) if self._expires_at else timedelta(0)
+            if remaining > EXPIRY_SKEW:
+                # 旧 token 过期前至少再试一次
+                delay = min(delay, remaining / 2)
+            logger.warning(f"Background token refresh failed ({e}), retry in {delay.total_seconds():.0f}s")
+            self._schedule(delay)
+        else:
+            self._retries = 0
+            self.refreshes += 1
+            logger.info(f"Token refreshed in background, expires at {self._expires_at:%Y-%m-%d %H:%M:%S}")
+
+
+_providers: Dict[Tuple[str, str], TokenProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def token_key(base_url: str, username: Optional[str]) -> str:
+    """token 在 auth 缓存中的键"""
+    return f"token:{base_url.rstrip('/')}:{username or ''}"
+
+
+def get_token_provider(base_url: str, username: Optional[str]) -> TokenProvider:
+    """
+    数据目录接口地址和用户对应的 TokenProvider（进程内共享），token 保存在该接口的 auth 缓存中
+    """
+    key = (base_url.rstrip("/"), username or "")
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = TokenProvider(store=lambda: get_cache("auth", base_url=base_url),
+                                                       key=token_key(base_url, username))
+        return provider
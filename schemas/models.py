@@ -8,6 +8,8 @@ class QueryPlan(BaseModel):
     explain_result: Dict
     execution_time: float
     indexes_used: List[str]
+    estimated_rows: Optional[float] = None
+    full_scans: Dict[str, float] = {}  # 全表扫描的表及其预估行数
 
 class IntentAnalysis(BaseModel):
     intent: str
@@ -19,4 +21,28 @@ class SQLResult(BaseModel):
     sql: str
     result: List[Dict]
     execution_time: float
-    cache_hit: bool = False
\ No newline at end of file
+    cache_hit: bool = False
+
+class ColumnInfo(BaseModel):
+    name: str
+    type: str
+    nullable: bool = True
+    default: Optional[str] = None
+    key: str = ""
+    extra: str = ""
+    comment: str = ""
+
+class IndexInfo(BaseModel):
+    name: str
+    columns: List[str]
+    unique: bool = False
+
+class TableSchema(BaseModel):
+    name: str
+    comment: str = ""
+    engine: Optional[str] = None
+    table_rows: Optional[int] = None
+    create_time: Optional[str] = None
+    update_time: Optional[str] = None
+    columns: List[ColumnInfo] = []
+    indexes: List[IndexInfo] = []
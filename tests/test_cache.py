@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+缓存管理器单元测试
+"""
+
+import os
+import sys
+import time
+import pickle
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+import utils.cache
+from utils.cache import CacheManager, CompressedValue, get_cache
+from utils.cache_backends import SQLiteBackend
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return tmp_path / "cache.db"
+
+
+@pytest.fixture(params=["pickle", "sqlite"])
+def backend_name(request):
+    return request.param
+
+
+class TestCacheManager:
+    """CacheManager 基础行为测试"""
+
+    def test_set_get_delete(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        cache.set("user", "renjiajia")
+        assert cache.exists("user")
+        assert cache.get("user") == "renjiajia"
+        cache.delete("user")
+        assert cache.get("user") is None
+        assert not cache.exists("user")
+
+    def test_expired_entry_is_ignored(self, cache_file):
+        with open(cache_file, "wb") as f:
+            pickle.dump({"old": {"value": 1, "expiry": datetime.now() - timedelta(seconds=1)}}, f)
+        cache = CacheManager(cache_file=cache_file, backend="pickle")
+        assert cache.get("old") is None
+        assert not cache.exists("old")
+
+    def test_reads_are_served_from_memory(self, cache_file, monkeypatch):
+        cache = CacheManager(cache_file=cache_file, backend="pickle")
+        cache.set("all_tables", [("ads_phs_drug", "药物")])
+
+        loads = []
+        real_load = pickle.load
+        monkeypatch.setattr(pickle, "load", lambda f: loads.append(1) or real_load(f))
+        for _ in range(10):
+            assert cache.exists("all_tables")
+            assert cache.get("all_tables") == [("ads_phs_drug", "药物")]
+        assert loads == []
+
+    def test_revalidates_after_external_write(self, cache_file, backend_name):
+        reader = CacheManager(cache_file=cache_file, backend=backend_name)
+        writer = CacheManager(cache_file=cache_file, backend=backend_name)
+        assert reader.get("ads_phs_drug") is None
+        writer.set("ads_phs_drug", "表名：ads_phs_drug")
+        assert reader.get("ads_phs_drug") == "表名：ads_phs_drug"
+        writer.delete("ads_phs_drug")
+        assert reader.get("ads_phs_drug") is None
+
+
+class TestLimits:
+    """有效期、整理与 LRU 淘汰"""
+
+    def test_per_key_ttl(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        cache.set("token", "abc", ttl=timedelta(seconds=-1))
+        cache.set("all_tables", ["ads_phs_drug"])
+        assert cache.get("token") is None
+        assert cache.get("all_tables") == ["ads_phs_drug"]
+
+    def test_compact_drops_expired(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        for i in range(5):
+            cache.set(f"old{i}", i, ttl=timedelta(seconds=-1))
+        cache.set("fresh", 1)
+        assert cache.compact() == (5, 0)
+        assert cache.backend.usage()[0] == 1
+
+    def test_lru_eviction_by_count(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, max_entries=3, compact_every=1)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+        cache.get("a")
+        cache.set("d", "d")
+        assert cache.get("b") is None
+        assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+
+    def test_compaction_keeps_access_times(self, cache_file, backend_name):
+        # 整理时没有删除任何缓存项，也要保留期间的访问记录
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, max_entries=3, compact_every=100)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+        cache.get("a")
+        assert cache.compact() == (0, 0)
+        cache.set("d", "d")
+        assert cache.compact() == (0, 1)
+        assert cache.get("b") is None
+        assert cache.get("a") == "a"
+
+    def test_eviction_by_bytes(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, max_bytes=4096, compact_every=1)
+        for i in range(8):
+            cache.set(f"t{i}", "x" * 1000)
+        count, total = cache.backend.usage()
+        assert total <= 4096
+        assert cache.get("t7") == "x" * 1000
+        assert cache.get("t0") is None
+
+
+class TestBatch:
+    """get_many / set_many"""
+
+    def test_set_many_get_many(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        cache.set_many({"t1": "ddl1", "t2": "ddl2"})
+        cache.set("t3", "ddl3", ttl=timedelta(seconds=-1))
+        assert cache.get_many(["t1", "t2", "t3", "t4"]) == {"t1": "ddl1", "t2": "ddl2"}
+
+    def test_batch_uses_one_load_and_one_write(self, cache_file, monkeypatch):
+        cache = CacheManager(cache_file=cache_file, backend="pickle")
+        cache.set("t1", "ddl1")
+        cache.invalidate()
+
+        loads, dumps = [], []
+        real_load, real_dump = pickle.load, pickle.dump
+        monkeypatch.setattr(pickle, "load", lambda f: loads.append(1) or real_load(f))
+        monkeypatch.setattr(pickle, "dump", lambda *a, **kw: dumps.append(1) or real_dump(*a, **kw))
+        assert cache.get_many(["t1", "t2", "t3", "t4"]) == {"t1": "ddl1"}
+        cache.set_many({"t2": "ddl2", "t3": "ddl3", "t4": "ddl4"})
+        assert (len(loads), len(dumps)) == (1, 1)
+
+    def test_get_or_compute_many_fetches_misses_in_one_call(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        cache.set("t2", "ddl2")
+        calls = []
+
+        def fetch(tables):
+            calls.append(tables)
+            return {table: "ddl" + table[1:] for table in tables}
+
+        assert cache.get_or_compute_many(["t3", "t2", "t1", "t3"], fetch) == {"t3": "ddl3", "t2": "ddl2", "t1": "ddl1"}
+        assert list(cache.get_or_compute_many(["t1", "t2", "t3"], fetch)) == ["t1", "t2", "t3"]
+        assert calls == [["t3", "t1"]]
+
+
+class TestGetOrCompute:
+    """get_or_compute 与并发未命中合并"""
+
+    def test_computes_once_and_caches(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        calls = []
+        fetch = lambda: calls.append(1) or "表名：ads_phs_drug"
+        assert cache.get_or_compute("ads_phs_drug", fetch) == "表名：ads_phs_drug"
+        assert cache.get_or_compute("ads_phs_drug", fetch) == "表名：ads_phs_drug"
+        assert len(calls) == 1
+
+    def test_concurrent_thread_misses_share_one_fetch(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite")
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "ddl"
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: cache.get_or_compute("ads_phs_ct", slow_fetch), range(8)))
+        assert results == ["ddl"] * 8
+        assert len(calls) == 1
+
+    def test_concurrent_batches_fetch_each_key_once(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite")
+        fetched, lock = [], threading.Lock()
+
+        def slow_fetch(tables):
+            with lock:
+                fetched.extend(tables)
+            time.sleep(0.2)
+            return {table: "ddl_" + table for table in tables}
+
+        batches = [["t1", "t2"], ["t2", "t3"], ["t1", "t2", "t3"], ["t3"]] * 2
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda tables: cache.get_or_compute_many(tables, slow_fetch), batches))
+            # 单键的 get_or_compute 同样等待批量计算中的键
+            assert pool.submit(cache.get_or_compute, "t1", lambda: "other").result() == "ddl_t1"
+        assert results == [{table: "ddl_" + table for table in tables} for tables in batches]
+        assert sorted(fetched) == ["t1", "t2", "t3"]
+
+    def test_errors_are_shared_and_not_cached(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite")
+
+        def failing():
+            time.sleep(0.1)
+            raise RuntimeError("catalog down")
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(cache.get_or_compute, "all_tables", failing) for _ in range(4)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+        assert not cache.exists("all_tables")
+
+    def test_asyncio_tasks_and_threads_share_one_fetch(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite")
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return ["ads_phs_drug"]
+
+        async def main():
+            thread_result = []
+            worker = threading.Thread(
+                target=lambda: thread_result.append(cache.get_or_compute("all_tables", slow_fetch)))
+            tasks = [cache.aget_or_compute("all_tables", slow_fetch) for _ in range(5)]
+            gathered = asyncio.gather(*tasks)
+            await asyncio.sleep(0.05)
+            worker.start()
+            results = await gathered
+            await asyncio.to_thread(worker.join)
+            return results + thread_result
+
+        assert asyncio.run(main()) == [["ads_phs_drug"]] * 6
+        assert len(calls) == 1
+
+    def test_cancelled_leader_does_not_fail_waiters(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite")
+        calls = []
+
+        async def slow_fetch():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return ["ads_phs_drug"]
+
+        async def main():
+            leader = asyncio.ensure_future(cache.aget_or_compute("all_tables", slow_fetch))
+            await asyncio.sleep(0.05)
+            follower = asyncio.ensure_future(cache.aget_or_compute("all_tables", slow_fetch))
+            worker = ThreadPoolExecutor(1).submit(cache.get_or_compute, "all_tables", lambda: ["other"])
+            await asyncio.sleep(0.05)
+            # 取消 leader 和一个等待方都不影响在途调用
+            leader.cancel()
+            cancelled = asyncio.ensure_future(cache.aget_or_compute("all_tables", slow_fetch))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await follower, await asyncio.wrap_future(worker)
+
+        assert asyncio.run(main()) == (["ads_phs_drug"], ["ads_phs_drug"])
+        assert len(calls) == 1 and cache.get("all_tables") == ["ads_phs_drug"]
+
+
+class TestStats:
+    """缓存统计"""
+
+    def test_counters_are_split_by_prefix(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, max_entries=2)
+        cache.set("token", "abc", ttl=timedelta(seconds=-1))
+        cache.set("ads_phs_drug", "ddl")
+        cache.get("token")
+        cache.get("ads_phs_drug")
+        cache.get_many(["ads_phs_drug", "ads_phs_ct"])
+        cache.set("ads_phs_ct", "ddl")
+        cache.set("ads_phs_ct2", "ddl")
+        assert cache.compact() == (1, 1)
+
+        stats = cache.stats()
+        assert stats["prefixes"]["token"]["misses"] == 1
+        assert stats["prefixes"]["token"]["expired"] == 1
+        ads = stats["prefixes"]["ads"]
+        assert (ads["hits"], ads["misses"], ads["stores"]) == (2, 1, 3)
+        assert ads["evictions"] == 1
+        assert ads["entries"] == 2
+        assert ads["bytes_stored"] > 0
+        assert ads["load_latency"]["count"] == 2
+        assert ads["store_latency"]["count"] == 3
+        assert stats["total"]["expired_purged"] == 1
+
+    def test_periodic_log(self, cache_file, caplog):
+        caplog.set_level("INFO", logger="utils.cache")
+        cache = CacheManager(cache_file=cache_file, backend="sqlite", stats_interval=0.05)
+        cache.set("all_tables", [])
+        time.sleep(0.2)
+        cache.close()
+        assert any(record.getMessage().startswith("cache_stats {") for record in caplog.records)
+
+
+class TestCompression:
+    """大值压缩"""
+
+    def test_large_values_are_compressed(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, compress_threshold=1024)
+        ddl = "CREATE TABLE `ads_phs_drug` (\n" + "  `drug_id` varchar(64) COMMENT '药物ID',\n" * 200 + ")"
+        cache.set("ads_phs_drug", ddl)
+        cache.set_many({"small": "x", "ads_phs_ct": ddl})
+        cache.invalidate()
+
+        assert isinstance(cache.backend.get_entry("ads_phs_drug")["value"], CompressedValue)
+        assert cache.backend.get_entry("small")["value"] == "x"
+        assert cache.get("ads_phs_drug") == ddl
+        assert cache.get_many(["ads_phs_ct", "small"]) == {"ads_phs_ct": ddl, "small": "x"}
+        assert cache.backend.sizes()["ads_phs_drug"] < len(ddl) / 10
+
+    def test_compression_can_be_disabled(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="pickle", compress_threshold=None)
+        cache.set("ads_phs_drug", "x" * 10000)
+        assert cache.backend.get_entry("ads_phs_drug")["value"] == "x" * 10000
+
+    def test_only_pickle_compresses_by_default(self, tmp_path):
+        sqlite = CacheManager(cache_file=tmp_path / "cache.sqlite3", backend="sqlite")
+        pickled = CacheManager(cache_file=tmp_path / "cache.db", backend="pickle")
+        assert (sqlite.compress_threshold, pickled.compress_threshold) == (None, 4096)
+        for cache in (sqlite, pickled):
+            cache.set("ads_phs_drug", "x" * 10000)
+        assert sqlite.backend.get_entry("ads_phs_drug")["value"] == "x" * 10000
+        assert isinstance(pickled.backend.get_entry("ads_phs_drug")["value"], CompressedValue)
+
+
+class TestStaleWhileRevalidate:
+    """过期后先返回旧值、后台刷新"""
+
+    def test_stale_value_is_served_and_refreshed(self, cache_file, backend_name):
+        cache = CacheManager(cache_file=cache_file, backend=backend_name, max_stale=timedelta(hours=1))
+        cache.set("all_tables", ["old"], ttl=timedelta(seconds=-1))
+        assert cache.get("all_tables") is None
+
+        refreshed = threading.Event()
+
+        def fetch():
+            time.sleep(0.1)
+            refreshed.set()
+            return ["new"]
+
+        start = time.perf_counter()
+        assert cache.get_or_compute("all_tables", fetch) == ["old"]
+        assert time.perf_counter() - start < 0.1
+        assert refreshed.wait(2)
+        cache.close()
+        assert CacheManager(cache_file=cache_file, backend=backend_name).get("all_tables") == ["new"]
+
+    def test_beyond_max_stale_refreshes_synchronously(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite", max_stale=timedelta(seconds=1))
+        cache.set("ads_phs_drug", "old", ttl=timedelta(seconds=-2))
+        assert cache.get_or_compute("ads_phs_drug", lambda: "new") == "new"
+
+    def test_get_many_with_refresh(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite", max_stale=timedelta(hours=1))
+        cache.set("t1", "old", ttl=timedelta(seconds=-1))
+        cache.set("t2", "fresh")
+        assert cache.get_many(["t1", "t2"]) == {"t2": "fresh"}
+        assert cache.get_many(["t1", "t2"], refresh=lambda key: key + "-new") == {"t1": "old", "t2": "fresh"}
+        cache.close()
+        assert CacheManager(cache_file=cache_file, backend="sqlite").get("t1") == "t1-new"
+
+    def test_async_stale_refresh(self, cache_file):
+        cache = CacheManager(cache_file=cache_file, backend="sqlite", max_stale=timedelta(hours=1))
+        cache.set("all_tables", "old", ttl=timedelta(seconds=-1))
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "new"
+
+        async def main():
+            first = await cache.aget_or_compute("all_tables", fetch)
+            await asyncio.sleep(0.2)
+            return first, await cache.aget_or_compute("all_tables", fetch)
+
+        assert asyncio.run(main()) == ("old", "new")
+
+
+class TestNamespaces:
+    """命名空间"""
+
+    @pytest.fixture(autouse=True)
+    def isolated(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(utils.cache, "NAMESPACE_DIR", tmp_path / "cache")
+        monkeypatch.setattr(utils.cache, "LEGACY_CACHE_FILE", tmp_path / "legacy.db")
+        monkeypatch.setattr(utils.cache, "_namespaces", {})
+        return tmp_path
+
+    def test_namespaces_use_separate_stores(self, isolated):
+        auth = get_cache("auth")
+        tables = get_cache("table_info")
+        assert get_cache("auth") is auth
+        auth.set("token", "abc")
+        tables.set("token", "表名：token")
+        assert auth.get("token") == "abc"
+        assert tables.get("token") == "表名：token"
+        assert sorted(p.name for p in (isolated / "cache").glob("*.sqlite3")) == ["auth.sqlite3", "table_info.sqlite3"]
+
+    def test_data_dir_follows_catalog_url(self, isolated, monkeypatch):
+        monkeypatch.delenv("CATALOG_DATA_DIR", raising=False)
+        monkeypatch.delenv("CATALOG_BASE_URL", raising=False)
+        assert utils.cache.catalog_data_dir() == Path("data")
+        assert utils.cache.catalog_data_dir(utils.cache.DEFAULT_CATALOG_URL + "/") == Path("data")
+        fake = "http://127.0.0.1:8765/api/catalog"
+        assert utils.cache.catalog_data_dir(fake) == Path("data/catalogs/127.0.0.1_8765_api_catalog")
+        # 指向其他接口的进程使用单独的存储，也不导入旧的共享缓存
+        monkeypatch.chdir(isolated)
+        monkeypatch.setattr(utils.cache, "NAMESPACE_DIR", None)
+        monkeypatch.setattr(utils.cache, "LEGACY_CACHE_FILE", Path("data/cache.db"))
+        legacy = isolated / "data" / "cache.db"
+        legacy.parent.mkdir()
+        legacy.write_bytes(pickle.dumps({"ads_phs_drug": {"value": "真实", "expiry": datetime.now() + timedelta(days=1)}}))
+        monkeypatch.setenv("CATALOG_BASE_URL", fake)
+        assert get_cache("table_info").get("ads_phs_drug") is None
+        assert (isolated / "data/catalogs/127.0.0.1_8765_api_catalog/cache/table_info.sqlite3").exists()
+        # 指定不同接口地址的缓存互不共用
+        assert get_cache("table_info", base_url=utils.cache.DEFAULT_CATALOG_URL) is not get_cache("table_info")
+        monkeypatch.setenv("CATALOG_DATA_DIR", str(isolated / "elsewhere"))
+        assert utils.cache.catalog_data_dir(utils.cache.DEFAULT_CATALOG_URL) == isolated / "elsewhere"
+        assert utils.cache.catalog_data_dir(fake) == isolated / "elsewhere/catalogs/127.0.0.1_8765_api_catalog"
+
+    def test_policies_apply_per_namespace(self):
+        assert get_cache("auth").max_stale is None
+        assert get_cache("table_info").max_stale == 7
+        assert get_cache("table_list", max_entries=3).max_entries == 3
+
+    def test_legacy_keys_are_split_across_namespaces(self, isolated):
+        expiry = datetime.now() + timedelta(days=1)
+        with open(isolated / "legacy.db", "wb") as f:
+            pickle.dump({"token": {"value": "abc", "expiry": expiry},
+                         "all_tables": {"value": ["ads_phs_drug"], "expiry": expiry},
+                         "ads_phs_drug": {"value": "ddl", "expiry": expiry}}, f)
+        assert get_cache("auth").get_many(["token", "all_tables", "ads_phs_drug"]) == {"token": "abc"}
+        assert get_cache("table_list").get_many(["token", "all_tables"]) == {"all_tables": ["ads_phs_drug"]}
+        assert get_cache("table_info").get_many(["token", "all_tables", "ads_phs_drug"]) == {"ads_phs_drug": "ddl"}
+
+
+class TestSQLiteBackend:
+    """SQLite 后端测试"""
+
+    def test_migrates_legacy_pickle_once(self, tmp_path):
+        legacy = tmp_path / "cache.db"
+        expiry = datetime.now() + timedelta(days=1)
+        with open(legacy, "wb") as f:
+            pickle.dump({"token": {"value": "abc", "expiry": expiry},
+                         "all_tables": {"value": [("ads_phs_drug", "药物")], "expiry": expiry}}, f)
+
+        backend = SQLiteBackend(tmp_path / "cache.sqlite3", legacy_file=legacy)
+        cache = CacheManager(backend=backend)
+        assert cache.get("token") == "abc"
+        assert cache.get("all_tables") == [("ads_phs_drug", "药物")]
+
+        cache.delete("token")
+        backend.close()
+        # 再次打开不会重复导入已删除的键
+        cache = CacheManager(backend=SQLiteBackend(tmp_path / "cache.sqlite3", legacy_file=legacy))
+        assert cache.get("token") is None
+
+    def test_uses_wal_journal(self, tmp_path):
+        backend = SQLiteBackend(tmp_path / "cache.sqlite3")
+        mode = backend._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+
+def _stress_worker(backend_name, cache_file, worker_id, rounds, errors):
+    """子进程：交替写入自己的键并读取其他进程的键"""
+    try:
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        for i in range(rounds):
+            cache.set(f"w{worker_id}_{i}", {"worker": worker_id, "i": i, "payload": "x" * 512})
+            cache.set("shared", worker_id)
+            cache.get(f"w{(worker_id + 1) % 4}_{i}")
+            cache.exists("shared")
+    except Exception as e:  # 子进程异常无法直接抛给 pytest
+        errors.put(repr(e))
+
+
+class TestMultiProcess:
+    """多进程并发读写压力测试"""
+
+    @pytest.mark.parametrize("workers,rounds", [(4, 40)])
+    def test_concurrent_set_get(self, tmp_path, backend_name, workers, rounds):
+        cache_file = tmp_path / "cache.db"
+        CacheManager(cache_file=cache_file, backend=backend_name)
+        ctx = multiprocessing.get_context("spawn")
+        errors = ctx.Queue()
+        procs = [ctx.Process(target=_stress_worker, args=(backend_name, cache_file, w, rounds, errors))
+                 for w in range(workers)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=120)
+            assert p.exitcode == 0
+
+        assert errors.empty(), errors.get()
+        cache = CacheManager(cache_file=cache_file, backend=backend_name)
+        # 没有丢失任何一次写入
+        for w in range(workers):
+            for i in range(rounds):
+                assert cache.get(f"w{w}_{i}") == {"worker": w, "i": i, "payload": "x" * 512}
+        assert cache.get("shared") in range(workers)
+        assert not list(tmp_path.glob("*.tmp"))
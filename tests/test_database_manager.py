@@ -0,0 +1,1340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+DatabaseManager 单元测试
+"""
+
+import asyncio
+import base64
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+import numpy as np
+import openpyxl
+import pytest
+import requests
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+import database.async_manager as async_manager
+import database.columnar as columnar
+import database.manager as manager
+import database.explain as explain
+import database.fake_catalog as fake_catalog_module
+import database.paging as paging
+import database.schema as schema
+import database.token_provider as token_provider_module
+from database.async_manager import AsyncDatabaseManager
+from database.catalog import SchemaCatalog, catalog_file, main as catalog_main
+from database.columnar import ColumnarResult
+from database.explain import PlanPolicy
+from database.fake_catalog import FakeCatalog, FakeCatalogServer
+from database.fingerprint import is_read_only_sql, normalize_sql, sql_fingerprint
+from database.limiter import PRIORITY_HIGH, PRIORITY_LOW, ConcurrencyLimiter, priority
+from database.manager import DatabaseConfig, DatabaseManager
+from database.samples import compact_samples, compact_value
+from database.schema_tools import SchemaTools
+from database.token_provider import TokenProvider, get_token_provider, jwt_expiry, token_key
+import utils.cache
+from utils.cache import CacheManager, get_cache
+from utils.exceptions import QueryValidationError
+from schemas.models import ColumnInfo, TableSchema
+
+
+TEST_URL = "http://catalog.test/api/catalog"
+
+
+def make_response(body, status=200):
+    response = mock.MagicMock()
+    response.status_code = status
+    response.headers = {}
+    response.json.return_value = body
+    return response
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """各命名空间的缓存和表结构目录都保存在临时目录中"""
+    monkeypatch.setenv("CATALOG_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(utils.cache, "_namespaces", {})
+    return tmp_path / "data"
+
+
+def auth_key():
+    """测试接口地址的 token 在 auth 缓存中的键"""
+    return token_key(TEST_URL, os.getenv("DB_USERNAME"))
+
+
+@pytest.fixture(autouse=True)
+def token_cache(data_dir, monkeypatch):
+    """每个测试使用新的 TokenProvider，并为测试接口地址预置一个有效 token"""
+    monkeypatch.setattr(token_provider_module, "_providers", {})
+    cache = get_cache("auth", base_url=TEST_URL)
+    cache.set(auth_key(), "cached-token")
+    yield cache
+    for provider in token_provider_module._providers.values():
+        provider.stop()
+
+
+@pytest.fixture(autouse=True)
+def result_cache(data_dir):
+    """测试接口地址对应的查询结果缓存"""
+    return get_cache("query_results", base_url=TEST_URL)
+
+
+@pytest.fixture
+def dbm():
+    return DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog"))
+
+
+class TestSession:
+    """所有请求都经过连接池会话"""
+
+    def test_pool_is_configured(self):
+        dbm = DatabaseManager(DatabaseConfig(pool_maxsize=32))
+        adapter = dbm._session.get_adapter("http://catalog.test")
+        assert adapter._pool_maxsize == 32
+
+    def test_calls_use_session(self, dbm, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        responses = {
+            "/query/jdbc/table/list": {"body": {"metadata_list": {"ads_phs_drug": {"business_description": "药物"}}}},
+            "/query/history/list": {"body": {"list": [{"status": "SUCCEEDED", "query_statement": "select 1"}]}},
+            "/query/jdbc": {"body": {"rows": [{"a": 1}]}},
+        }
+        with mock.patch.object(dbm._session, "request",
+                               side_effect=lambda method, url, **kw: make_response(
+                                   responses[url.replace(dbm.config.base_url, "")])) as request, \
+                mock.patch("requests.get") as module_get, mock.patch("requests.post") as module_post:
+            assert dbm.get_all_tables() == [("ads_phs_drug", "药物")]
+            dbm.get_user_history()
+            assert dbm.sql_execute("select 1") == [{"a": 1}]
+
+        assert request.call_count == 3
+        assert not module_get.called and not module_post.called
+        for call in request.call_args_list:
+            assert call.kwargs["headers"]["X-Authorization"] == "Bearer cached-token"
+
+
+class TestRetries:
+    """重试、超时与 401 重新登录"""
+
+    @pytest.fixture
+    def dbm(self):
+        return DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog",
+                                              max_retries=2, retry_backoff=0))
+
+    def test_read_only_sql_is_retried(self, dbm):
+        ok = make_response({"body": {"rows": [{"a": 1}]}})
+        with mock.patch.object(dbm._session, "request",
+                               side_effect=[requests.ConnectionError("reset"), make_response({}, 503), ok]) as request:
+            assert dbm.sql_execute("select a from t") == [{"a": 1}]
+        assert request.call_count == 3
+        assert dbm.metrics["retries"] == 2
+        assert request.call_args.kwargs["timeout"] == (dbm.config.connect_timeout, dbm.config.request_timeout)
+
+    def test_gives_up_after_max_retries(self, dbm):
+        with mock.patch.object(dbm._session, "request", side_effect=requests.Timeout("slow")) as request:
+            with pytest.raises(requests.Timeout):
+                dbm.sql_execute("show create table t")
+        assert request.call_count == 3
+        assert dbm.metrics["errors"] == 1
+
+    def test_non_idempotent_sql_is_not_retried(self, dbm):
+        with mock.patch.object(dbm._session, "request", side_effect=requests.ConnectionError("reset")) as request:
+            with pytest.raises(requests.ConnectionError):
+                dbm.sql_execute("insert into t values (1)")
+        assert request.call_count == 1
+
+    def test_read_only_sql(self):
+        for sql in ["select a from t", "(select 1) union (select 2)", "SHOW CREATE TABLE t", "explain select 1",
+                    "with x as (select 1) select * from x", "select 'for update' from t -- delete",
+                    "with x as (select 1), y as (select 2) select * from x, y", "select replace(a, 'b', 'c') from t"]:
+            assert is_read_only_sql(sql), sql
+        for sql in ["insert into t values (1)", "update t set a = 1",
+                    "WITH x AS (SELECT id FROM t) DELETE FROM t WHERE id IN (SELECT id FROM x)",
+                    "with recursive x(n) as (select 1) update t join x on t.id = x.n set t.a = 1",
+                    "select * from t where id = 1 for update", "select * from t FOR\nSHARE",
+                    "select * from t lock in share mode", "select * from (select * from t for update) s",
+                    "explain analyze delete from t"]:
+            assert not is_read_only_sql(sql), sql
+
+    def test_cte_writes_and_locking_reads_are_not_retried_or_cached(self, dbm):
+        for sql in ["with x as (select id from t) delete from t where id in (select id from x)",
+                    "select a from t where id = 1 for update"]:
+            with mock.patch.object(dbm._session, "request", side_effect=requests.ConnectionError("reset")) as request:
+                with pytest.raises(requests.ConnectionError):
+                    dbm.execute_query(sql)
+            assert request.call_count == 1
+            assert dbm._result_key(sql) is None
+
+    def test_401_refreshes_token_and_replays_once(self, dbm, token_cache):
+        calls = []
+
+        def fake_request(method, url, **kwargs):
+            calls.append((url, kwargs["headers"].get("X-Authorization")))
+            if url.endswith("/auth/login"):
+                return make_response({"body": {"token": "new-token"}})
+            if kwargs["headers"]["X-Authorization"] == "Bearer cached-token":
+                return make_response({}, 401)
+            return make_response({"body": {"rows": []}})
+
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request):
+            assert dbm.sql_execute("select 1") == []
+        assert [url.rsplit("/", 1)[-1] for url, _ in calls] == ["jdbc", "login", "jdbc"]
+        assert calls[-1][1] == "Bearer new-token"
+        assert token_cache.get(auth_key()) == "new-token"
+        assert dbm.metrics["reauth"] == 1
+
+    def test_second_401_is_raised(self, dbm):
+        def fake_request(method, url, **kwargs):
+            if url.endswith("/auth/login"):
+                return make_response({"body": {"token": "new-token"}})
+            response = make_response({}, 401)
+            response.raise_for_status.side_effect = requests.HTTPError("401")
+            return response
+
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request):
+            with pytest.raises(requests.HTTPError):
+                dbm.sql_execute("select 1")
+
+
+class TestBatchTableInfo:
+    """批量获取表结构"""
+
+    def test_fetches_concurrently_with_same_format(self, dbm):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_request(method, url, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            sql = kwargs["json"]["sql"]
+            if sql.startswith("show create table"):
+                return make_response({"body": {"rows": [{"Create Table": f"CREATE TABLE {sql.split()[-1]}"}]}})
+            return make_response({"body": {"rows": [{"id": 1}]}})
+
+        tables = ["ads_phs_t3", "ads_phs_t1", "ads_phs_t2", "ads_phs_t1", "ads_phs_t4"]
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request) as request:
+            start = time.perf_counter()
+            infos = dbm.get_tables_info(tables, max_workers=4)
+            elapsed = time.perf_counter() - start
+            assert infos == {table: dbm.get_table_info(table) for table in dict.fromkeys(tables)}
+        assert list(infos) == ["ads_phs_t3", "ads_phs_t1", "ads_phs_t2", "ads_phs_t4"]
+        assert peak[0] == 4
+        # 8 个请求 4 路并发，约两轮
+        assert elapsed < 0.3
+        assert request.call_count == 16
+
+    def test_error_is_raised(self, dbm):
+        with mock.patch.object(dbm._session, "request", return_value=make_response({"body": {"rows": []}})):
+            with pytest.raises(IndexError):
+                dbm.get_tables_info(["ads_phs_missing"])
+
+
+INFORMATION_SCHEMA = {
+    "TABLES": [
+        {"table_name": "ads_phs_drug", "table_comment": "药物", "engine": "InnoDB", "table_rows": "120000",
+         "create_time": "2025-01-02 03:04:05", "update_time": None},
+    ],
+    "COLUMNS": [
+        {"table_name": "ads_phs_drug", "column_name": "id", "column_type": "bigint", "is_nullable": "NO",
+         "column_default": None, "column_key": "PRI", "extra": "auto_increment", "column_comment": ""},
+        {"table_name": "ads_phs_drug", "column_name": "drug_name", "column_type": "varchar(255)", "is_nullable": "YES",
+         "column_default": None, "column_key": "MUL", "extra": "", "column_comment": "药物名's"},
+        {"table_name": "ads_phs_drug", "column_name": "updated_at", "column_type": "datetime", "is_nullable": "NO",
+         "column_default": "CURRENT_TIMESTAMP", "column_key": "", "extra": "DEFAULT_GENERATED", "column_comment": ""},
+    ],
+    "STATISTICS": [
+        {"table_name": "ads_phs_drug", "index_name": "idx_name", "non_unique": "1", "column_name": "drug_name"},
+        {"table_name": "ads_phs_drug", "index_name": "PRIMARY", "non_unique": "0", "column_name": "id"},
+    ],
+}
+
+
+def information_schema_request(method, url, **kwargs):
+    sql = kwargs["json"]["sql"]
+    for view, rows in INFORMATION_SCHEMA.items():
+        if f"information_schema.{view}" in sql:
+            return make_response({"body": {"rows": rows}})
+    return make_response({"body": {"rows": [{"id": 1}]}})
+
+
+class TestSchemaSnapshot:
+    """通过 information_schema 批量获取表结构"""
+
+    def test_snapshot_and_ddl(self, dbm):
+        with mock.patch.object(dbm._session, "request", side_effect=information_schema_request) as request:
+            snapshot = dbm.get_schema_snapshot()
+        assert request.call_count == 3
+        table = snapshot["ads_phs_drug"]
+        assert table.table_rows == 120000
+        assert [column.name for column in table.columns] == ["id", "drug_name", "updated_at"]
+        assert [(index.name, index.unique) for index in table.indexes] == [("idx_name", False), ("PRIMARY", True)]
+        assert schema.render_ddl(table) == (
+            "CREATE TABLE `ads_phs_drug` (\n"
+            "  `id` bigint NOT NULL auto_increment,\n"
+            "  `drug_name` varchar(255) DEFAULT NULL COMMENT '药物名\\'s',\n"
+            "  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,\n"
+            "  PRIMARY KEY (`id`),\n"
+            "  KEY `idx_name` (`drug_name`)\n"
+            ") ENGINE=InnoDB COMMENT='药物'")
+
+    def test_describe_tables(self, dbm):
+        with mock.patch.object(dbm._session, "request", side_effect=information_schema_request) as request:
+            infos = dbm.describe_tables(["ads_phs_drug", "ads_phs_missing"])
+            assert dbm.describe_tables(limit=0)["ads_phs_drug"].endswith("示例数据：无")
+        assert list(infos) == ["ads_phs_drug"]
+        assert infos["ads_phs_drug"].startswith("表名：ads_phs_drug\n表结构：CREATE TABLE `ads_phs_drug`")
+        assert infos["ads_phs_drug"].endswith("示例数据：\nid\n1")
+        assert "TABLE_NAME IN ('ads_phs_drug', 'ads_phs_missing')" in request.call_args_list[0].kwargs["json"]["sql"]
+        assert request.call_count == 3 + 1 + 3
+
+    def test_rejects_invalid_table_names(self):
+        with pytest.raises(ValueError):
+            schema.snapshot_queries("phs_ads", ["t1'; drop table t2 --"])
+
+
+class TestSchemaCatalog:
+    """本地表结构目录的增量刷新与离线读取"""
+
+    @pytest.fixture
+    def information_schema(self, monkeypatch):
+        tables = [dict(INFORMATION_SCHEMA["TABLES"][0]),
+                  {**INFORMATION_SCHEMA["TABLES"][0], "table_name": "ads_phs_target", "table_comment": "靶点"}]
+        columns = INFORMATION_SCHEMA["COLUMNS"] + [{**INFORMATION_SCHEMA["COLUMNS"][0], "table_name": "ads_phs_target"}]
+        monkeypatch.setitem(INFORMATION_SCHEMA, "TABLES", tables)
+        monkeypatch.setitem(INFORMATION_SCHEMA, "COLUMNS", columns)
+        return tables
+
+    @pytest.fixture
+    def catalog(self, tmp_path):
+        catalog = SchemaCatalog(tmp_path / "catalog.sqlite3")
+        yield catalog
+        catalog.close()
+
+    def refresh(self, catalog, dbm, **kwargs):
+        def fake_request(method, url, **kw):
+            if url.endswith("/table/list"):
+                return make_response({"body": {"metadata_list": {"ads_phs_drug": {"business_description": "药物表"}}}})
+            return information_schema_request(method, url, **kw)
+
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request) as request:
+            report = catalog.refresh(dbm, **kwargs)
+        sqls = [call.kwargs["json"]["sql"] for call in request.call_args_list if "json" in call.kwargs]
+        return report, sqls
+
+    def test_warm_then_incremental(self, catalog, dbm, information_schema):
+        report, sqls = self.refresh(catalog, dbm)
+        assert report["added"] == ["ads_phs_drug", "ads_phs_target"]
+        assert catalog.get_all_tables() == [("ads_phs_drug", "药物表"), ("ads_phs_target", "靶点")]
+
+        report, sqls = self.refresh(catalog, dbm)
+        assert report == {"added": [], "changed": [], "removed": [], "unchanged": ["ads_phs_drug", "ads_phs_target"]}
+        assert len(sqls) == 1 and "information_schema.TABLES" in sqls[0]
+
+        information_schema[1]["update_time"] = "2025-06-01 00:00:00"
+        report, sqls = self.refresh(catalog, dbm)
+        assert (report["changed"], report["unchanged"]) == (["ads_phs_target"], ["ads_phs_drug"])
+        assert "TABLE_NAME IN ('ads_phs_target')" in sqls[1]
+        assert [sql for sql in sqls if sql.startswith("select *")] == ["select * from ads_phs_target limit 2"]
+        assert catalog.versions()["ads_phs_target"] == ("2025-01-02 03:04:05", "2025-06-01 00:00:00")
+
+        del information_schema[0]
+        report, sqls = self.refresh(catalog, dbm)
+        assert report["removed"] == ["ads_phs_drug"]
+        assert list(catalog.versions()) == ["ads_phs_target"]
+
+    def test_reads_without_network(self, catalog, dbm, information_schema):
+        self.refresh(catalog, dbm)
+        fallback = mock.MagicMock(return_value={"ads_phs_other": "表名：ads_phs_other"})
+        with mock.patch.object(dbm._session, "request") as request:
+            infos = catalog.get_tables_info(["ads_phs_target", "ads_phs_other", "ads_phs_drug"], fallback=fallback)
+            schema_ = catalog.get_table_schema("ads_phs_drug")
+        assert not request.called
+        fallback.assert_called_once_with(["ads_phs_other"])
+        assert list(infos) == ["ads_phs_target", "ads_phs_other", "ads_phs_drug"]
+        assert infos["ads_phs_drug"] == manager.format_table_info(
+            "ads_phs_drug", schema.render_ddl(schema_), [{"id": 1}])
+        assert schema_.table_rows == 120000
+        entries = catalog.get_ddl_and_samples()
+        assert list(entries) == ["ads_phs_drug", "ads_phs_target"]
+        assert entries["ads_phs_drug"] == (schema.render_ddl(schema_), [{"id": 1}])
+
+    def test_schema_tools(self, dbm, data_dir):
+        tools = SchemaTools(dbm)
+        assert tools.schema_catalog.db_file == catalog_file(TEST_URL)
+        assert tools.table_info_cache is get_cache("table_info", base_url=TEST_URL)
+        with mock.patch.object(dbm, "get_all_tables", return_value=[("ads_phs_drug", "药物表")]) as get_all_tables, \
+                mock.patch.object(dbm, "get_tables_info", side_effect=lambda tables: {t: f"表名：{t}" for t in tables}) \
+                as get_tables_info:
+            for _ in range(2):
+                assert tools.get_all_tables() == [("ads_phs_drug", "药物表")]
+                assert tools.get_tables_info(["ads_phs_drug", "ads_phs_ct"]) == {
+                    "ads_phs_drug": "表名：ads_phs_drug", "ads_phs_ct": "表名：ads_phs_ct"}
+        # 目录为空时走缓存，第二次不再请求
+        assert get_all_tables.call_count == 1
+        get_tables_info.assert_called_once_with(["ads_phs_drug", "ads_phs_ct"])
+        tools.schema_catalog.close()
+
+    def test_cli(self, tmp_path, capsys, information_schema):
+        db_file = str(tmp_path / "cli.sqlite3")
+        catalog = SchemaCatalog(db_file)
+        self.refresh(catalog, DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog")))
+        catalog.close()
+        catalog_main(["--db-file", db_file, "show", "ads_phs_drug"])
+        assert capsys.readouterr().out.startswith("表名：ads_phs_drug\n表结构：CREATE TABLE")
+
+
+class TestQueryResultCache:
+    """按 SQL 指纹缓存查询结果"""
+
+    def test_fingerprint_ignores_whitespace_case_and_comments(self):
+        assert normalize_sql("SELECT  a , b -- 注释\nFROM t /* x */ WHERE name = 'Aspirin' ;") == \
+            "select a,b from t where name='Aspirin'"
+        assert sql_fingerprint("select a from t where name = 'Aspirin'") != \
+            sql_fingerprint("select a from t where name = 'aspirin'")
+        assert normalize_sql("select '--x', `Col` # tail") == "select '--x',`Col`"
+
+    def test_repeat_query_hits_cache(self, dbm):
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": [{"a": 1}]}})) as request:
+            first = dbm.execute_query("SELECT a FROM t WHERE id = 1")
+            second = dbm.execute_query("select a\n  from t -- 相似问题\n where id=1;")
+            fresh = dbm.execute_query("select a from t where id = 1", use_cache=False)
+        assert (first.cache_hit, second.cache_hit, fresh.cache_hit) == (False, True, False)
+        assert first.result == second.result == [{"a": 1}]
+        assert second.sql == "select a\n  from t -- 相似问题\n where id=1;"
+        assert second.execution_time < first.execution_time
+        assert request.call_count == 2
+
+    def test_callers_cannot_modify_cached_results(self, dbm):
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": [{"a": 1}]}})):
+            first = dbm.execute_query("select a from t")
+            first.result[0]["a"] = 2
+            first.result.append({"a": 3})
+            second = dbm.execute_query("select a from t")
+            second.result.clear()
+            assert dbm.execute_query("select a from t").result == [{"a": 1}]
+
+    def test_writes_are_not_cached(self, dbm, result_cache):
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": []}})) as request:
+            dbm.execute_query("insert into t values (1)")
+            assert not dbm.execute_query("insert into t values (1)").cache_hit
+        assert request.call_count == 2
+        assert result_cache.stats()["total"]["stores"] == 0
+
+    def test_results_are_scoped_by_base_url(self, dbm):
+        other = DatabaseManager(DatabaseConfig(base_url="http://127.0.0.1:8765/api/catalog", token_refresh=False))
+        other.token_provider.set("other-token")
+        assert dbm._result_key("select 1") != other._result_key("select 1")
+        with mock.patch.object(dbm._session, "request", return_value=make_response({"body": {"rows": [{"a": 1}]}})), \
+                mock.patch.object(other._session, "request",
+                                  return_value=make_response({"body": {"rows": [{"a": 2}]}})) as request:
+            dbm.execute_query("select a from t")
+            result = other.execute_query("select a from t")
+        assert not result.cache_hit and result.result == [{"a": 2}]
+        assert request.call_count == 1
+
+    def test_ttl(self, result_cache):
+        dbm = DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog",
+                                             result_cache_ttl=timedelta(seconds=-1)))
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": []}})) as request:
+            dbm.execute_query("select 1")
+            assert not dbm.execute_query("select 1").cache_hit
+        assert request.call_count == 2
+
+
+class TestPaging:
+    """分页逐行读取"""
+
+    ROWS = [{"id": i, "name": f"药物{i}"} for i in range(1, 26)]
+
+    def page_request(self, sqls):
+        def fake_request(method, url, **kwargs):
+            sql = kwargs["json"]["sql"]
+            sqls.append(sql)
+            limit = int(re.search(r"LIMIT (\d+)", sql).group(1))
+            offset = re.search(r"OFFSET (\d+)", sql)
+            after = re.search(r"`id` > (\d+)", sql)
+            rows = [row for row in self.ROWS if not after or row["id"] > int(after.group(1))]
+            start = int(offset.group(1)) if offset else 0
+            return make_response({"body": {"rows": rows[start:start + limit]}})
+        return fake_request
+
+    def test_offset_paging(self, dbm):
+        sqls = []
+        with mock.patch.object(dbm._session, "request", side_effect=self.page_request(sqls)):
+            rows = dbm.iter_rows("select id, name from ads_phs_drug order by id;", page_size=10)
+            assert next(rows) == self.ROWS[0]
+            assert len(sqls) == 1
+            assert [row["id"] for row in rows] == list(range(2, 26))
+        assert sqls[-1] == "SELECT * FROM (select id, name from ads_phs_drug order by id) AS _page LIMIT 10 OFFSET 20"
+
+    def test_keyset_paging(self, dbm):
+        sqls = []
+        with mock.patch.object(dbm._session, "request", side_effect=self.page_request(sqls)):
+            assert list(dbm.iter_rows("select id, name from ads_phs_drug", page_size=5, key="id")) == self.ROWS
+        assert len(sqls) == 6
+        assert sqls[1] == "SELECT * FROM (select id, name from ads_phs_drug) AS _page WHERE `id` > 5 ORDER BY `id` LIMIT 5"
+
+    def test_sql_literal(self):
+        assert paging.sql_literal("O'Neil\\") == "'O\\'Neil\\\\'"
+        assert paging.sql_literal(3) == "3"
+        with pytest.raises(ValueError):
+            paging.keyset_page_sql("select 1", "id) or (1", 10)
+
+    def test_history_streams_to_disk(self, dbm, tmp_path):
+        statements = [{"status": "SUCCEEDED" if i % 3 else "FAILED", "query_statement": f"select {i}"}
+                      for i in range(7)]
+        pages = []
+
+        def fake_request(method, url, **kwargs):
+            page = kwargs["json"]
+            pages.append(page["page_num"])
+            start = (page["page_num"] - 1) * page["page_size"]
+            return make_response({"body": {"list": statements[start:start + page["page_size"]]}})
+
+        file_path = tmp_path / "history.xlsx"
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request):
+            assert dbm.get_user_history(str(file_path), page_size=3) == 4
+        assert pages == [1, 2, 3]
+        sheet = openpyxl.load_workbook(file_path).active
+        assert [row[0] for row in sheet.iter_rows(values_only=True)] == \
+            ["查询语句", "select 1", "select 2", "select 4", "select 5"]
+
+
+class TestColumnar:
+    """列式结果"""
+
+    ROWS = [
+        {"id": 1, "score": 1.5, "approved": True, "name": "药物1", "phase": None},
+        {"id": 2, "score": None, "approved": False, "name": "药物2", "phase": 3},
+        {"id": 3, "score": 2, "approved": True, "name": None, "phase": 1, "extra": "x"},
+    ]
+
+    def test_typed_columns(self):
+        result = ColumnarResult.from_rows(self.ROWS)
+        assert result.columns == ["id", "score", "approved", "name", "phase", "extra"]
+        assert len(result) == 3
+        assert result.column("id").dtype == np.int64
+        assert result.column("approved").dtype == np.bool_
+        assert result.column("score").dtype == np.float64 and np.isnan(result.column("score")[1])
+        assert result.column("phase").dtype == np.float64
+        assert result.column("name").dtype == object
+        assert result.column("extra").tolist() == [None, None, "x"]
+        assert result.to_rows()[0] == {**self.ROWS[0], "extra": None}
+
+    def test_string_values_from_catalog(self):
+        # 接口返回的值都是字符串，空值的列直接缺失
+        rows = [
+            {"created_ts": "1677735049000", "is_qidp": "false", "score": "1.5", "code": "007", "phase": "3"},
+            {"created_ts": "1677735050000", "is_qidp": "true", "score": "2", "code": "12"},
+        ]
+        result = ColumnarResult.from_rows(rows)
+        assert result.column("created_ts").dtype == np.int64
+        assert result.column("created_ts").tolist() == [1677735049000, 1677735050000]
+        assert result.column("is_qidp").dtype == np.bool_ and result.column("is_qidp").tolist() == [False, True]
+        assert result.column("score").dtype == np.float64
+        assert result.column("code").dtype == object and result.column("code").tolist() == ["007", "12"]
+        assert result.column("phase").dtype == np.float64 and np.isnan(result.column("phase")[1])
+
+    def test_dtypes_from_schema(self):
+        table = TableSchema(name="t", columns=[
+            ColumnInfo(name="id", type="varchar(64)"), ColumnInfo(name="n", type="bigint(20)"),
+            ColumnInfo(name="flag", type="tinyint(1)"), ColumnInfo(name="price", type="decimal(10,2)"),
+        ])
+        rows = [{"id": "1", "n": "5", "flag": "1", "price": "3"}, {"id": "2", "flag": "0", "price": "4.25"}]
+        result = ColumnarResult.from_rows(rows, columnar.schema_dtypes(table))
+        assert result.column("id").tolist() == ["1", "2"]
+        assert result.column("n").dtype == np.float64 and result.column("n")[0] == 5
+        assert result.column("flag").tolist() == [True, False]
+        assert result.column("price").tolist() == [3.0, 4.25]
+        # 与类型不符的值保留原样
+        assert ColumnarResult.from_rows([{"n": "abc"}], {"n": "int"}).column("n").tolist() == ["abc"]
+
+    def test_dataframe_reuses_arrays(self):
+        result = ColumnarResult.from_rows(self.ROWS)
+        df = result.to_pandas()
+        assert list(df.columns) == result.columns
+        assert np.shares_memory(df["id"].to_numpy(), result.column("id"))
+
+    def test_arrow_and_parquet(self, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        result = ColumnarResult.from_rows(self.ROWS)
+        table = result.to_arrow()
+        assert table.column("score").null_count == 1
+        result.to_parquet(tmp_path / "result.parquet")
+        assert pq.read_table(tmp_path / "result.parquet").column("name").to_pylist() == ["药物1", "药物2", None]
+
+    def test_execute_columnar_by_page(self, dbm):
+        rows = [{"id": i, "name": f"药物{i}"} for i in range(7)]
+
+        def fake_request(method, url, **kwargs):
+            offset = int(re.search(r"OFFSET (\d+)", kwargs["json"]["sql"]).group(1))
+            return make_response({"body": {"rows": rows[offset:offset + 3]}})
+
+        with mock.patch.object(dbm._session, "request", side_effect=fake_request) as request:
+            result = dbm.execute_columnar("select id, name from t order by id", page_size=3)
+        assert request.call_count == 3
+        assert result.column("id").tolist() == list(range(7))
+
+
+TIDB_EXPLAIN = [
+    {"id": "Projection_7", "estRows": "5.00", "task": "root", "access object": "", "operator info": ""},
+    {"id": "└─IndexJoin_12", "estRows": "5.00", "task": "root", "access object": "", "operator info": ""},
+    {"id": "  ├─TableFullScan_30", "estRows": "2400000.00", "task": "cop[tikv]",
+     "access object": "table:d", "operator info": "keep order:false"},
+    {"id": "  └─IndexRangeScan_20", "estRows": "1.00", "task": "cop[tikv]",
+     "access object": "table:t, index:idx_target_id(target_id)", "operator info": ""},
+]
+
+MYSQL_EXPLAIN = [
+    {"id": 1, "select_type": "SIMPLE", "table": "ads_phs_target", "type": "ALL", "key": None, "rows": 3000},
+    {"id": 1, "select_type": "SIMPLE", "table": "d", "type": "ref", "key": "idx_target_id", "rows": 12},
+]
+
+
+class TestExplain:
+    """EXPLAIN 预检"""
+
+    SQL = ("SELECT d.drug_name FROM ads_phs_dmp_drug AS d "
+           "JOIN ads_phs_target t ON d.target_id = t.target_id WHERE t.name = 'EGFR' LIMIT 5")
+
+    def test_tidb_plan(self, dbm):
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": TIDB_EXPLAIN}})) as request:
+            plan = dbm.explain(self.SQL + ";")
+        assert request.call_args.kwargs["json"]["sql"] == "EXPLAIN " + self.SQL
+        assert plan.indexes_used == ["idx_target_id"]
+        assert plan.estimated_rows == 5
+        assert plan.full_scans == {"ads_phs_dmp_drug": 2400000}
+        assert plan.explain_result == {"format": "tidb", "rows": TIDB_EXPLAIN}
+        with pytest.raises(QueryValidationError, match="ads_phs_dmp_drug"):
+            PlanPolicy().check(plan)
+
+    def test_mysql_plan(self):
+        plan = explain.build_plan(self.SQL, MYSQL_EXPLAIN, 0.01)
+        assert plan.indexes_used == ["idx_target_id"]
+        assert plan.full_scans == {"ads_phs_target": 3000}
+        assert PlanPolicy().check(plan) is plan
+        with pytest.raises(QueryValidationError) as error:
+            PlanPolicy(max_full_scan_rows=1000).check(plan)
+        assert error.value.code == 1003
+        assert error.value.context["full_scans"] == {"ads_phs_target": 3000}
+
+    @staticmethod
+    def explain_request(sqls, plan):
+        def fake_request(method, url, **kwargs):
+            sql = kwargs["json"]["sql"]
+            sqls.append(sql)
+            if sql.startswith("EXPLAIN"):
+                if plan is None:
+                    return make_response({"message": "unsupported"}, status=400)
+                return make_response({"body": {"rows": plan}})
+            return make_response({"body": {"rows": [{"drug_name": "x"}]}})
+        return fake_request
+
+    def test_execute_query_preflight(self, dbm):
+        sqls = []
+        with mock.patch.object(dbm._session, "request", side_effect=self.explain_request(sqls, TIDB_EXPLAIN)):
+            with pytest.raises(QueryValidationError):
+                dbm.execute_query(self.SQL, plan_policy=PlanPolicy())
+            assert sqls == ["EXPLAIN " + self.SQL]
+            # 不指定策略时不做预检
+            dbm.execute_query(self.SQL)
+            assert sqls[1:] == [self.SQL]
+            # 命中缓存时不再 EXPLAIN
+            assert dbm.execute_query(self.SQL, plan_policy=PlanPolicy()).cache_hit
+        assert len(sqls) == 2
+
+    def test_execute_query_preflight_passes(self, dbm):
+        sqls = []
+        with mock.patch.object(dbm._session, "request", side_effect=self.explain_request(sqls, MYSQL_EXPLAIN)):
+            assert dbm.execute_query(self.SQL, plan_policy=PlanPolicy()).result == [{"drug_name": "x"}]
+        assert sqls == ["EXPLAIN " + self.SQL, self.SQL]
+        # EXPLAIN 本身失败时放行
+        sqls.clear()
+        with mock.patch.object(dbm._session, "request", side_effect=self.explain_request(sqls, None)):
+            assert dbm.execute_query("select 2", plan_policy=PlanPolicy()).result == [{"drug_name": "x"}]
+        assert sqls == ["EXPLAIN select 2", "select 2"]
+
+    def test_aliases(self):
+        assert explain.table_aliases("select * from `phs_ads`.`ads_phs_drug` d left join ads_phs_target on 1=1 "
+                                     "join ads_phs_company as c using (id) where 1") == {
+            "ads_phs_drug": "ads_phs_drug", "d": "ads_phs_drug", "ads_phs_target": "ads_phs_target",
+            "ads_phs_company": "ads_phs_company", "c": "ads_phs_company"}
+
+
+class TestConcurrencyLimiter:
+    """进程内的请求并发限制"""
+
+    @staticmethod
+    def queue(limiter, priorities):
+        """占满名额后按顺序让线程排队，释放名额并返回获得名额的顺序"""
+        limiter.acquire()
+        order, threads = [], []
+
+        def worker(name, value):
+            with limiter.slot(value):
+                order.append(name)
+
+        for name, value in priorities:
+            threads.append(threading.Thread(target=worker, args=(name, value)))
+            queued = limiter.stats()["queued"]
+            threads[-1].start()
+            while limiter.stats()["queued"] == queued:
+                time.sleep(0.001)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_shared_by_all_managers(self):
+        config = DatabaseConfig(base_url=TEST_URL)
+        assert DatabaseManager(config).limiter is DatabaseManager(config).limiter
+
+    def test_limit_is_enforced(self, dbm):
+        dbm.limiter = ConcurrencyLimiter(2)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def request(*args, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return make_response({"body": {"rows": []}})
+
+        with mock.patch.object(dbm._session, "request", side_effect=request):
+            threads = [threading.Thread(target=dbm.sql_execute, args=(f"select {i}",)) for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        stats = dbm.limiter.stats()
+        assert peak[0] == 2
+        assert stats["acquired"] == 6 and stats["in_flight"] == 0 and stats["queued"] == 0
+        assert stats["waited"] >= 4
+        assert stats["wait"]["count"] == 6
+
+    def test_fifo_within_priority(self):
+        limiter = ConcurrencyLimiter(1)
+        order = self.queue(limiter, [("a", 0), ("b", PRIORITY_LOW), ("c", 0), ("d", PRIORITY_HIGH)])
+        assert order == ["d", "a", "c", "b"]
+
+    def test_priority(self, dbm):
+        dbm.limiter = ConcurrencyLimiter(1)
+        with mock.patch.object(dbm.limiter, "_enqueue", wraps=dbm.limiter._enqueue) as enqueue, \
+                mock.patch.object(dbm._session, "request",
+                                  return_value=make_response({"body": {"rows": [], "list": []}})):
+            dbm.sql_execute("select 1")
+            with priority(PRIORITY_HIGH):
+                dbm.sql_execute("select 2")
+            list(dbm.iter_history())
+        assert [call.args[0] for call in enqueue.call_args_list] == [0, PRIORITY_HIGH, PRIORITY_LOW]
+
+    def test_timeout(self, dbm):
+        dbm.limiter = ConcurrencyLimiter(1)
+        dbm.config.queue_timeout = 0.05
+        dbm.limiter.acquire()
+        with mock.patch.object(dbm._session, "request") as request:
+            with pytest.raises(TimeoutError):
+                dbm.sql_execute("select 1")
+        request.assert_not_called()
+        stats = dbm.limiter.stats()
+        assert stats["timeouts"] == 1 and stats["queued"] == 0
+        dbm.limiter.release()
+        assert dbm.limiter.acquire(timeout=0.05) < 0.05
+
+    def test_async_waiters_share_queue(self):
+        limiter = ConcurrencyLimiter(1)
+
+        async def main():
+            limiter.acquire()
+            order = []
+
+            async def worker(name, value):
+                async with limiter.aslot(value):
+                    order.append(name)
+
+            cancelled = asyncio.create_task(worker("x", 0))
+            tasks = [asyncio.create_task(worker(name, value)) for name, value in [("a", 0), ("b", PRIORITY_HIGH)]]
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            await asyncio.sleep(0.01)
+            assert limiter.stats()["queued"] == 2
+            await asyncio.to_thread(limiter.release)
+            await asyncio.gather(*tasks)
+            return order
+
+        assert asyncio.run(main()) == ["b", "a"]
+        assert limiter.stats()["in_flight"] == 0
+
+
+class TestCoalescing:
+    """相同的只读语句并发执行时合并为一次请求"""
+
+    @staticmethod
+    def concurrent(dbms, sqls, request):
+        """各线程同时执行 sql_execute，第一个请求等到其余线程都发起调用后才返回"""
+        started, release = threading.Event(), threading.Event()
+
+        def slow_request(*args, **kwargs):
+            started.set()
+            release.wait(1)
+            return request(*args, **kwargs)
+
+        results, errors = [None] * len(sqls), []
+
+        def worker(i):
+            try:
+                results[i] = dbms[i].sql_execute(sqls[i])
+            except Exception as e:
+                errors.append(e)
+
+        patches = [mock.patch.object(dbm._session, "request", side_effect=slow_request) for dbm in set(dbms)]
+        mocks = [patch.start() for patch in patches]
+        try:
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(sqls))]
+            threads[0].start()
+            started.wait(1)
+            for thread in threads[1:]:
+                thread.start()
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            for patch in patches:
+                patch.stop()
+        return results, errors, sum(m.call_count for m in mocks)
+
+    def test_identical_queries_share_one_request(self, dbm):
+        sqls = ["SELECT id FROM t WHERE name = 'a'", "select id\nfrom t where name='a';",
+                "select id from t where name = 'a' -- again", "SELECT id FROM t WHERE name = 'a'"]
+        results, errors, requests_sent = self.concurrent(
+            [dbm] * 4, sqls, lambda *args, **kwargs: make_response({"body": {"rows": [{"id": 1}]}}))
+        assert not errors and requests_sent == 1
+        assert results == [[{"id": 1}]] * 4
+        assert len({id(rows[0]) for rows in results}) == 4
+        assert dbm.metrics["sql_executions"] == 1 and dbm.metrics["coalesced"] == 3
+
+    def test_leader_gets_a_copy(self, dbm, monkeypatch):
+        published = []
+        do = manager.sql_flights.do
+        monkeypatch.setattr(manager.sql_flights, "do", lambda *args: published.append(do(*args)) or published[-1])
+        with mock.patch.object(dbm._session, "request", return_value=make_response({"body": {"rows": [{"id": 1}]}})):
+            rows = dbm.sql_execute("select id from t")
+        # leader 修改自己的结果不影响发布给等待方的结果
+        rows[0]["id"] = 2
+        assert published == [[{"id": 1}]]
+
+    def test_errors_are_shared(self, dbm):
+        def bad_request(*args, **kwargs):
+            response = make_response({}, status=400)
+            response.raise_for_status.side_effect = requests.HTTPError("400 Client Error")
+            return response
+
+        results, errors, requests_sent = self.concurrent([dbm] * 3, ["select 1"] * 3, bad_request)
+        assert requests_sent == 1
+        assert len(errors) == 3 and all(isinstance(e, requests.HTTPError) for e in errors)
+
+    def test_writes_and_other_databases_are_not_coalesced(self, dbm):
+        other = DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog", phs_ads_db="phs_dws"))
+        ok = lambda *args, **kwargs: make_response({"body": {"rows": []}})
+        assert self.concurrent([dbm, other], ["select 1"] * 2, ok)[2] == 2
+        assert self.concurrent([dbm, dbm], ["update t set a = 1"] * 2, ok)[2] == 2
+        assert dbm.metrics["coalesced"] == 0
+
+    def test_async(self):
+        async def handler(request):
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"body": {"rows": [{"id": 1}]}})
+
+        async def main(dbm):
+            return await asyncio.gather(*(dbm.sql_execute(sql) for sql in ["select 1", "SELECT  1", "select 1;"]))
+
+        results, dbm = TestAsyncDatabaseManager().run(handler, main)
+        assert results == [[{"id": 1}]] * 3
+        assert dbm.metrics["requests"] == 1 and dbm.metrics["coalesced"] == 2
+
+
+class TestTokenProvider:
+    """内存中的 token 与后台提前刷新"""
+
+    @staticmethod
+    def wait_for(condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.005)
+
+    def test_jwt_expiry(self):
+        expires_at = datetime.now().replace(microsecond=0) + timedelta(hours=2)
+        assert jwt_expiry(fake_catalog_module.jwt_token("someone", expires_at)) == expires_at
+        assert jwt_expiry("cached-token") is None
+        assert jwt_expiry("a.b.c") is None
+        huge = fake_catalog_module.jwt_token("someone", datetime.now()).rsplit(".", 2)
+        payload = base64.urlsafe_b64encode(json.dumps({"exp": 10 ** 20}).encode()).decode().rstrip("=")
+        assert jwt_expiry(".".join([huge[0], payload, huge[2]])) is None
+
+    def test_providers_are_per_catalog_and_user(self, token_cache):
+        other_url = "http://127.0.0.1:8765/api/catalog"
+        assert get_token_provider(TEST_URL, "a") is get_token_provider(TEST_URL + "/", "a")
+        assert get_token_provider(TEST_URL, "a") is not get_token_provider(TEST_URL, "b")
+        assert get_token_provider(TEST_URL, "a") is not get_token_provider(other_url, "a")
+        get_token_provider(other_url, "a").set("other-token")
+        # 其他接口的 token 保存在该接口自己的 auth 缓存中
+        assert get_cache("auth", base_url=other_url).get(token_key(other_url, "a")) == "other-token"
+        assert token_cache.get(token_key(other_url, "a")) is None
+        assert get_token_provider(TEST_URL, "a").peek() is None
+        dbm = DatabaseManager(DatabaseConfig(base_url=TEST_URL, token_refresh=False))
+        assert dbm.token_provider is get_token_provider(TEST_URL, os.getenv("DB_USERNAME"))
+        assert dbm.token_provider.peek() == "cached-token"
+
+    def test_invalidate_removes_stored_token(self, token_cache):
+        provider = get_token_provider(TEST_URL, os.getenv("DB_USERNAME"))
+        assert provider.peek() == "cached-token"
+        provider.invalidate("stale-token")
+        assert token_cache.get(auth_key()) == "cached-token"
+        provider.invalidate("cached-token")
+        assert provider.peek() is None and token_cache.get(auth_key()) is None
+        # 新的 provider 不会再读到被拒绝的 token
+        token_provider_module._providers.clear()
+        assert get_token_provider(TEST_URL, os.getenv("DB_USERNAME")).peek() is None
+
+    def test_requests_read_token_from_memory(self, dbm, token_cache):
+        with mock.patch.object(token_cache, "get", wraps=token_cache.get) as get, \
+                mock.patch.object(dbm._session, "request", return_value=make_response({"body": {"rows": []}})):
+            for i in range(5):
+                dbm.sql_execute(f"select {i}")
+        assert get.call_count == 0
+
+    @pytest.fixture
+    def no_skew(self, monkeypatch):
+        monkeypatch.setattr(token_provider_module, "EXPIRY_SKEW", timedelta(0))
+        monkeypatch.setattr(token_provider_module, "MIN_REFRESH_INTERVAL", timedelta(milliseconds=20))
+
+    def test_refreshes_before_expiry(self, no_skew):
+        logins = []
+
+        def login():
+            logins.append(time.monotonic())
+            return f"token-{len(logins)}"
+
+        store = mock.MagicMock()
+        store.get.return_value = None
+        provider = TokenProvider(store=lambda: store, default_ttl=timedelta(milliseconds=300))
+        provider.start(login)
+        try:
+            self.wait_for(lambda: provider.peek() is not None)
+            seen = set()
+            # 请求线程读取 token 时始终拿到有效 token，不需要登录
+            deadline = time.monotonic() + 0.7
+            while time.monotonic() < deadline:
+                token = provider.peek()
+                assert token is not None
+                seen.add(token)
+                time.sleep(0.005)
+            assert len(seen) >= 2 and provider.refreshes >= 2
+            store.set.assert_called_with("token", f"token-{len(logins)}", ttl=mock.ANY)
+        finally:
+            provider.stop()
+
+    def test_failed_refresh_keeps_old_token(self, no_skew):
+        attempts = []
+
+        def login():
+            attempts.append(1)
+            if len(attempts) > 1:
+                raise requests.ConnectionError("down")
+            return "token-1"
+
+        provider = TokenProvider(default_ttl=timedelta(milliseconds=400))
+        provider.start(login)
+        try:
+            self.wait_for(lambda: provider.failures >= 1)
+            assert provider.peek() == "token-1"
+            self.wait_for(lambda: provider.peek() is None)
+            assert provider.get(lambda: "token-2") == "token-2"
+        finally:
+            provider.stop()
+
+    def test_expired_login_backs_off(self, monkeypatch):
+        monkeypatch.setattr(token_provider_module, "MIN_REFRESH_INTERVAL", timedelta(milliseconds=50))
+        logins = []
+
+        def login():
+            logins.append(1)
+            return fake_catalog_module.jwt_token("someone", datetime.now() - timedelta(minutes=1))
+
+        provider = TokenProvider()
+        provider.start(login)
+        try:
+            time.sleep(0.5)
+            # 立即登录一次，之后按 50、100、200ms 退避
+            assert 3 <= len(logins) <= 5
+            assert provider.peek() is None and provider.refreshes == 0
+        finally:
+            provider.stop()
+        # 前台拿到已过期的 token 时也不会立即安排刷新
+        provider = TokenProvider()
+        provider._login = login
+        provider.set(fake_catalog_module.jwt_token("someone", datetime.now() - timedelta(minutes=1)))
+        try:
+            count = len(logins)
+            time.sleep(0.02)
+            assert len(logins) == count
+        finally:
+            provider.stop()
+
+    def test_expired_jwt_is_not_used(self, token_cache):
+        expired = fake_catalog_module.jwt_token("someone", datetime.now() - timedelta(minutes=1))
+        token_cache.set(auth_key(), expired)
+        dbm = DatabaseManager(DatabaseConfig(base_url="http://catalog.test/api/catalog", token_refresh=False))
+        fresh = fake_catalog_module.jwt_token("someone", datetime.now() + timedelta(hours=1))
+        with mock.patch.object(dbm._session, "request", side_effect=[
+                make_response({"body": {"token": fresh}}), make_response({"body": {"rows": []}})]) as request:
+            dbm.sql_execute("select 1")
+        assert request.call_args_list[0].args[1].endswith("/auth/login")
+        assert request.call_args.kwargs["headers"]["X-Authorization"] == f"Bearer {fresh}"
+        assert dbm.token_provider.expires_at == jwt_expiry(fresh)
+        assert token_cache.get(auth_key()) == fresh
+
+
+class TestSampleCompaction:
+    """示例数据压缩"""
+
+    ROWS = [
+        {"patent_id": "p1", "pdf_url": None, "created_ts": "1733223672000", "drug_id": '["d1", "d2", "d3"]',
+         "authorization_des": '[{"authorization_date": "20090515", "authorization_number": "EU/1/09/522"}]'},
+        {"patent_id": "p2", "pdf_url": "", "updated_by": "data@patsnap.com", "drug_id": '["d4"]',
+         "indication": "line one\nline | two"},
+    ]
+
+    def test_compact_value(self):
+        assert compact_value(None) == "NULL"
+        assert compact_value(3) == "3"
+        assert compact_value('["a", "b"]') == '["a", …]'
+        assert compact_value("x" * 70) == "x" * 64 + "…"
+        assert compact_value("[not json, x]") == "[not json, x]"
+
+    def test_drops_empty_and_audit_columns(self):
+        assert compact_samples(self.ROWS) == (
+            "patent_id | drug_id | authorization_des | indication\n"
+            'p1 | ["d1", …] | [{"authorization_date": "20090515", "authorization_number": "EU/… | NULL\n'
+            'p2 | ["d4"] | NULL | line one line / two')
+        assert compact_samples([{"pdf_url": None, "created_ts": "1"}]) == ""
+
+    def test_byte_cap(self):
+        rows = [{"id": i, "name": "药物" * 40} for i in range(10)]
+        text = compact_samples(rows, max_bytes=400)
+        assert len(text.encode("utf-8")) <= 400
+        assert text.splitlines()[1] == "0 | " + "药物" * 32 + "…"
+        assert len(text.splitlines()) < 11
+
+    def test_wide_table_omits_columns(self):
+        rows = [{f"column_{i:02d}": "value " * 20 for i in range(60)}]
+        text = compact_samples(rows, max_bytes=600)
+        assert len(text.encode("utf-8")) <= 600
+        lines = text.splitlines()
+        assert lines[0].startswith("column_00 | column_01")
+        assert lines[1].startswith("value value valu… | ")
+        assert lines[2] == f"（另有 {60 - lines[0].count('|') - 1} 列未列出）"
+
+    def test_format_table_info(self):
+        assert manager.format_table_info("t", "CREATE TABLE t", []) == "表名：t\n表结构：CREATE TABLE t\n示例数据：无"
+        assert manager.format_table_info("t", "CREATE TABLE t", [{"id": 1}]).endswith("示例数据：\nid\n1")
+
+
+@pytest.fixture(scope="module")
+def fake_catalog():
+    with FakeCatalogServer(FakeCatalog(rows=40)) as server:
+        yield server
+
+
+class TestFakeCatalog:
+    """离线的 data.catalog 接口"""
+
+    @pytest.fixture
+    def dbm(self, fake_catalog):
+        return DatabaseManager(DatabaseConfig(base_url=fake_catalog.base_url, max_retries=0))
+
+    def test_tables_and_descriptions(self, dbm):
+        tables = dict(dbm.get_all_tables())
+        assert {"ads_phs_drug", "ads_phs_dmp_drug", "ads_phs_target"} <= set(tables)
+        assert tables["ads_phs_drug"] == "药物基础信息表"
+        # information_schema 批量生成的描述与逐表 show create table 的结果一致
+        assert dbm.describe_tables() == dbm.get_tables_info(list(tables))
+        assert "`drug_id` varchar(64) NOT NULL COMMENT '药物id'" in dbm.get_table_ddl("ads_phs_drug")
+
+    def test_rows_match_catalog_format(self, dbm):
+        rows = dbm.sql_execute("select drug_id, first_approved_date, target_id from ads_phs_drug")
+        assert len(rows) == 40
+        assert all(isinstance(value, str) for row in rows for value in row.values())
+        assert any("first_approved_date" not in row for row in rows)
+        target = json.loads(rows[0]["target_id"])[0]
+        matched = dbm.sql_execute(f"select drug_id from ads_phs_drug where json_contains(target_id, '\"{target}\"')")
+        assert {"drug_id": rows[0]["drug_id"]} in matched
+        assert sum(1 for _ in dbm.iter_rows("select * from ads_phs_ct", page_size=30, key="clinical_trial_id")) == 80
+
+    def test_columnar_types(self, dbm):
+        sql = "select drug_id, created_ts from ads_phs_drug"
+        result = dbm.execute_columnar(sql)
+        assert result.column("created_ts").dtype == np.int64
+        dtypes = columnar.schema_dtypes(*dbm.get_schema_snapshot(["ads_phs_drug"]).values())
+        assert dbm.execute_columnar(sql, page_size=15, key="drug_id", dtypes=dtypes).column("created_ts").dtype == np.int64
+
+    def test_explain(self, dbm):
+        plan = dbm.explain("select * from ads_phs_dmp_drug d where d.if_nme = 'true'")
+        assert plan.full_scans == {"ads_phs_dmp_drug": 160}
+        with pytest.raises(QueryValidationError):
+            PlanPolicy().check(plan)
+        plan = dbm.explain("select * from ads_phs_dmp_drug where drug_id = 'x'")
+        assert plan.indexes_used == ["idx_drug_id"] and not plan.full_scans
+
+    def test_auth_and_errors(self, dbm, fake_catalog):
+        dbm.sql_execute("select 1")
+        fake_catalog.catalog.revoke_tokens()
+        assert dbm.sql_execute("select 2 as n") == [{"n": "2"}]
+        # 假接口的 token 与测试接口地址分开保存，首次请求直接登录，不会带上其他接口的 token
+        assert dbm.metrics["reauth"] == 1
+        with pytest.raises(requests.HTTPError):
+            dbm.sql_execute("select * from ads_phs_missing")
+
+    def test_history(self, dbm, fake_catalog):
+        dbm.sql_execute("select count(*) from ads_phs_org")
+        history = list(dbm.iter_history(page_size=2, status=None))
+        assert history[0]["query_statement"] == "select count(*) from ads_phs_org"
+        assert len(history) == fake_catalog.catalog.history(1, 10)["total"]
+
+    def test_async(self, fake_catalog):
+        async def main():
+            async with AsyncDatabaseManager(DatabaseConfig(base_url=fake_catalog.base_url)) as dbm:
+                return await dbm.get_tables_info(["ads_phs_drug", "ads_phs_target"])
+
+        infos = asyncio.run(main())
+        assert infos["ads_phs_target"].startswith("表名：ads_phs_target\n表结构：CREATE TABLE `ads_phs_target`")
+
+
+class TestAsyncDatabaseManager:
+    """异步版本与同步版本行为一致"""
+
+    CONFIG = DatabaseConfig(base_url="http://catalog.test/api/catalog", max_retries=2, retry_backoff=0)
+
+    def run(self, handler, coro_fn):
+        async def main():
+            async with AsyncDatabaseManager(self.CONFIG, transport=httpx.MockTransport(handler)) as dbm:
+                return await coro_fn(dbm), dbm
+
+        return asyncio.run(main())
+
+    @staticmethod
+    def jdbc_handler(request):
+        assert request.url.path == "/api/catalog/query/jdbc"
+        assert request.headers["X-Authorization"] == "Bearer cached-token"
+        sql = json.loads(request.content)["sql"]
+        if sql.startswith("show create table"):
+            return httpx.Response(200, json={"body": {"rows": [{"Create Table": f"CREATE TABLE {sql.split()[-1]}"}]}})
+        return httpx.Response(200, json={"body": {"rows": [{"id": 1}]}})
+
+    def test_get_table_info_matches_sync_format(self):
+        info, dbm = self.run(self.jdbc_handler, lambda dbm: dbm.get_table_info("ads_phs_drug"))
+        assert info == manager.format_table_info("ads_phs_drug", "CREATE TABLE ads_phs_drug", [{"id": 1}])
+        assert dbm.metrics["requests"] == 2
+
+    def test_fan_out_over_tables(self):
+        tables = [f"ads_phs_t{i}" for i in range(8)]
+        infos, _ = self.run(self.jdbc_handler,
+                            lambda dbm: asyncio.gather(*(dbm.get_table_info(t) for t in tables)))
+        assert [info.splitlines()[0] for info in infos] == [f"表名：{t}" for t in tables]
+
+    def test_get_all_tables(self):
+        def handler(request):
+            assert request.url.params["dbName"] == "phs_ads"
+            return httpx.Response(200, json={"body": {"metadata_list": {"ads_phs_drug": {"business_description": "药物"}}}})
+
+        tables, _ = self.run(handler, lambda dbm: dbm.get_all_tables())
+        assert tables == [("ads_phs_drug", "药物")]
+
+    def test_read_only_sql_is_retried(self):
+        responses = iter([httpx.ConnectError("reset"), httpx.Response(503), httpx.Response(200, json={"body": {"rows": []}})])
+
+        def handler(request):
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        rows, dbm = self.run(handler, lambda dbm: dbm.sql_execute("select 1"))
+        assert rows == []
+        assert dbm.metrics["retries"] == 2
+
+    def test_non_idempotent_sql_is_not_retried(self):
+        def handler(request):
+            raise httpx.ConnectError("reset")
+
+        with pytest.raises(httpx.ConnectError):
+            self.run(handler, lambda dbm: dbm.sql_execute("insert into t values (1)"))
+
+    def test_concurrent_401_logs_in_once(self, token_cache):
+        logins = []
+
+        async def handler(request):
+            # 让 5 个请求都先拿旧 token 收到 401
+            await asyncio.sleep(0.01)
+            if request.url.path.endswith("/auth/login"):
+                logins.append(request)
+                return httpx.Response(200, json={"body": {"token": "new-token"}})
+            if request.headers["X-Authorization"] == "Bearer cached-token":
+                return httpx.Response(401)
+            return httpx.Response(200, json={"body": {"rows": [{"ok": 1}]}})
+
+        results, dbm = self.run(handler, lambda dbm: asyncio.gather(*(dbm.sql_execute(f"select {i}") for i in range(5))))
+        assert results == [[{"ok": 1}]] * 5
+        assert len(logins) == 1
+        assert token_cache.get(auth_key()) == "new-token"
+        assert dbm.metrics["reauth"] == 5
+
+    def test_execute_query_cache_returns_copies(self):
+        async def run_twice(dbm):
+            first = await dbm.execute_query("select id from t")
+            first.result[0]["id"] = 2
+            second = await dbm.execute_query("select id from t")
+            return second
+
+        second, _ = self.run(self.jdbc_handler, run_twice)
+        assert second.cache_hit and second.result == [{"id": 1}]
+
+    def test_execute_query_preflight(self):
+        sqls = []
+
+        def handler(request):
+            sql = json.loads(request.content)["sql"]
+            sqls.append(sql)
+            return httpx.Response(200, json={"body": {"rows": TIDB_EXPLAIN if sql.startswith("EXPLAIN") else []}})
+
+        with pytest.raises(QueryValidationError):
+            self.run(handler, lambda dbm: dbm.execute_query(TestExplain.SQL, plan_policy=PlanPolicy()))
+        assert sqls == ["EXPLAIN " + TestExplain.SQL]
+
+    def test_concurrent_first_login_logs_in_once(self, token_cache):
+        token_cache.delete(auth_key())
+        logins = []
+
+        async def handler(request):
+            await asyncio.sleep(0.01)
+            if request.url.path.endswith("/auth/login"):
+                logins.append(request)
+                return httpx.Response(200, json={"body": {"token": "new-token"}})
+            assert request.headers["X-Authorization"] == "Bearer new-token"
+            return httpx.Response(200, json={"body": {"rows": [{"ok": 1}]}})
+
+        async def main():
+            config = DatabaseConfig(base_url=self.CONFIG.base_url, token_refresh=False)
+            async with AsyncDatabaseManager(config, transport=httpx.MockTransport(handler)) as dbm:
+                return await asyncio.gather(*(dbm.sql_execute(f"select {i}") for i in range(5)))
+
+        assert asyncio.run(main()) == [[{"ok": 1}]] * 5
+        assert len(logins) == 1
+
+    def test_login_shares_lock_with_sync_login(self, token_cache):
+        token_cache.delete(auth_key())
+        logins, started = [], threading.Event()
+
+        def blocking_login():
+            started.set()
+            time.sleep(0.2)
+            logins.append("sync")
+            return "new-token"
+
+        async def handler(request):
+            if request.url.path.endswith("/auth/login"):
+                logins.append("async")
+                return httpx.Response(200, json={"body": {"token": "async-token"}})
+            return httpx.Response(200, json={"body": {"rows": [{"token": request.headers["X-Authorization"]}]}})
+
+        async def main():
+            config = DatabaseConfig(base_url=self.CONFIG.base_url, token_refresh=False)
+            async with AsyncDatabaseManager(config, transport=httpx.MockTransport(handler)) as dbm:
+                # 同步线程正在登录时，协程等待同一把登录锁，直接使用它拿到的 token
+                thread = threading.Thread(target=dbm.token_provider.get, args=(blocking_login,))
+                thread.start()
+                await asyncio.to_thread(started.wait)
+                rows = await dbm.sql_execute("select 1")
+                thread.join()
+                return rows
+
+        assert asyncio.run(main()) == [{"token": "Bearer new-token"}]
+        assert logins == ["sync"]
+
+    def test_get_tables_info_bounds_concurrency(self):
+        active, peak = [0], [0]
+
+        async def handler(request):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+            return self.jdbc_handler(request)
+
+        tables = [f"ads_phs_t{i}" for i in range(6)]
+
+        async def fetch(dbm):
+            return await dbm.get_tables_info(tables, max_concurrency=3), await dbm.get_table_info(tables[0])
+
+        (infos, single), _ = self.run(handler, fetch)
+        assert list(infos) == tables
+        assert infos[tables[0]] == single
+        assert peak[0] == 3
+
+    def test_describe_tables(self):
+        def handler(request):
+            body = json.loads(request.content)
+            return httpx.Response(200, json=information_schema_request("POST", str(request.url), json=body)
+                                  .json.return_value)
+
+        infos, dbm = self.run(handler, lambda dbm: dbm.describe_tables())
+        assert list(infos) == ["ads_phs_drug"]
+        assert infos["ads_phs_drug"].endswith("示例数据：\nid\n1")
+        assert dbm.metrics["requests"] == 4
+
+    def test_execute_query_shares_result_cache(self, dbm):
+        with mock.patch.object(dbm._session, "request",
+                               return_value=make_response({"body": {"rows": [{"id": 2}]}})):
+            dbm.execute_query("select id from t")
+
+        result, _ = self.run(self.jdbc_handler, lambda adbm: adbm.execute_query("SELECT id FROM t"))
+        assert result.cache_hit and result.result == [{"id": 2}]
+
+    def test_iter_rows(self):
+        def handler(request):
+            sql = json.loads(request.content)["sql"]
+            offset = int(re.search(r"OFFSET (\d+)", sql).group(1))
+            return httpx.Response(200, json={"body": {"rows": [{"id": i} for i in range(offset, min(offset + 4, 10))]}})
+
+        async def collect(dbm):
+            return [row["id"] async for row in dbm.iter_rows("select id from t order by id", page_size=4)]
+
+        ids, dbm = self.run(handler, collect)
+        assert ids == list(range(10))
+        assert dbm.metrics["requests"] == 3
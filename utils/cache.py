@@ -1,67 +1,511 @@
 # -*- coding: utf-8 -*-
 # @Time : 2025/2/18 下午12:08
 # @Author : renjiajia
+import asyncio
+import inspect
+import json
+import logging
+import os
 import pickle
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from utils.cache_backends import CacheBackend, PickleBackend, SQLiteBackend
+from utils.cache_stats import CacheStats, default_prefix
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+LEGACY_CACHE_FILE = Path("data/cache.db")
+SQLITE_CACHE_FILE = Path("data/cache.sqlite3")
+# 命名空间各自的存储文件放在该目录下，不设置时为 catalog_data_dir() / "cache"
+NAMESPACE_DIR: Optional[Path] = None
+
+DEFAULT_CATALOG_URL = "http://data.catalog.patsnap.com/api/catalog"
+DEFAULT_DATA_DIR = Path("data")
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# compress_threshold 的默认值：使用后端的默认阈值（pickle 4096 字节，SQLite 不压缩）
+DEFAULT_COMPRESS_THRESHOLD = "backend"
+
+TTL = Union[int, float, timedelta]
+
+# 缓存项状态：未过期 / 已过期但仍可作为旧值返回 / 不存在或超出最大陈旧时间
+FRESH, STALE, MISS = "fresh", "stale", "miss"
+
+
+def to_timedelta(ttl: TTL) -> timedelta:
+    """把以天为单位的数字或 timedelta 统一成 timedelta"""
+    return ttl if isinstance(ttl, timedelta) else timedelta(days=ttl)
+
+
+# 各命名空间的默认策略（CacheManager 构造参数）
+NAMESPACE_POLICIES: Dict[str, Dict[str, Any]] = {
+    # 数据目录的访问令牌：只有一项，不压缩，不返回过期值
+    "auth": {"ttl": timedelta(hours=12), "max_entries": 16, "max_bytes": 64 * 1024, "compress_threshold": None},
+    # 所有表及其描述
+    "table_list": {"ttl": 30, "max_stale": 7, "max_entries": 16},
+    # 每张表的结构和示例数据，键为表名
+    "table_info": {"ttl": 30, "max_stale": 7, "max_entries": 2000, "max_bytes": 64 * 1024 * 1024},
+    # 只读查询的结果，键为 sql:<接口地址>:<库>:<数据源>:<SQL 指纹>
+    "query_results": {"ttl": timedelta(hours=1), "max_entries": 1000, "max_bytes": 32 * 1024 * 1024},
+}
+
+# 首次创建命名空间存储时，从旧的共享 pickle 缓存中导入哪些键
+LEGACY_KEYS: Dict[str, Callable[[str], bool]] = {
+    "auth": lambda key: key == "token",
+    "table_list": lambda key: key == "all_tables",
+    "table_info": lambda key: key not in ("token", "all_tables"),
+}
+
+
+def catalog_data_dir(base_url: Optional[str] = None) -> Path:
+    """
+    本地缓存和表结构目录所在的目录
+
+    真实的数据目录接口使用 data，其他接口（如 database.fake_catalog）使用 data/catalogs/<接口地址>，
+    合成的表结构和查询结果不会被当作真实数据复用；CATALOG_DATA_DIR 可以替换根目录 data。
+    :param base_url: 数据目录接口地址，默认取 CATALOG_BASE_URL
+    """
+    root = Path(os.getenv("CATALOG_DATA_DIR") or DEFAULT_DATA_DIR)
+    base_url = (base_url or os.getenv("CATALOG_BASE_URL") or DEFAULT_CATALOG_URL).rstrip("/")
+    if base_url == DEFAULT_CATALOG_URL:
+        return root
+    return root / "catalogs" / re.sub(r"[^\w.-]+", "_", base_url.split("://", 1)[-1]).strip("_")
+
+
+def create_backend(name: str, cache_file: Optional[Union[str, Path]] = None,
+                   namespace: Optional[str] = None, base_url: Optional[str] = None) -> CacheBackend:
+    """
+    按名称创建存储后端
+
+    :param name: "sqlite" 或 "pickle"
+    :param cache_file: 存储文件路径，不传则使用默认位置
+    :param namespace: 命名空间，未指定 cache_file 时存储在 <catalog_data_dir(base_url)>/cache/<namespace>.* 中
+    """
+    if name not in ("sqlite", "pickle"):
+        raise ValueError(f"Unknown cache backend: {name}")
+    if cache_file is None and namespace is not None:
+        data_dir = catalog_data_dir(base_url)
+        cache_file = (NAMESPACE_DIR or data_dir / "cache") / (namespace + (".sqlite3" if name == "sqlite" else ".db"))
+        # 旧的共享缓存中是真实接口的数据，只导入到真实接口的存储中
+        if name == "sqlite" and namespace in LEGACY_KEYS and data_dir == DEFAULT_DATA_DIR:
+            return SQLiteBackend(cache_file, legacy_file=LEGACY_CACHE_FILE, legacy_keys=LEGACY_KEYS[namespace])
+    if name == "sqlite":
+        if cache_file is None:
+            # 默认位置首次启用时从旧的 pickle 缓存导入
+            return SQLiteBackend(SQLITE_CACHE_FILE, legacy_file=LEGACY_CACHE_FILE)
+        return SQLiteBackend(cache_file)
+    return PickleBackend(cache_file or LEGACY_CACHE_FILE)
+
+
+_namespaces: Dict[Tuple[str, str], "CacheManager"] = {}
+_namespaces_lock = threading.Lock()
+
+
+def get_cache(namespace: str, base_url: Optional[str] = None, **overrides) -> "CacheManager":
+    """
+    获取命名空间对应的缓存（同一数据目录接口在进程内共享同一个实例）
+
+    每个命名空间有独立的存储文件和策略，读取小而热的命名空间（如 auth）
+    不需要加载其他命名空间的数据，不同命名空间的同名键也不会冲突。
+    :param base_url: 数据目录接口地址，不同接口的缓存保存在不同目录（见 catalog_data_dir），默认取 CATALOG_BASE_URL
+    :param overrides: 覆盖 NAMESPACE_POLICIES 中的默认策略，只在首次创建时生效
+    """
+    key = (str(catalog_data_dir(base_url)), namespace)
+    with _namespaces_lock:
+        cache = _namespaces.get(key)
+        if cache is None:
+            policy = {**NAMESPACE_POLICIES.get(namespace, {}), **overrides}
+            cache = _namespaces[key] = CacheManager(namespace=namespace, base_url=base_url, **policy)
+        return cache
+
+
+class CompressedValue:
+    """
+    zlib 压缩后的缓存值
+
+    存储里只保存压缩后的字节，加载整个缓存时无需反序列化大对象；
+    第一次访问时才解压，解压结果保留在内存中供后续访问复用。
+    """
+
+    __slots__ = ("data", "_value", "_decoded")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._value = None
+        self._decoded = False
+
+    @classmethod
+    def wrap(cls, value: Any, threshold: Optional[int]) -> Any:
+        """序列化后不小于 threshold 字节的值压缩保存，其余原样返回"""
+        if threshold is None:
+            return value
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(raw) < threshold:
+            return value
+        data = zlib.compress(raw, 6)
+        return cls(data) if len(data) < len(raw) else value
+
+    def unwrap(self) -> Any:
+        if not self._decoded:
+            self._value = pickle.loads(zlib.decompress(self.data))
+            self._decoded = True
+        return self._value
+
+    def __getstate__(self):
+        return self.data
+
+    def __setstate__(self, data: bytes):
+        self.data = data
+        self._value = None
+        self._decoded = False
+
+
+def unwrap_value(value: Any) -> Any:
+    return value.unwrap() if isinstance(value, CompressedValue) else value
+
+
+def entry_state(entry: Optional[Dict[str, Any]], now: datetime) -> str:
+    if not entry or now >= entry["expiry"]:
+        return MISS
+    fresh_until = entry.get("fresh_until")
+    if fresh_until is not None and now >= fresh_until:
+        return STALE
+    return FRESH
 
 
 class CacheManager:
-    def __init__(self, ttl: int = 30):
-        self.cache_file = Path("data/cache.db")
+    """
+    键值缓存，存储由可替换的后端负责
+
+    默认后端由环境变量 CACHE_BACKEND 决定（sqlite/pickle），未设置时使用 sqlite。
+    缓存项数量和字节数有上限，超出时按最近访问时间淘汰；过期项在打开缓存时
+    以及每 compact_every 次写入后整理一次，两次整理之间允许短暂超出上限。
+    序列化后不小于 compress_threshold 字节的值以 zlib 压缩保存，读取时才解压，
+    传 None 关闭压缩；默认只有 pickle 后端压缩，SQLite 按键读取，压缩只会增加解压开销。
+    命中/未命中/淘汰等计数和读写延迟按键前缀统计，通过 stats() 获取；
+    设置 stats_interval（秒）后会定期输出一行 JSON 格式的统计日志。
+
+    设置 max_stale 后启用 stale-while-revalidate：缓存项过期后的 max_stale 时间内，
+    get_or_compute 先返回旧值并在后台线程刷新；超过 max_stale 则同步刷新。
+    get/exists 始终只认未过期的值。
+
+    指定 namespace 时使用独立的存储文件（按 base_url 区分目录），一般通过 get_cache(namespace) 获取共享实例。
+    """
+
+    def __init__(self, ttl: TTL = 30, cache_file: Optional[Union[str, Path]] = None,
+                 backend: Optional[Union[str, CacheBackend]] = None,
+                 max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+                 compact_every: int = 32,
+                 prefix_fn: Callable[[str], str] = default_prefix,
+                 stats_interval: Optional[float] = None,
+                 compress_threshold: Union[int, None, str] = DEFAULT_COMPRESS_THRESHOLD,
+                 max_stale: Optional[TTL] = None,
+                 namespace: Optional[str] = None,
+                 base_url: Optional[str] = None):
         self.ttl = ttl
-        self._ensure_cache_file()
+        self.namespace = namespace
+        self.max_stale = max_stale
+        self.compress_threshold = compress_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        if not isinstance(backend, CacheBackend):
+            backend = create_backend(backend or os.getenv("CACHE_BACKEND", "sqlite"), cache_file, namespace, base_url)
+        self.backend = backend
+        if compress_threshold == DEFAULT_COMPRESS_THRESHOLD:
+            self.compress_threshold = backend.compress_threshold
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self._writes = 0
+        self._flights = SingleFlight()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self._refresh_tasks = set()
+        self.metrics = CacheStats(prefix_fn)
+        self._closed = threading.Event()
+        self.compact()
+        if stats_interval:
+            threading.Thread(target=self._report_stats, args=(stats_interval,),
+                             name="cache-stats", daemon=True).start()
+
+    def _report_stats(self, interval: float) -> None:
+        """定期输出结构化统计日志"""
+        while not self._closed.wait(interval):
+            try:
+                stats = {"namespace": self.namespace, **self.stats()}
+                logger.info("cache_stats %s", json.dumps(stats, ensure_ascii=False))
+            except Exception as e:
+                logger.warning("Failed to report cache stats: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回缓存统计
+
+        :return: {"total": {...}, "prefixes": {prefix: {hits, stale, misses, expired, evictions, stores,
+                 deletes, hit_ratio, entries, bytes_stored, load_latency, store_latency}}}
+        """
+        return self.metrics.snapshot(self.backend.sizes())
+
+    def close(self) -> None:
+        """停止统计日志和后台刷新线程并释放存储"""
+        self._closed.set()
+        if self._refresher is not None:
+            self._refresher.shutdown(wait=True)
+        self.backend.close()
 
-    def _ensure_cache_file(self):
-        if not self.cache_file.exists():
-            self.cache_file.parent.mkdir(exist_ok=True)
-            with open(self.cache_file, "wb") as f:
-                pickle.dump({}, f)
+    def _touch(self, key: str) -> None:
+        """记录命中时间，下次整理时写入存储用于 LRU 排序"""
+        with self._lock:
+            self._accessed[key] = time.time()
+
+    def _after_write(self) -> None:
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= self.compact_every
+        if due:
+            self.compact()
+
+    def compact(self) -> Tuple[int, int]:
+        """
+        整理缓存：删除过期项，并按 LRU 淘汰超出上限的缓存项
+
+        :return: (删除的过期项数量, 淘汰的缓存项数量)
+        """
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._writes = 0
+        expired, evicted = self.backend.compact(datetime.now(), self.max_entries, self.max_bytes, accessed)
+        self.metrics.add_purged(expired)
+        self.metrics.count("evictions", evicted)
+        return expired, len(evicted)
+
+    def invalidate(self) -> None:
+        """丢弃进程内的读缓存，下次访问时强制从存储读取"""
+        self.backend.invalidate()
+
+    def _lookup(self, key: str, record: bool = True, allow_stale: bool = False) -> Tuple[str, Any]:
+        """
+        返回 (状态, 值)，状态为 FRESH/STALE/MISS，用于区分未命中和缓存的 None
+
+        :param record: 是否计入命中/未命中统计
+        :param allow_stale: 是否把已过期但未超出 max_stale 的旧值当作命中返回
+        """
+        start = time.perf_counter()
+        entry = self.backend.get_entry(key)
+        self.metrics.observe("load", [key], time.perf_counter() - start)
+        state = entry_state(entry, datetime.now())
+        if state == FRESH or (state == STALE and allow_stale):
+            self._touch(key)
+            if record:
+                self.metrics.count("hits" if state == FRESH else "stale", [key])
+            return state, unwrap_value(entry["value"])
+        if record:
+            self.metrics.count("misses", [key])
+            if entry:
+                self.metrics.count("expired", [key])
+        return MISS, None
 
     def get(self, key: str) -> Any:
         """获取缓存项"""
-        with open(self.cache_file, "rb") as f:
-            cache = pickle.load(f)
+        return self._lookup(key)[1]
 
-        entry = cache.get(key)
-        if entry and datetime.now() < entry["expiry"]:
-            return entry["value"]
-        return None
+    def get_many(self, keys: Iterable[str], refresh: Optional[Callable[[str], Any]] = None,
+                 ttl: Optional[TTL] = None) -> Dict[str, Any]:
+        """
+        批量获取缓存项，只读取一次存储
 
-    def set(self, key: str, value: Any) -> None:
-        """设置缓存项"""
-        with open(self.cache_file, "rb") as f:
-            cache = pickle.load(f)
+        :param refresh: 启用 max_stale 时，传入后已过期的旧值也会返回，并在后台调用 refresh(key) 刷新
+        :param ttl: 后台刷新写入时使用的有效期
+        :return: 命中的 {key: value}，未命中或已过期的键不在结果中
+        """
+        keys = list(keys)
+        start = time.perf_counter()
+        entries = self.backend.get_entries(keys)
+        self.metrics.observe("load", keys, time.perf_counter() - start)
+        now = datetime.now()
+        allow_stale = refresh is not None and self.max_stale is not None
+        result, stale = {}, []
+        for key, entry in entries.items():
+            state = entry_state(entry, now)
+            if state == FRESH or (state == STALE and allow_stale):
+                result[key] = unwrap_value(entry["value"])
+                self._touch(key)
+                if state == STALE:
+                    stale.append(key)
+        for key in stale:
+            self._revalidate(key, partial(refresh, key), ttl)
+        self.metrics.count("hits", [key for key in result if key not in stale])
+        self.metrics.count("stale", stale)
+        self.metrics.count("misses", [key for key in keys if key not in result])
+        self.metrics.count("expired", [key for key in entries if key not in result])
+        return result
 
-        cache[key] = {
-            "value": value,
-            "expiry": datetime.now() + timedelta(days=self.ttl)
-        }
+    def _loader(self, key: str, fn: Callable[[], Any], ttl: Optional[TTL]) -> Callable[[], Any]:
+        """未命中时的加载函数：成为 leader 后再确认一次，仍未命中才调用 fn 并写入"""
+        def load():
+            # 成为 leader 前其他线程或进程可能已经写入
+            state, value = self._lookup(key, record=False)
+            if state == FRESH:
+                return value
+            value = fn()
+            self.set(key, value, ttl)
+            return value
+        return load
 
-        with open(self.cache_file, "wb") as f:
-            pickle.dump(cache, f)
+    def _refresh(self, key: str, load: Callable[[], Any]) -> None:
+        try:
+            self._flights.do(key, load)
+        except Exception as e:
+            logger.warning("Background refresh of cache key %s failed: %s", key, e)
 
-    def delete(self, key: str) -> None:
-        """删除缓存项"""
-        with open(self.cache_file, "rb") as f:
-            cache = pickle.load(f)
+    def _revalidate(self, key: str, fn: Callable[[], Any], ttl: Optional[TTL]) -> None:
+        """在后台线程刷新旧值，同一个键同时只有一个刷新"""
+        if self._flights.in_flight(key):
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._refresher.submit(self._refresh, key, self._loader(key, fn, ttl))
+
+    def get_or_compute(self, key: str, fn: Callable[[], Any], ttl: Optional[TTL] = None) -> Any:
+        """
+        读取缓存项，未命中时调用 fn 计算并写入缓存
 
-        if key in cache:
-            del cache[key]
+        同一个键上并发的未命中（包括 aget_or_compute 发起的）只会调用一次 fn，
+        其余调用方等待并共享结果；fn 抛出的异常同样传给所有等待方，且不会写入缓存。
+        启用 max_stale 时，已过期的旧值直接返回并在后台刷新。
+        """
+        state, value = self._lookup(key, allow_stale=self.max_stale is not None)
+        if state == STALE:
+            self._revalidate(key, fn, ttl)
+        if state != MISS:
+            return value
+        return self._flights.do(key, self._loader(key, fn, ttl))
 
-        with open(self.cache_file, "wb") as f:
-            pickle.dump(cache, f)
+    def get_or_compute_many(self, keys: Iterable[str], fn: Callable[[List[str]], Dict[str, Any]],
+                            ttl: Optional[TTL] = None,
+                            refresh: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """
+        批量读取缓存项，所有未命中的键一次性交给 fn 计算并写入缓存
+
+        与 get_or_compute 一样按键合并并发的未命中：其他调用方（包括 get_or_compute）正在计算的键
+        只等待其结果，其余未命中的键一次性交给 fn，适合 fn 本身能并发拉取多个键的场景。
+        :param fn: 接收未命中的键列表，返回 {key: value}
+        :param refresh: 启用 max_stale 时后台刷新单个旧值的函数，默认用 fn 计算该键
+        :return: {key: value}，按传入顺序
+        """
+        keys = list(dict.fromkeys(keys))
+        result = self.get_many(keys, refresh=refresh or (lambda key: fn([key])[key]), ttl=ttl)
+        missing = [key for key in keys if key not in result]
+        if missing:
+            result.update(self._flights.do_many(missing, partial(self._load_many, fn=fn, ttl=ttl)))
+        return {key: result[key] for key in keys}
+
+    def _load_many(self, keys: List[str], fn: Callable[[List[str]], Dict[str, Any]],
+                   ttl: Optional[TTL]) -> Dict[str, Any]:
+        """批量未命中的加载函数：成为 leader 后再确认一次，仍未命中的键才交给 fn 并写入"""
+        # 成为 leader 前其他线程或进程可能已经写入
+        loaded = {}
+        for key in keys:
+            state, value = self._lookup(key, record=False)
+            if state == FRESH:
+                loaded[key] = value
+        missing = [key for key in keys if key not in loaded]
+        if missing:
+            computed = fn(missing)
+            self.set_many(computed, ttl)
+            loaded.update(computed)
+        return loaded
+
+    async def aget_or_compute(self, key: str, fn: Callable[[], Any], ttl: Optional[TTL] = None) -> Any:
+        """
+        get_or_compute 的异步版本，fn 可以是协程函数或普通函数（在线程池中执行）
+        """
+        state, value = self._lookup(key, allow_stale=self.max_stale is not None)
+        if state == FRESH:
+            return value
+
+        async def load():
+            state, value = self._lookup(key, record=False)
+            if state == FRESH:
+                return value
+            if inspect.iscoroutinefunction(fn):
+                value = await fn()
+            else:
+                value = await asyncio.to_thread(fn)
+            self.set(key, value, ttl)
+            return value
+
+        if state == STALE:
+            if not inspect.iscoroutinefunction(fn):
+                self._revalidate(key, fn, ttl)
+            elif not self._flights.in_flight(key):
+                # 协程函数的刷新放到当前事件循环的后台任务中执行
+                task = asyncio.get_running_loop().create_task(self._arefresh(key, load))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return value
+        return await self._flights.ado(key, load)
+
+    async def _arefresh(self, key: str, load: Callable[[], Any]) -> None:
+        try:
+            await self._flights.ado(key, load)
+        except Exception as e:
+            logger.warning("Background refresh of cache key %s failed: %s", key, e)
+
+    def _make_entry(self, value: Any, ttl: Optional[TTL], now: datetime) -> Dict[str, Any]:
+        fresh_until = now + to_timedelta(self.ttl if ttl is None else ttl)
+        entry = {"value": CompressedValue.wrap(value, self.compress_threshold), "expiry": fresh_until}
+        if self.max_stale is not None:
+            entry["fresh_until"] = fresh_until
+            entry["expiry"] = fresh_until + to_timedelta(self.max_stale)
+        return entry
+
+    def set(self, key: str, value: Any, ttl: Optional[TTL] = None) -> None:
+        """
+        设置缓存项
+
+        :param ttl: 该缓存项的有效期，数字表示天数，不传则使用实例的默认 ttl
+        """
+        start = time.perf_counter()
+        self.backend.set_entry(key, self._make_entry(value, ttl, datetime.now()))
+        self.metrics.observe("store", [key], time.perf_counter() - start)
+        self.metrics.count("stores", [key])
+        self._after_write()
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[TTL] = None) -> None:
+        """批量设置缓存项，只写入一次存储"""
+        if not items:
+            return
+        now = datetime.now()
+        start = time.perf_counter()
+        self.backend.set_entries({key: self._make_entry(value, ttl, now) for key, value in items.items()})
+        self.metrics.observe("store", items, time.perf_counter() - start)
+        self.metrics.count("stores", items)
+        self._after_write()
+
+    def delete(self, key: str) -> None:
+        """删除缓存项"""
+        start = time.perf_counter()
+        self.backend.delete_entry(key)
+        self.metrics.observe("store", [key], time.perf_counter() - start)
+        self.metrics.count("deletes", [key])
+        with self._lock:
+            self._accessed.pop(key, None)
 
     def exists(self, key: str) -> bool:
         """检查缓存项是否存在"""
-        with open(self.cache_file, "rb") as f:
-            cache = pickle.load(f)
-
-        entry = cache.get(key)
-        if entry and datetime.now() < entry["expiry"]:
-            return True
-        return False
+        return entry_state(self.backend.get_entry(key), datetime.now()) == FRESH
 
 # 测试
 if __name__ == "__main__":
@@ -70,6 +514,3 @@ if __name__ == "__main__":
     print(cache.get("user"))
     cache.delete("user")
     print(cache.get("user"))  # None
-
-
-
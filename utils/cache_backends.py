@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+CacheManager 的存储后端
+
+每个缓存项在后端中表示为 {"value": Any, "expiry": datetime}，启用过期后继续提供
+旧值（stale-while-revalidate）时还带有 "fresh_until": datetime，此时 expiry 是允许
+继续提供旧值的最晚时间。后端另外记录序列化后的大小 size 与最近访问时间 accessed，
+用于按 LRU 淘汰。
+过期判断由 CacheManager 负责，后端负责按键读写和整理（compact）。
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+Entry = Dict[str, Any]
+
+
+@contextmanager
+def file_lock(lock_file: Path) -> Iterator[None]:
+    """
+    跨进程的排他建议锁（POSIX 使用 flock，Windows 使用 msvcrt.locking）
+
+    同一进程内的线程互斥由调用方的 threading 锁负责。
+    """
+    with open(lock_file, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍失败会抛出异常，继续等待
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def select_evictions(items: Iterable[Tuple[str, int, float]], max_entries: Optional[int] = None,
+                     max_bytes: Optional[int] = None) -> List[str]:
+    """
+    按最近访问时间从旧到新挑选需要淘汰的键，直到满足数量和字节上限
+
+    :param items: (key, size, accessed) 序列
+    :return: 需要淘汰的键
+    """
+    items = sorted(items, key=lambda item: item[2])
+    count = len(items)
+    total = sum(size for _, size, _ in items)
+    evicted = []
+    for key, size, _ in items:
+        if (max_entries is None or count <= max_entries) and (max_bytes is None or total <= max_bytes):
+            break
+        evicted.append(key)
+        count -= 1
+        total -= size
+    return evicted
+
+
+class CacheBackend:
+    """缓存存储后端接口"""
+
+    # 默认的压缩阈值（字节），None 表示不压缩；CacheManager 未指定 compress_threshold 时使用
+    compress_threshold: Optional[int] = None
+
+    def get_entry(self, key: str) -> Optional[Entry]:
+        raise NotImplementedError
+
+    def set_entry(self, key: str, entry: Entry) -> None:
+        raise NotImplementedError
+
+    def delete_entry(self, key: str) -> None:
+        raise NotImplementedError
+
+    def get_entries(self, keys: Iterable[str]) -> Dict[str, Entry]:
+        """批量读取，只返回存在的键"""
+        entries = {}
+        for key in keys:
+            entry = self.get_entry(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def set_entries(self, entries: Dict[str, Entry]) -> None:
+        """批量写入"""
+        for key, entry in entries.items():
+            self.set_entry(key, entry)
+
+    def compact(self, expired_before: datetime, max_entries: Optional[int] = None,
+                max_bytes: Optional[int] = None, accessed: Optional[Dict[str, float]] = None) -> Tuple[int, List[str]]:
+        """
+        删除过期项，并按 LRU 淘汰超出上限的缓存项
+
+        :param expired_before: expiry 早于该时间的缓存项视为可删除
+        :param accessed: 进程内记录的最近访问时间，整理时一并写入存储
+        :return: (删除的过期项数量, 被淘汰的键)
+        """
+        raise NotImplementedError
+
+    def sizes(self) -> Dict[str, int]:
+        """返回每个键序列化后的字节数"""
+        raise NotImplementedError
+
+    def usage(self) -> Tuple[int, int]:
+        """返回 (缓存项数量, 值占用的字节数)"""
+        sizes = self.sizes()
+        return len(sizes), sum(sizes.values())
+
+    def invalidate(self) -> None:
+        """丢弃进程内的读缓存（如果有）"""
+
+    def close(self) -> None:
+        """释放后端持有的资源"""
+
+
+class PickleBackend(CacheBackend):
+    """
+    单个 pickle 文件保存全部缓存项
+
+    进程内保留一份文件的内存快照，读取时只比较文件的 mtime/size/inode，
+    文件未被其他进程修改时直接走字典查找。每次写入都会重写整个文件：
+    先写临时文件再原子替换，读者不会读到写了一半的文件；
+    读-改-写过程持有 <cache_file>.lock 上的排他锁，多进程并发写入不会丢失更新。
+    """
+
+    # 每次读取都要加载整个文件，压缩大值可以减少读写的字节数
+    compress_threshold = 4096
+
+    def __init__(self, cache_file: Union[str, Path] = "data/cache.db"):
+        self.cache_file = Path(cache_file)
+        self.lock_file = self.cache_file.with_name(self.cache_file.name + ".lock")
+        self._lock = threading.RLock()
+        self._snapshot: Dict[str, Entry] = {}
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._ensure_cache_file()
+
+    def _ensure_cache_file(self):
+        if not self.cache_file.exists():
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with self._locked():
+                if not self.cache_file.exists():
+                    self._dump({})
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """同时持有线程锁和跨进程文件锁"""
+        with self._lock, file_lock(self.lock_file):
+            yield
+
+    def _file_signature(self) -> Tuple[int, int, int]:
+        """缓存文件的版本标识，用于判断内存快照是否过期"""
+        st = os.stat(self.cache_file)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _load(self) -> Dict[str, Entry]:
+        """返回缓存内容，文件未变化时复用内存快照"""
+        with self._lock:
+            signature = self._file_signature()
+            if signature != self._signature:
+                with open(self.cache_file, "rb") as f:
+                    self._snapshot = pickle.load(f)
+                self._signature = signature
+            return self._snapshot
+
+    def _dump(self, cache: Dict[str, Entry]) -> None:
+        """原子地写回缓存文件并同步内存快照，调用方需持有 _locked()"""
+        fd, tmp_path = tempfile.mkstemp(prefix=self.cache_file.name + ".", suffix=".tmp",
+                                        dir=self.cache_file.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            self._replace(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._snapshot = cache
+        self._signature = self._file_signature()
+
+    def _replace(self, tmp_path: str, attempts: int = 10) -> None:
+        """用临时文件替换缓存文件；Windows 上目标文件被读者打开时短暂重试"""
+        for attempt in range(attempts):
+            try:
+                os.replace(tmp_path, self.cache_file)
+                return
+            except PermissionError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.01 * (attempt + 1))
+
+    @staticmethod
+    def _entry_size(entry: Entry) -> int:
+        """缓存项序列化后的大小，旧文件中没有 size 字段时补算一次"""
+        if "size" not in entry:
+            entry["size"] = len(pickle.dumps(entry["value"], protocol=pickle.HIGHEST_PROTOCOL))
+        return entry["size"]
+
+    def load_all(self) -> Dict[str, Entry]:
+        """返回全部缓存项（只读视图）"""
+        return self._load()
+
+    def get_entry(self, key: str) -> Optional[Entry]:
+        return self._load().get(key)
+
+    def set_entry(self, key: str, entry: Entry) -> None:
+        entry = {**entry, "accessed": time.time()}
+        self._entry_size(entry)
+        with self._locked():
+            cache = dict(self._load())
+            cache[key] = entry
+            self._dump(cache)
+
+    def get_entries(self, keys: Iterable[str]) -> Dict[str, Entry]:
+        cache = self._load()
+        return {key: cache[key] for key in keys if key in cache}
+
+    def set_entries(self, entries: Dict[str, Entry]) -> None:
+        now = time.time()
+        entries = {key: {**entry, "accessed": now} for key, entry in entries.items()}
+        for entry in entries.values():
+            self._entry_size(entry)
+        with self._locked():
+            cache = dict(self._load())
+            cache.update(entries)
+            self._dump(cache)
+
+    def delete_entry(self, key: str) -> None:
+        with self._locked():
+            cache = self._load()
+            if key not in cache:
+                return
+            cache = dict(cache)
+            del cache[key]
+            self._dump(cache)
+
+    def compact(self, expired_before: datetime, max_entries: Optional[int] = None,
+                max_bytes: Optional[int] = None, accessed: Optional[Dict[str, float]] = None) -> Tuple[int, List[str]]:
+        accessed = accessed or {}
+        with self._locked():
+            cache = self._load()
+            kept = {key: entry for key, entry in cache.items() if entry["expiry"] > expired_before}
+            expired = len(cache) - len(kept)
+            evicted = select_evictions(
+                ((key, self._entry_size(entry), max(entry.get("accessed", 0.0), accessed.get(key, 0.0)))
+                 for key, entry in kept.items()),
+                max_entries, max_bytes
+            )
+            for key in evicted:
+                del kept[key]
+            touched = {key: ts for key, ts in accessed.items()
+                       if key in kept and ts > kept[key].get("accessed", 0.0)}
+            # 没有删除任何缓存项时也要写回访问时间，否则下次淘汰会按写入时间排序
+            if not expired and not evicted and not touched:
+                return 0, []
+            for key, ts in touched.items():
+                kept[key] = {**kept[key], "accessed": ts}
+            self._dump(kept)
+        return expired, evicted
+
+    def sizes(self) -> Dict[str, int]:
+        return {key: self._entry_size(entry) for key, entry in self._load().items()}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._signature = None
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite（WAL 模式）存储，每个键一行
+
+    写入和按键读取都是单行操作，与缓存总大小无关；expiry、accessed 列带索引，
+    便于清理过期项和按 LRU 淘汰。进程内按键保留已反序列化的值，
+    通过 PRAGMA data_version 感知其他连接的提交。
+    """
+
+    def __init__(self, db_file: Union[str, Path] = "data/cache.sqlite3",
+                 legacy_file: Optional[Union[str, Path]] = None,
+                 legacy_keys: Optional[Callable[[str], bool]] = None, timeout: float = 30.0):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_file), timeout=timeout,
+                                     check_same_thread=False, isolation_level=None)
+        self._memo: Dict[str, Entry] = {}
+        self._data_version: Optional[int] = None
+        self._init_schema()
+        if legacy_file is not None:
+            self.migrate_from_pickle(legacy_file, legacy_keys)
+
+    def _init_schema(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key      TEXT PRIMARY KEY,
+                    value    BLOB NOT NULL,
+                    expiry   REAL NOT NULL,
+                    size     INTEGER NOT NULL DEFAULT 0,
+                    accessed REAL NOT NULL DEFAULT 0,
+                    fresh    REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache (expiry);
+                CREATE TABLE IF NOT EXISTS meta (
+                    name  TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+            if "size" not in columns:
+                # 早期版本的表结构没有 size/accessed 列
+                self._conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE cache SET size = length(value)")
+            if "fresh" not in columns:
+                self._conn.execute("ALTER TABLE cache ADD COLUMN fresh REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)")
+
+    def _check_version(self) -> None:
+        """其他连接提交过写入时清空进程内的值缓存"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._memo.clear()
+            self._data_version = version
+
+    @staticmethod
+    def _encode(entry: Entry) -> Tuple[bytes, float, Optional[float]]:
+        fresh = entry.get("fresh_until")
+        return (pickle.dumps(entry["value"], protocol=pickle.HIGHEST_PROTOCOL), entry["expiry"].timestamp(),
+                fresh.timestamp() if fresh else None)
+
+    @staticmethod
+    def _decode(value: bytes, expiry: float, fresh: Optional[float]) -> Entry:
+        entry = {"value": pickle.loads(value), "expiry": datetime.fromtimestamp(expiry)}
+        if fresh is not None:
+            entry["fresh_until"] = datetime.fromtimestamp(fresh)
+        return entry
+
+    def get_entry(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            self._check_version()
+            if key in self._memo:
+                return self._memo[key]
+            row = self._conn.execute("SELECT value, expiry, fresh FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            entry = self._decode(*row)
+            self._memo[key] = entry
+            return entry
+
+    def get_entries(self, keys: Iterable[str]) -> Dict[str, Entry]:
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            self._check_version()
+            entries = {key: self._memo[key] for key in keys if key in self._memo}
+            missing = [key for key in keys if key not in entries]
+            # 分批查询，避免超出 SQLite 的参数个数上限
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, expiry, fresh FROM cache WHERE key IN ({placeholders})", chunk
+                )
+                for key, value, expiry, fresh in rows:
+                    entries[key] = self._memo[key] = self._decode(value, expiry, fresh)
+        return entries
+
+    def set_entry(self, key: str, entry: Entry) -> None:
+        self.set_entries({key: entry})
+
+    def set_entries(self, entries: Dict[str, Entry]) -> None:
+        now = time.time()
+        rows = []
+        for key, entry in entries.items():
+            value, expiry, fresh = self._encode(entry)
+            rows.append((key, value, expiry, fresh, len(value), now))
+        with self._lock:
+            self._check_version()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expiry, fresh, size, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._memo.update(entries)
+
+    def delete_entry(self, key: str) -> None:
+        with self._lock:
+            self._check_version()
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._memo.pop(key, None)
+
+    def compact(self, expired_before: datetime, max_entries: Optional[int] = None,
+                max_bytes: Optional[int] = None, accessed: Optional[Dict[str, float]] = None) -> Tuple[int, List[str]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if accessed:
+                    self._conn.executemany("UPDATE cache SET accessed = max(accessed, ?) WHERE key = ?",
+                                           [(ts, key) for key, ts in accessed.items()])
+                expired = self._conn.execute("DELETE FROM cache WHERE expiry <= ?",
+                                             (expired_before.timestamp(),)).rowcount
+                evicted = []
+                if max_entries is not None or max_bytes is not None:
+                    count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+                    if (max_entries is not None and count > max_entries) or (max_bytes is not None and total > max_bytes):
+                        evicted = select_evictions(self._conn.execute("SELECT key, size, accessed FROM cache"),
+                                                   max_entries, max_bytes)
+                        self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in evicted])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if expired or evicted:
+                self._memo.clear()
+        return expired, evicted
+
+    def sizes(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, size FROM cache"))
+
+    def usage(self) -> Tuple[int, int]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return count, total
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._memo.clear()
+            self._data_version = None
+
+    def migrate_from_pickle(self, legacy_file: Union[str, Path],
+                            keys: Optional[Callable[[str], bool]] = None) -> int:
+        """
+        从旧的 pickle 缓存文件一次性导入缓存项
+
+        导入结果记录在 meta 表中，之后不会重复导入；已存在的键不会被覆盖。
+        :param keys: 只导入满足该条件的键，不传则全部导入
+        :return: 导入的缓存项数量
+        """
+        legacy_file = Path(legacy_file)
+        if not legacy_file.exists():
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self._conn.execute("SELECT 1 FROM meta WHERE name = 'migrated_from'").fetchone()
+                if done:
+                    self._conn.execute("COMMIT")
+                    return 0
+                with open(legacy_file, "rb") as f:
+                    legacy = pickle.load(f)
+                rows = []
+                for key, entry in legacy.items():
+                    if keys is not None and not keys(key):
+                        continue
+                    value, expiry, fresh = self._encode(entry)
+                    rows.append((key, value, expiry, fresh, len(value)))
+                self._conn.executemany("INSERT OR IGNORE INTO cache (key, value, expiry, fresh, size) VALUES (?, ?, ?, ?, ?)",
+                                       rows)
+                self._conn.execute("INSERT INTO meta (name, value) VALUES ('migrated_from', ?)",
+                                   (str(legacy_file),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._memo.clear()
+        logger.info("Migrated %d cache entries from %s", len(rows), legacy_file)
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+CacheManager 的计数器与延迟直方图
+
+计数和延迟都按键前缀分组，前缀默认取键中第一个 ":" 或 "_" 之前的部分
+（如 "token"、"all_tables" -> "all"、"ads_phs_drug" -> "ads"），可以通过 prefix_fn 自定义。
+"""
+
+import bisect
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 延迟直方图的桶上界（毫秒），最后一个桶收集所有更慢的操作
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+COUNTERS = ("hits", "stale", "misses", "expired", "evictions", "stores", "deletes")
+
+
+def default_prefix(key: str) -> str:
+    """键前缀：第一个 ":" 或 "_" 之前的部分"""
+    return re.split(r"[:_]", key, maxsplit=1)[0]
+
+
+class Histogram:
+    """固定桶的延迟直方图"""
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        count = sum(self.counts)
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        count = sum(self.counts)
+        labels = [f"le_{bound}" for bound in self.bounds] + ["inf"]
+        return {
+            "count": count,
+            "avg_ms": round(self.total_ms / count, 4) if count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 4),
+            "buckets": {label: n for label, n in zip(labels, self.counts) if n},
+        }
+
+
+class CacheStats:
+    """按键前缀统计的缓存指标"""
+
+    def __init__(self, prefix_fn: Callable[[str], str] = default_prefix):
+        self.prefix_fn = prefix_fn
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Counter] = defaultdict(Counter)
+        self._latency: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self._purged = 0
+
+    def _prefixes(self, keys: Iterable[str]) -> List[str]:
+        return list(dict.fromkeys(self.prefix_fn(key) for key in keys))
+
+    def count(self, event: str, keys: Iterable[str]) -> None:
+        """每个键记一次事件"""
+        with self._lock:
+            for key in keys:
+                self._counters[self.prefix_fn(key)][event] += 1
+
+    def observe(self, op: str, keys: Iterable[str], seconds: float) -> None:
+        """记录一次 load/store 操作的耗时，批量操作在涉及的每个前缀下各记一次"""
+        ms = seconds * 1000
+        with self._lock:
+            for prefix in self._prefixes(keys):
+                self._latency[(prefix, op)].observe(ms)
+
+    def add_purged(self, n: int) -> None:
+        with self._lock:
+            self._purged += n
+
+    def snapshot(self, sizes: Dict[str, int]) -> Dict:
+        """
+        :param sizes: 存储中当前每个键的字节数，用于统计各前缀的条目数和占用
+        """
+        stored: Dict[str, Counter] = defaultdict(Counter)
+        for key, size in sizes.items():
+            prefix = self.prefix_fn(key)
+            stored[prefix]["entries"] += 1
+            stored[prefix]["bytes"] += size
+        with self._lock:
+            prefixes = sorted(set(self._counters) | set(stored) | {p for p, _ in self._latency})
+            result = {}
+            for prefix in prefixes:
+                counters = self._counters.get(prefix, Counter())
+                lookups = counters["hits"] + counters["misses"]
+                result[prefix] = {
+                    **{name: counters[name] for name in COUNTERS},
+                    "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+                    "entries": stored[prefix]["entries"],
+                    "bytes_stored": stored[prefix]["bytes"],
+                    "load_latency": self._latency.get((prefix, "load"), Histogram()).snapshot(),
+                    "store_latency": self._latency.get((prefix, "store"), Histogram()).snapshot(),
+                }
+            totals = Counter()
+            for counters in self._counters.values():
+                totals.update(counters)
+            return {
+                "total": {
+                    **{name: totals[name] for name in COUNTERS},
+                    "expired_purged": self._purged,
+                    "entries": len(sizes),
+                    "bytes_stored": sum(sizes.values()),
+                },
+                "prefixes": result,
+            }
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# @Author : renjiajia
+"""
+合并并发的重复调用（single-flight）
+
+同一个键上同时发起的多次调用只有第一次（leader）真正执行，其余调用等待并共享
+leader 的结果或异常。线程和 asyncio 任务共用同一张在途调用表，因此两者之间的
+并发调用也会被合并。
+"""
+
+import asyncio
+import inspect
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Set, Tuple
+
+
+class SingleFlight:
+    """按键合并在途调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _claim(self, key: Hashable) -> Tuple[Future, bool]:
+        """返回该键的在途调用，以及当前调用方是否成为 leader"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """该键当前是否有调用在执行"""
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在当前线程执行 fn，或等待同键的在途调用完成
+
+        注意不要在事件循环线程中等待由该循环上的任务发起的同键调用。
+        """
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def do_many(self, keys: Iterable[Hashable], fn: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict:
+        """
+        do 的批量版本：没有在途调用的键一次性交给 fn（接收键列表，返回 {key: value}）执行，
+        已有在途调用的键等待其结果。fn 的异常传给它负责的所有键的等待方，fn 没有返回的键抛出 KeyError。
+        :return: {key: value}，按传入顺序
+        """
+        futures, owned = {}, []
+        for key in dict.fromkeys(keys):
+            futures[key], leader = self._claim(key)
+            if leader:
+                owned.append(key)
+        if owned:
+            try:
+                results = fn(owned)
+            except BaseException as e:
+                for key in owned:
+                    self._finish(key, futures[key], error=e)
+                raise
+            for key in owned:
+                if key in results:
+                    self._finish(key, futures[key], results[key])
+                else:
+                    self._finish(key, futures[key], error=KeyError(key))
+        return {key: future.result() for key, future in futures.items()}
+
+    async def ado(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        do 的异步版本；fn 为协程函数时直接 await，否则放到线程池执行以免阻塞事件循环
+
+        调用在独立的任务中执行：leader 被取消时调用继续执行完，其他等待方（包括 do 中的线程）仍然拿到结果；
+        等待方被取消也不影响在途调用。
+        """
+        future, leader = self._claim(key)
+        if not leader:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        task = asyncio.ensure_future(self._arun(key, future, fn, *args, **kwargs))
+        # 持有任务的引用，并在没有人等待时取走异常，避免 "exception was never retrieved"
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return await asyncio.shield(task)
+
+    async def _arun(self, key: Hashable, future: Future, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        try:
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(*args, **kwargs)
+            else:
+                result = await asyncio.to_thread(fn, *args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled():
+            task.exception()